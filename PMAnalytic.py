@@ -0,0 +1,84 @@
+"""
+Closed-form solutions for drag-free 2D-projectile motion.
+
+Every function broadcasts over numpy arrays, so the same code serves a
+single ProjectileMotion run and a whole PMBatch. As in ProjectileMotion,
+g is the (negative) vertical acceleration and the ground is at y = 0.
+"""
+
+import numpy as np
+
+
+def flightTime(v0y, y0, g):
+    """time at which the projectile comes back down through y = 0
+    (NaN if it never gets there)"""
+    v0y = np.asarray(v0y, dtype=float)
+    y0 = np.asarray(y0, dtype=float)
+    g = np.abs(g)
+    disc = v0y*v0y + 2.0*g*y0
+    with np.errstate(invalid='ignore'):
+        return np.where(disc >= 0.0, (v0y + np.sqrt(disc)) / g, np.nan)
+
+
+def apex(v0y, y0, g):
+    """time and height of the highest point of the flight"""
+    v0y = np.asarray(v0y, dtype=float)
+    y0 = np.asarray(y0, dtype=float)
+    g = np.abs(g)
+    # launched level or downward means the apex is the launch point
+    rising = np.maximum(v0y, 0.0)
+    apexTime = rising / g
+    maxHeight = y0 + 0.5 * rising*rising / g
+    return apexTime, maxHeight
+
+
+def positions(t, x0, y0, v0x, v0y, g):
+    """(..., 2) array of positions at times t"""
+    x = x0 + v0x*t
+    y = y0 + v0y*t + 0.5*g*t*t
+    pos = np.empty(np.broadcast(x, y).shape + (2,))
+    pos[...,0] = x
+    pos[...,1] = y
+    return pos
+
+
+def velocities(t, v0x, v0y, g):
+    """(..., 2) array of velocities at times t"""
+    vy = v0y + g*t
+    v = np.empty(np.broadcast(v0x, vy).shape + (2,))
+    v[...,0] = v0x
+    v[...,1] = vy
+    return v
+
+
+def evolve(x0, y0, v0x, v0y, g, dt):
+    """exact counterpart of ProjectileMotion.evolve for one launch,
+    returning (t, pos, v, maxTime, maxRange, maxHeight)"""
+    maxTime = float(flightTime(v0y, y0, g))
+    maxRange = x0 + v0x*maxTime
+    maxHeight = float(apex(v0y, y0, g)[1])
+
+    t = np.arange(0, maxTime, dt)
+    pos = positions(t, x0, y0, v0x, v0y, g)
+    v = velocities(t, v0x, v0y, g)
+    return t, pos, v, maxTime, maxRange, maxHeight
+
+
+def evolveBatch(x0, y0, v0x, v0y, g, dt):
+    """exact counterpart of PMBatch.evolve for arrays of launches, returning
+    (t, pos, v, lengths, maxTime, maxRange, maxHeight) with NaN padding"""
+    maxTime = flightTime(v0y, y0, g)
+    maxRange = x0 + v0x*maxTime
+    maxHeight = apex(v0y, y0, g)[1]
+
+    # same number of samples np.arange(0, maxTime, dt) would give
+    lengths = np.where(np.isnan(maxTime), 0, np.ceil(np.nan_to_num(maxTime) / dt)).astype(int)
+    T = np.max(lengths) if len(lengths) > 0 else 0
+    t = np.arange(T) * dt
+
+    # NaN times past impact give the NaN padding for free
+    tt = np.where(np.arange(T)[None,:] < lengths[:,None], t[None,:], np.nan)
+    pos = positions(tt, x0[:,None], y0[:,None], v0x[:,None], v0y[:,None], g[:,None])
+    v = velocities(tt, v0x[:,None], v0y[:,None], g[:,None])
+    v[np.isnan(tt)] = np.nan
+    return t, pos, v, lengths, maxTime, maxRange, maxHeight
@@ -0,0 +1,317 @@
+"""
+Vectorized batch solver for many 2D-projectile launches at once.
+"""
+
+import numpy as np
+import scipy.integrate as integrate
+from collections import OrderedDict
+from ProjectileMotion import ProjectileMotion
+import PMAnalytic
+import PMCache
+import PMIntegrators
+
+
+class PMBatchResult:
+    """Per-trajectory summary values plus NaN-padded trajectory arrays"""
+
+    def __init__(self, t, pos, v, lengths, maxTime, maxRange, maxHeight):
+        # t is the common output grid, pos/v are (N, len(t), 2) and
+        # padded with NaN past each trajectory's ground impact
+        self.t = t
+        self.pos = pos
+        self.v = v
+        self.lengths = lengths
+        self.maxTime = maxTime
+        self.maxRange = maxRange
+        self.maxHeight = maxHeight
+
+
+    def __len__(self):
+        return len(self.lengths)
+
+
+    def trajectory(self, idx):
+        """Return the (t, pos, v) arrays of a single trajectory"""
+        n = self.lengths[idx]
+        return self.t[0:n], self.pos[idx,0:n,:], self.v[idx,0:n,:]
+
+
+    def ragged(self):
+        """Return lists of per-trajectory (t, pos, v) arrays"""
+        ts, poss, vs = [], [], []
+        for idx in range(len(self)):
+            t, pos, v = self.trajectory(idx)
+            ts.append(t)
+            poss.append(pos)
+            vs.append(v)
+        return ts, poss, vs
+
+
+class PMBatch:
+
+    # rk4, verlet and rk45 are the vectorized PMIntegrators on the dt grid
+    SOLVERS = ('odeint', 'analytic', 'rk4', 'verlet', 'rk45')
+
+    # number of output samples integrated per odeint call before the
+    # trajectories that have reached the ground are dropped
+    WINDOW_STEPS = 64
+
+    # give up on trajectories still airborne after this multiple
+    # of the longest drag-free flight time
+    MAX_TIME_FACTOR = 10.
+
+    def __init__(self):
+        pm = ProjectileMotion()
+        self.basicParams = OrderedDict((k, np.atleast_1d(float(v))) for k, v in pm.basicParams.items())
+        # make sure "g" < 0, as setValues does for a g it is passed
+        self.basicParams['g'] = -np.abs(self.basicParams['g'])
+        self.dragParams = dict((k, np.atleast_1d(float(v))) for k, v in pm.dragParams.items())
+        self.dt = pm.dt
+        # dtype of the padded pos/v arrays (np.float32 halves memory)
+        self.storageType = pm.storageType
+        # results memoized across instances (None disables caching)
+        self.cache = PMCache.defaultCache
+        self.state = np.zeros((0, 4))
+
+
+    def setValues(self, basicParams=None, dragParams=None):
+        """Set parameters from dicts of scalars or arrays (broadcast to N)"""
+        if basicParams is None:
+            basicParams = {}
+        if dragParams is None:
+            dragParams = {}
+
+        for field in basicParams:
+            if field not in self.basicParams:
+                raise KeyError("Unknown basic parameter: %s" % field)
+            value = np.atleast_1d(np.asarray(basicParams[field], dtype=float))
+            if (field == 'g'):
+                # make sure "g" < 0
+                self.basicParams[field] = -np.abs(value)
+            elif (field == 'x0' or field == 'y0'):
+                # Let "x0" or "y0" be whatever sign
+                self.basicParams[field] = value
+            else:
+                # Make sure other params are >= 0
+                self.basicParams[field] = np.abs(value)
+
+        for field in dragParams:
+            if field not in self.dragParams:
+                raise KeyError("Unknown drag parameter: %s" % field)
+            # Make sure params are >= 0
+            self.dragParams[field] = np.abs(np.atleast_1d(np.asarray(dragParams[field], dtype=float)))
+
+        # broadcast every parameter to a common length
+        keys = list(self.basicParams.keys()) + list(self.dragParams.keys())
+        values = np.broadcast_arrays(*([self.basicParams[k] for k in self.basicParams] + \
+                                       [self.dragParams[k] for k in self.dragParams]))
+        for key, value in zip(keys, values):
+            value = np.array(value, dtype=float).ravel()
+            if key in self.basicParams:
+                self.basicParams[key] = value
+            else:
+                self.dragParams[key] = value
+
+        # make sure theta between 0 and 180
+        theta = self.basicParams['theta']
+        if (np.any(theta < 0.) | np.any(theta > 180.)):
+            raise ValueError('Theta must be between 0 and 180 deg')
+
+        # define initial states, one row per trajectory
+        vels = self.getInitialVelocities()
+        self.state = np.column_stack([self.basicParams['x0'], vels[0], self.basicParams['y0'], vels[1]])
+
+
+    def getInitialVelocities(self):
+        """compute the initial x,y velocities of every projectile"""
+        v0x = self.basicParams['v0']*np.cos(self.basicParams['theta']*np.pi/180.)
+        v0y = self.basicParams['v0']*np.sin(self.basicParams['theta']*np.pi/180.)
+        return (v0x, v0y)
+
+
+    def getDragCoeffs(self, usingDragForce):
+        """drag prefactor (per unit mass of state derivative) for each trajectory"""
+        if (usingDragForce == 0):
+            return np.zeros(len(self.state))
+        area = 0.25 * np.pi * self.dragParams['diameter']
+        return 0.5 * self.dragParams['drag coefficient'] * self.dragParams['air density'] * area
+
+
+    def derivs(self, states, t, g, dragCoeffs):
+        """Vectorized ProjectileMotion.derivs for an (N,4) array of states"""
+        vx = states[:,1]
+        vy = states[:,3]
+
+        # same quadratic drag model as ProjectileMotion.derivs
+        beta = dragCoeffs * np.sqrt(vx*vx + vy*vy)
+
+        derivs = np.empty_like(states)
+        derivs[:,0] = vx
+        derivs[:,1] = -beta * vx
+        derivs[:,2] = vy
+        derivs[:,3] = g - beta * vy
+        return derivs
+
+
+    def integrateWindow(self, states, t, g, dragCoeffs, solver='odeint'):
+        """integrate the (n,4) states over t, returning an (n,len(t),4) array"""
+        if (solver != 'odeint'):
+            func = lambda tt, y, rows: self.derivs(y, tt, g[rows], dragCoeffs[rows])
+            options = {'rtol': ProjectileMotion.RTOL, 'atol': ProjectileMotion.ATOL} if solver == 'rk45' else {}
+            sol = PMIntegrators.GRID_SOLVERS[solver](func, states, t, **options)
+            return sol.transpose(1, 0, 2)
+
+        def flatDerivs(y, tt):
+            return self.derivs(y.reshape(-1, 4), tt, g, dragCoeffs).ravel()
+
+        # the flattened system is block diagonal with 4x4 blocks,
+        # so tell LSODA the Jacobian is banded in case it goes stiff
+        sol = integrate.odeint(flatDerivs, states.ravel(), t, ml=3, mu=3)
+        return sol.reshape(len(t), -1, 4).transpose(1, 0, 2)
+
+
+    def evolve(self, usingDragForce, solver=None, trajectories=True):
+        """Solve every trajectory with the chosen solver (by default the closed
+        form without drag and odeint with it); trajectories=False skips
+        building the padded pos/v arrays"""
+        if (solver is None):
+            solver = 'odeint' if usingDragForce else 'analytic'
+        if (solver not in self.SOLVERS):
+            raise ValueError("Unknown solver: %s" % solver)
+        if (usingDragForce and solver == 'analytic'):
+            raise ValueError("The analytic solver has no air resistance")
+        if (usingDragForce and solver == 'verlet'):
+            # symplectic only for velocity-independent forces
+            raise ValueError("The verlet solver is for drag-free runs only")
+
+        key = None
+        if (self.cache is not None):
+            key = PMCache.makeKey('PMBatch', self.basicParams, self.dragParams, self.dt, \
+                                  usingDragForce, solver, trajectories, np.dtype(self.storageType).str)
+            cached = self.cache.get(key)
+            if (cached is not None):
+                self.t, self.pos, self.v, self.lengths = cached.t, cached.pos, cached.v, cached.lengths
+                return cached
+
+        if (solver == 'analytic'):
+            result = self.evolveAnalytic(trajectories)
+        else:
+            result = self.integrate(usingDragForce, trajectories, solver)
+
+        if (key is not None):
+            self.cache.put(key, result)
+        return result
+
+
+    def evolveAnalytic(self, trajectories=True):
+        """Drag-free trajectories straight from the closed-form solution"""
+        x0, v0x, y0, v0y = self.state.T
+        g = self.basicParams['g']
+        if (trajectories):
+            self.t, self.pos, self.v, lengths, maxTime, maxRange, maxHeight = \
+                PMAnalytic.evolveBatch(x0, y0, v0x, v0y, g, self.dt)
+            self.pos = self.pos.astype(self.storageType, copy=False)
+            self.v = self.v.astype(self.storageType, copy=False)
+        else:
+            maxTime = PMAnalytic.flightTime(v0y, y0, g)
+            maxRange = x0 + v0x*maxTime
+            maxHeight = PMAnalytic.apex(v0y, y0, g)[1]
+            lengths = np.where(np.isnan(maxTime), 0, np.ceil(np.nan_to_num(maxTime) / self.dt)).astype(int)
+            self.t, self.pos, self.v = None, None, None
+        self.lengths = lengths
+        return PMBatchResult(self.t, self.pos, self.v, lengths, maxTime, maxRange, maxHeight)
+
+
+    def emptyResult(self, trajectories=True):
+        """the result of a batch without trajectories"""
+        self.lengths = np.zeros(0, dtype=int)
+        if (trajectories):
+            self.t = np.zeros(0)
+            self.pos = np.zeros((0, 0, 2), dtype=self.storageType)
+            self.v = np.zeros((0, 0, 2), dtype=self.storageType)
+        else:
+            self.t, self.pos, self.v = None, None, None
+        return PMBatchResult(self.t, self.pos, self.v, self.lengths, np.zeros(0), np.zeros(0), np.zeros(0))
+
+
+    def integrate(self, usingDragForce, trajectories=True, solver='odeint'):
+        """Integrate all trajectories together, dropping landed ones"""
+        N = len(self.state)
+        dt = self.dt
+        g = self.basicParams['g']
+        dragCoeffs = self.getDragCoeffs(usingDragForce)
+        if (N == 0):
+            return self.emptyResult(trajectories)
+
+        # the drag-free flight time bounds how long we keep integrating
+        vacuumTime = PMAnalytic.flightTime(self.state[:,3], self.state[:,2], g)
+        longest = np.max(np.nan_to_num(vacuumTime))
+        maxSteps = int(np.ceil(self.MAX_TIME_FACTOR * (longest + 1.) / dt))
+
+        lengths = np.full(N, -1, dtype=int)
+        maxTime = np.full(N, np.nan)
+        maxRange = np.full(N, np.nan)
+        # launched level or downward means the apex is the launch point
+        maxHeight = np.where(self.state[:,3] <= 0., self.state[:,2], np.nan)
+        windows = []
+
+        active = np.arange(N)
+        current = self.state.copy()
+        k0 = 0
+        while (len(active) > 0 and k0 < maxSteps):
+            k1 = k0 + self.WINDOW_STEPS
+            t = np.arange(k0, k1 + 1) * dt
+            window = self.integrateWindow(current, t, g[active], dragCoeffs[active], solver)
+            if (trajectories):
+                windows.append((active, k0, window[:,1:,:]))
+
+            # apex lies where vy first changes sign
+            falling = window[:,1:,3] <= 0.
+            rising = np.isnan(maxHeight[active]) & np.any(falling, axis=1)
+            j = 1 + np.argmax(falling[rising], axis=1)
+            before, after = window[rising,j-1,:], window[rising,j,:]
+            frac = before[:,3] / (before[:,3] - after[:,3])
+            maxHeight[active[rising]] = before[:,2] + frac*(after[:,2] - before[:,2])
+
+            # a projectile has landed once it is below ground on the way down
+            landed = (window[:,1:,2] < 0.) & (window[:,1:,3] < 0.)
+            hasLanded = np.any(landed, axis=1)
+            j = 1 + np.argmax(landed[hasLanded], axis=1)
+            lengths[active[hasLanded]] = k0 + j
+
+            # ground impact lies between samples j-1 and j
+            before, after = window[hasLanded,j-1,:], window[hasLanded,j,:]
+            frac = before[:,2] / (before[:,2] - after[:,2])
+            maxTime[active[hasLanded]] = (k0 + j - 1 + frac) * dt
+            maxRange[active[hasLanded]] = before[:,0] + frac*(after[:,0] - before[:,0])
+
+            # drop landed trajectories from further work
+            current = window[~hasLanded,-1,:]
+            active = active[~hasLanded]
+            k0 = k1
+
+        # anything still airborne gets the full integrated length
+        lengths[active] = k0 + 1
+        self.lengths = lengths
+
+        if (not trajectories):
+            self.t, self.pos, self.v = None, None, None
+            return PMBatchResult(None, None, None, lengths, maxTime, maxRange, maxHeight)
+
+        # assemble the padded trajectories, truncated at ground impact
+        # as ProjectileMotion.evolve does
+        T = np.max(lengths) if N > 0 else 0
+        states = np.full((N, T, 4), np.nan, dtype=self.storageType)
+        states[:,0,:] = self.state
+        for rows, k, window in windows:
+            n = min(window.shape[1], T - 1 - k)
+            if n > 0:
+                states[rows,k+1:k+1+n,:] = window[:,0:n,:]
+        pad = np.arange(T)[None,:] >= lengths[:,None]
+        states[pad] = np.nan
+
+        self.t = np.arange(T) * dt
+        self.pos = states[:,:,[0,2]]
+        self.v = states[:,:,[1,3]]
+
+        return PMBatchResult(self.t, self.pos, self.v, lengths, maxTime, maxRange, maxHeight)
@@ -0,0 +1,352 @@
+"""
+Benchmarks for the projectile motion solver.
+
+The suite times the solver, analysis and rendering hot paths over a
+dt x v0 x drag grid, saves the timings as JSON and compares them with a
+stored baseline, e.g.
+
+    python PMBenchmark.py -o baseline.json
+    (make a change)
+    python PMBenchmark.py --compare baseline.json
+
+--integrators instead reports each solver's error, energy drift and cost.
+"""
+
+import sys
+import json
+import time
+import platform
+import argparse
+import itertools
+from collections import OrderedDict
+import numpy as np
+import scipy
+import scipy.integrate as integrate
+import ProjectileMotion as pm
+
+# default sweep; a diameter of 0 means no air resistance
+SWEEP_DT = (0.01, 0.001)
+SWEEP_V0 = (10., 100.)
+SWEEP_DIAMETER = (0., 0.1, 1.0)
+
+# relative slow-down reported as a regression by --compare
+THRESHOLD = 0.10
+
+
+def makeProjectile(v0, theta, dragCoeff, diameter):
+    """ProjectileMotion set up as the GUI would"""
+    proj = pm.ProjectileMotion()
+    proj.setParams({'v0': v0, 'theta': theta}, \
+                   {'drag coefficient': dragCoeff, 'diameter': diameter})
+    return proj
+
+
+def bestTime(func, repeats):
+    """best wall time of func() over a few repeats"""
+    best = np.inf
+    for ii in range(repeats):
+        start = time.time()
+        func()
+        best = min(best, time.time() - start)
+    return best
+
+
+def timePerCall(func, repeats, minTime=0.02):
+    """best time per func() call, looping fast calls so that each
+    measurement lasts at least minTime"""
+    number = 1
+    while True:
+        elapsed = bestTime(lambda: [func() for ii in range(number)], 1)
+        if (elapsed >= minTime or number >= 10**6):
+            break
+        number *= 10
+    return bestTime(lambda: [func() for ii in range(number)], repeats) / number
+
+
+def evolvedProjectile(case):
+    """a projectile for one sweep case, already evolved (not cached)"""
+    dt, v0, diameter = case
+    proj = makeProjectile(v0, 45., 0.5, diameter)
+    proj.dt = dt
+    proj.cache = None
+    proj.evolve(int(diameter > 0))
+    return proj
+
+
+def benchDerivs(case, repeats):
+    proj = makeProjectile(case[1], 45., 0.5, case[2])
+    return timePerCall(lambda: proj.derivs(proj.state, 0.), repeats)
+
+
+def benchEvolve(case, repeats):
+    dt, v0, diameter = case
+    proj = makeProjectile(v0, 45., 0.5, diameter)
+    proj.dt = dt
+    proj.cache = None
+    return timePerCall(lambda: proj.evolve(int(diameter > 0)), repeats)
+
+
+def windowProjectile(case):
+    """projectile holding the whole legacy odeint window, as maxRange and
+    maxHeight see it inside integrateOverWindow"""
+    dt, v0, diameter = case
+    proj = makeProjectile(v0, 45., 0.5, diameter)
+    proj.dt = dt
+    proj.t = proj.getTimeVec()
+    states = integrate.odeint(proj.derivs, proj.state, proj.t)
+    proj.pos = states[:,[0,2]]
+    proj.v = states[:,[1,3]]
+    return proj
+
+
+def benchMaxRange(case, repeats):
+    proj = windowProjectile(case)
+    return timePerCall(proj.maxRange, repeats)
+
+
+def benchMaxHeight(case, repeats):
+    proj = windowProjectile(case)
+    return timePerCall(proj.maxHeight, repeats)
+
+
+def benchDerivedQuantities(case, repeats):
+    proj = evolvedProjectile(case)
+    def run():
+        proj.resetDerived()
+        proj.computeDerivedQuantities()
+    return timePerCall(run, repeats)
+
+
+def plotsFor(case):
+    # rendering is timed off screen
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from PMPlots import PMPlots
+    plt.close('all')
+    plots = PMPlots(evolvedProjectile(case), 'y_vs_x')
+    x, y = plots.prepare()
+    plots.fig.canvas.draw()
+    return plots, x, y
+
+
+def benchSetData(case, repeats):
+    plots, x, y = plotsFor(case)
+    frames = itertools.cycle(range(len(plots.pm.t)))
+    return timePerCall(lambda: plots.set_data(next(frames), x, y), repeats)
+
+
+def benchFrame(case, repeats):
+    """one runSimulation frame: set_data plus redrawing the blitted artists"""
+    plots, x, y = plotsFor(case)
+    canvas = plots.fig.canvas
+    background = canvas.copy_from_bbox(plots.ax.bbox)
+    frames = itertools.cycle(range(len(plots.pm.t)))
+    def frame():
+        canvas.restore_region(background)
+        for artist in plots.set_data(next(frames), x, y):
+            plots.ax.draw_artist(artist)
+        canvas.blit(plots.ax.bbox)
+    return timePerCall(frame, repeats)
+
+
+BENCHMARKS = OrderedDict([('derivs', benchDerivs), ('evolve', benchEvolve), \
+                          ('maxRange', benchMaxRange), ('maxHeight', benchMaxHeight), \
+                          ('computeDerivedQuantities', benchDerivedQuantities), \
+                          ('set_data', benchSetData), ('frame', benchFrame)])
+
+
+def runSuite(names=None, dts=SWEEP_DT, v0s=SWEEP_V0, diameters=SWEEP_DIAMETER, repeats=5, progress=None):
+    """time every benchmark over the dt x v0 x diameter sweep"""
+    results = []
+    for name in (names or BENCHMARKS):
+        for case in itertools.product(dts, v0s, diameters):
+            seconds = BENCHMARKS[name](case, repeats)
+            results.append({'bench': name, 'dt': case[0], 'v0': case[1], 'diameter': case[2], \
+                            'time': seconds})
+            if (progress is not None):
+                progress(results[-1])
+    return {'meta': {'python': platform.python_version(), 'numpy': np.__version__, \
+                     'scipy': scipy.__version__, 'machine': platform.machine(), \
+                     'platform': platform.platform(), 'repeats': repeats, \
+                     'date': time.strftime('%Y-%m-%d %H:%M:%S')}, \
+            'results': results}
+
+
+def caseKey(res):
+    return (res['bench'], res['dt'], res['v0'], res['diameter'])
+
+
+def compareResults(baseline, current, threshold=THRESHOLD):
+    """match timings by benchmark and case; each entry gets the ratio
+    current/baseline and a verdict"""
+    old = dict((caseKey(res), res['time']) for res in baseline['results'])
+    rows = []
+    for res in current['results']:
+        key = caseKey(res)
+        if key not in old:
+            continue
+        ratio = res['time'] / old[key] if old[key] > 0 else np.inf
+        if (ratio > 1. + threshold):
+            verdict = 'REGRESSION'
+        elif (ratio < 1. - threshold):
+            verdict = 'faster'
+        else:
+            verdict = ''
+        rows.append(dict(res, baseline=old[key], ratio=ratio, verdict=verdict))
+    return rows
+
+
+def printResult(res):
+    print("%-26s %8g %8g %8g %12.3f" % (res['bench'], res['dt'], res['v0'], res['diameter'], 1e6*res['time']))
+
+
+def printComparison(rows):
+    print("%-26s %8s %8s %8s %12s %12s %7s" % ('benchmark', 'dt', 'v0', 'diameter', 'base (us)', 'now (us)', 'ratio'))
+    for row in rows:
+        print("%-26s %8g %8g %8g %12.3f %12.3f %7.2f %s" % (row['bench'], row['dt'], row['v0'], row['diameter'], \
+                                                           1e6*row['baseline'], 1e6*row['time'], row['ratio'], \
+                                                           row['verdict']))
+
+
+def benchForceModels(repeats=5, cases=None):
+    """RHS/Jacobian evaluation counts and wall time of odeint driven by
+    the legacy derivs versus the PMForces models"""
+    if cases is None:
+        cases = [(10., 45., 0.5, 0.01), (50., 45., 0.5, 0.1), (200., 60., 1.0, 0.5), \
+                 (500., 30., 1.0, 50.)]
+
+    results = []
+    for v0, theta, dragCoeff, diameter in cases:
+        proj = makeProjectile(v0, theta, dragCoeff, diameter)
+        t = proj.getTimeVec()
+        model = proj.getForceModel()
+        variants = [('derivs', proj.derivs, None), \
+                    ('model', model.derivs, None), \
+                    ('model+jac', model.derivs, model.jacobian)]
+
+        for name, func, jac in variants:
+            run = lambda: integrate.odeint(func, proj.state, t, Dfun=jac, full_output=True)
+            info = run()[1]
+            results.append({'case': (v0, theta, dragCoeff, diameter), 'variant': name, \
+                            'nfe': int(info['nfe'][-1]), 'nje': int(info['nje'][-1]), \
+                            'time': bestTime(run, repeats)})
+    return results
+
+
+def printForceModels(results):
+    print("%-26s %-10s %8s %8s %10s" % ('case (v0,theta,Cd,D)', 'variant', 'nfe', 'nje', 'time (ms)'))
+    for res in results:
+        print("%-26s %-10s %8d %8d %10.3f" % (str(res['case']), res['variant'], \
+                                               res['nfe'], res['nje'], 1e3*res['time']))
+
+
+# solvers compared by --integrators ('analytic' and 'verlet' only run without drag)
+INTEGRATORS = ('odeint', 'events', 'rk4', 'verlet', 'rk45', 'analytic')
+
+# tolerances of the reference solution the integrators are measured against
+REFERENCE_TOL = 1e-12
+
+
+def benchIntegrators(repeats=5, cases=None, dts=SWEEP_DT, solvers=INTEGRATORS, backend='numpy'):
+    """error against a tight-tolerance odeint reference, energy drift,
+    RHS evaluations and wall time of evolve for each solver (rk4 and rk45
+    on the given backend)"""
+    if cases is None:
+        cases = [(30., 45., 0.5, 0.), (30., 45., 0.5, 0.1), (100., 60., 1.0, 0.5)]
+
+    results = []
+    for (v0, theta, dragCoeff, diameter), dt in itertools.product(cases, dts):
+        usingDragForce = int(diameter > 0)
+        for solver in solvers:
+            if (usingDragForce and solver in ('analytic', 'verlet')):
+                continue
+            proj = makeProjectile(v0, theta, dragCoeff, diameter)
+            proj.dt = dt
+            proj.cache = None
+            proj.instrument = True
+            proj.evolve(usingDragForce, solver, backend)
+            counters = proj.stats.counters
+
+            model = proj.getForceModel(usingDragForce)
+            ref = integrate.odeint(model.derivs, proj.state, proj.t, Dfun=model.jacobian, \
+                                   rtol=REFERENCE_TOL, atol=REFERENCE_TOL)
+            mass = proj.basicParams['mass']
+            refE = 0.5 * mass * (ref[:,1]**2 + ref[:,3]**2) + mass * np.abs(proj.basicParams['g']) * ref[:,2]
+            # relative to the launch energy; without drag K + U should not change at all
+            drift = np.max(np.abs(proj.K + proj.U - refE)) / max(abs(refE[0]), 1e-300)
+            error = np.max(np.hypot(proj.pos[:,0] - ref[:,0], proj.pos[:,1] - ref[:,2]))
+
+            results.append({'case': (v0, theta, dragCoeff, diameter), 'dt': dt, 'solver': solver, \
+                            'error': error, 'drift': drift, \
+                            'nfe': counters.get('rhs evaluations', 0), \
+                            'steps': counters.get('solver steps', 0), \
+                            'time': timePerCall(lambda: proj.evolve(usingDragForce, solver, backend), repeats)})
+    return results
+
+
+def cheapestSolvers(results, tolerance):
+    """(case, dt) -> fastest solver whose position error is within tolerance (m)"""
+    best = OrderedDict()
+    for res in results:
+        key = (res['case'], res['dt'])
+        best.setdefault(key, None)
+        if (res['error'] <= tolerance and (best[key] is None or res['time'] < best[key]['time'])):
+            best[key] = res
+    return best
+
+
+def printIntegrators(results, tolerance=None):
+    print("%-26s %7s %-9s %11s %11s %8s %7s %10s" % ('case (v0,theta,Cd,D)', 'dt', 'solver', 'error (m)', \
+                                                     'E drift', 'nfe', 'steps', 'time (ms)'))
+    for res in results:
+        print("%-26s %7g %-9s %11.3e %11.3e %8d %7d %10.3f" % (str(res['case']), res['dt'], res['solver'], \
+                                                             res['error'], res['drift'], res['nfe'], \
+                                                             res['steps'], 1e3*res['time']))
+    if (tolerance is not None):
+        print("")
+        print("cheapest solver within %g m:" % tolerance)
+        for (case, dt), res in cheapestSolvers(results, tolerance).items():
+            print("%-26s %7g %s" % (str(case), dt, res['solver'] if res is not None else 'none'))
+
+
+### MAIN EXECUTABLE ###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Projectile motion benchmarks")
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--bench', action='append', choices=list(BENCHMARKS), help="run only these (repeatable)")
+    parser.add_argument('--dt', type=float, nargs='+', default=SWEEP_DT)
+    parser.add_argument('--v0', type=float, nargs='+', default=SWEEP_V0)
+    parser.add_argument('--diameter', type=float, nargs='+', default=SWEEP_DIAMETER, \
+                        help="drag strength; 0 runs without air resistance")
+    parser.add_argument('-o', '--output', help="save the timings as JSON")
+    parser.add_argument('--compare', metavar='BASELINE', help="flag regressions against a saved JSON run")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help="relative slow-down that counts as a regression")
+    parser.add_argument('--force-models', action='store_true', help="compare odeint with the PMForces models instead")
+    parser.add_argument('--integrators', action='store_true', \
+                        help="compare the accuracy and cost of the solvers instead")
+    parser.add_argument('--tolerance', type=float, default=1e-6, \
+                        help="position error (m) the cheapest solver must meet (with --integrators)")
+    parser.add_argument('--backend', choices=pm.ProjectileMotion.BACKENDS, default='numpy', \
+                        help="run rk4 and rk45 on this backend (with --integrators)")
+    args = parser.parse_args()
+
+    if (args.force_models):
+        printForceModels(benchForceModels(args.repeats))
+        sys.exit(0)
+    if (args.integrators):
+        printIntegrators(benchIntegrators(args.repeats, dts=args.dt, backend=args.backend), args.tolerance)
+        sys.exit(0)
+
+    if (not args.compare):
+        print("%-26s %8s %8s %8s %12s" % ('benchmark', 'dt', 'v0', 'diameter', 'time (us)'))
+    current = runSuite(args.bench, args.dt, args.v0, args.diameter, args.repeats, \
+                       progress=None if args.compare else printResult)
+    if (args.output):
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=1)
+    if (args.compare):
+        with open(args.compare) as f:
+            rows = compareResults(json.load(f), current, args.threshold)
+        printComparison(rows)
+        sys.exit(1 if any(row['verdict'] == 'REGRESSION' for row in rows) else 0)
@@ -0,0 +1,272 @@
+"""
+Memoization cache for simulation results.
+
+Results are keyed on a canonical hash of the parameters that produced
+them. An in-memory LRU tier is always present; an optional on-disk tier
+keeps results between sessions and is trimmed to a size budget, oldest
+first. Cached arrays are stored read-only so that a hit can hand them
+out without copying.
+"""
+
+import os
+import copy
+import hashlib
+import numbers
+import tempfile
+import threading
+import numpy as np
+from collections import OrderedDict
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+
+SCALAR_TYPES = (float, int, bool, np.float64, np.float32, np.int64, np.int32)
+
+
+def canonical(obj, out):
+    """append a canonical text encoding of obj to the list out"""
+    if isinstance(obj, SCALAR_TYPES) or isinstance(obj, numbers.Number):
+        # 10, 10.0 and np.float64(10) describe the same run
+        out.append('n' + repr(float(obj)))
+    elif isinstance(obj, np.ndarray):
+        digest = hashlib.sha1(np.ascontiguousarray(obj).tobytes()).hexdigest()
+        out.append('a%s%s%s' % (obj.dtype.str, obj.shape, digest))
+    elif isinstance(obj, dict):
+        out.append('d%d' % len(obj))
+        for key in sorted(obj):
+            canonical(key, out)
+            canonical(obj[key], out)
+    elif isinstance(obj, (list, tuple)):
+        out.append('l%d' % len(obj))
+        for item in obj:
+            canonical(item, out)
+    elif obj is None:
+        out.append('z')
+    else:
+        out.append('s' + str(obj))
+
+
+def makeKey(*parts):
+    """canonical hex digest of the given parameters"""
+    out = []
+    for part in parts:
+        canonical(part, out)
+    return hashlib.sha1('|'.join(out).encode('utf-8')).hexdigest()
+
+
+def sizeOf(obj):
+    """approximate bytes held by the arrays inside obj"""
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    elif isinstance(obj, dict):
+        return sum(sizeOf(v) for v in obj.values())
+    elif isinstance(obj, (list, tuple)):
+        return sum(sizeOf(v) for v in obj)
+    elif hasattr(obj, '__dict__'):
+        return sizeOf(obj.__dict__)
+    return 0
+
+
+def freeze(obj):
+    """make every array inside obj read-only (in place)"""
+    if isinstance(obj, np.ndarray):
+        obj.flags.writeable = False
+    elif isinstance(obj, dict):
+        for v in obj.values():
+            freeze(v)
+    elif isinstance(obj, (list, tuple)):
+        for v in obj:
+            freeze(v)
+    elif hasattr(obj, '__dict__'):
+        freeze(obj.__dict__)
+    return obj
+
+
+def frozenCopy(obj):
+    """copy of obj whose arrays are read-only copies; obj itself is untouched"""
+    if isinstance(obj, np.ndarray):
+        copied = obj.copy()
+        copied.flags.writeable = False
+        return copied
+    elif isinstance(obj, dict):
+        return obj.__class__((k, frozenCopy(v)) for k, v in obj.items())
+    elif isinstance(obj, list):
+        return [frozenCopy(v) for v in obj]
+    elif isinstance(obj, tuple):
+        values = [frozenCopy(v) for v in obj]
+        return obj._make(values) if hasattr(obj, '_make') else tuple(values)
+    elif hasattr(obj, '__dict__'):
+        copied = copy.copy(obj)
+        copied.__dict__ = frozenCopy(obj.__dict__)
+        return copied
+    return obj
+
+
+class PMCache:
+
+    def __init__(self, maxEntries=64, maxBytes=256*2**20, cacheDir=None, maxDiskBytes=1024*2**20):
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.cacheDir = cacheDir
+        self.maxDiskBytes = maxDiskBytes
+        self.entries = OrderedDict()
+        self.sizes = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.diskHits = 0
+        self.misses = 0
+        # the GUI worker thread and the Tk thread share defaultCache
+        self.lock = threading.RLock()
+        if (cacheDir is not None and not os.path.isdir(cacheDir)):
+            os.makedirs(cacheDir)
+
+
+    def get(self, key):
+        """cached value for key, or None on a miss"""
+        with self.lock:
+            return self.lookup(key)
+
+
+    def lookup(self, key):
+        if key in self.entries:
+            # move to the most recently used end
+            value = self.entries.pop(key)
+            self.entries[key] = value
+            self.hits += 1
+            return value
+
+        value = self.loadFromDisk(key)
+        if value is not None:
+            self.diskHits += 1
+            self.hits += 1
+            self.store(key, value)
+            return value
+
+        self.misses += 1
+        return None
+
+
+    def put(self, key, value):
+        """store a read-only copy of value in every tier, so the caller
+        keeps its own arrays writable"""
+        value = frozenCopy(value)
+        with self.lock:
+            self.store(key, value)
+            self.saveToDisk(key, value)
+
+
+    def store(self, key, value):
+        """add to the memory tier, evicting least recently used entries"""
+        if key in self.entries:
+            self.nbytes -= self.sizes.pop(key)
+            del self.entries[key]
+        size = sizeOf(value)
+        if (size > self.maxBytes):
+            return
+        self.entries[key] = value
+        self.sizes[key] = size
+        self.nbytes += size
+
+        while (len(self.entries) > self.maxEntries or self.nbytes > self.maxBytes):
+            oldKey, oldValue = self.entries.popitem(last=False)
+            self.nbytes -= self.sizes.pop(oldKey)
+
+
+    def diskPath(self, key):
+        return os.path.join(self.cacheDir, key + '.pkl')
+
+
+    def loadFromDisk(self, key):
+        if (self.cacheDir is None):
+            return None
+        path = self.diskPath(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        # mark as recently used for the size-based eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return freeze(value)
+
+
+    def saveToDisk(self, key, value):
+        if (self.cacheDir is None):
+            return
+        # write to a temporary file first so readers never see half a pickle
+        fd, tmpPath = tempfile.mkstemp(dir=self.cacheDir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        path = self.diskPath(key)
+        try:
+            os.rename(tmpPath, path)
+        except OSError:
+            # Windows will not rename onto an existing file, e.g. when
+            # another process stored the same key first
+            try:
+                os.remove(path)
+                os.rename(tmpPath, path)
+            except OSError:
+                os.remove(tmpPath)
+        self.trimDisk()
+
+
+    def trimDisk(self):
+        """delete the least recently used files until under maxDiskBytes"""
+        with self.lock:
+            self.trimFiles()
+
+
+    def trimFiles(self):
+        files = []
+        total = 0
+        for name in os.listdir(self.cacheDir):
+            if not name.endswith('.pkl'):
+                continue
+            path = os.path.join(self.cacheDir, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            files.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+
+        files.sort()
+        for mtime, size, path in files:
+            if (total <= self.maxDiskBytes):
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+    def clear(self, disk=False):
+        """empty the memory tier (and the disk tier if asked)"""
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.nbytes = 0
+            if (disk and self.cacheDir is not None):
+                for name in os.listdir(self.cacheDir):
+                    if name.endswith('.pkl'):
+                        os.remove(os.path.join(self.cacheDir, name))
+
+
+    def stats(self):
+        """hit/miss counters and current memory usage"""
+        lookups = self.hits + self.misses
+        return {'hits': self.hits, 'diskHits': self.diskHits, 'misses': self.misses, \
+                'hitRate': self.hits / float(lookups) if lookups > 0 else 0., \
+                'entries': len(self.entries), 'bytes': self.nbytes}
+
+
+# shared by every ProjectileMotion/PMBatch unless they are given their own
+defaultCache = PMCache()
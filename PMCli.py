@@ -0,0 +1,209 @@
+"""
+Streaming command line solver.
+
+Parameter sets are read as CSV (with a header row) or JSON lines from a
+file or stdin, solved a chunk at a time with PMBatch, and written out
+one result line per input line, in input order. Memory is bounded by
+the chunk size, and neither Tk nor matplotlib is imported, e.g.
+
+    python PMCli.py --drag < scenarios.csv > results.csv
+"""
+
+import sys
+import csv
+import json
+import errno
+import argparse
+import itertools
+import numpy as np
+from collections import OrderedDict
+from PMBatch import PMBatch
+from ProjectileMotion import ProjectileMotion
+
+
+BASIC_FIELDS = ('mass', 'g', 'v0', 'theta', 'x0', 'y0')
+DRAG_FIELDS = ('drag coefficient', 'diameter', 'air density')
+
+# other spellings accepted for column names
+ALIASES = {'dragCoefficient': 'drag coefficient', 'drag_coefficient': 'drag coefficient', \
+           'airDensity': 'air density', 'air_density': 'air density', \
+           'drag': 'usingDragForce', 'using_drag_force': 'usingDragForce'}
+
+RESULT_FIELDS = ('maxTime', 'maxRange', 'maxHeight')
+
+
+def readRows(stream, fmt):
+    """yield (line number, dict of strings/values) for every input record;
+    a line that is not a JSON object comes through as the ValueError
+    raised for it, so that run can report it and go on"""
+    if (fmt == 'csv'):
+        reader = csv.reader(stream)
+        header = next(reader)
+        for row in reader:
+            if row:
+                yield reader.line_num, OrderedDict(zip(header, row))
+    else:
+        for lineNo, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line, object_pairs_hook=OrderedDict)
+            except ValueError as err:
+                row = ValueError("invalid JSON: %s" % err)
+            if not isinstance(row, (dict, ValueError)):
+                row = ValueError("not a JSON object")
+            yield lineNo, row
+
+
+def detectFormat(path, stream):
+    """input format from the file name, or from the first line of stdin;
+    returns the format and a stream that still starts at that line"""
+    if path is not None and path.lower().endswith(('.jsonl', '.json')):
+        return 'jsonl', stream
+    if path is not None and path.lower().endswith('.csv'):
+        return 'csv', stream
+    first = stream.readline()
+    fmt = 'jsonl' if first.lstrip().startswith('{') else 'csv'
+    return fmt, itertools.chain([first], stream)
+
+
+class PMCli:
+
+    # parameter sets solved per PMBatch call
+    CHUNK = 1000
+
+    def __init__(self, usingDragForce=0, chunkSize=None, defaults=None):
+        self.usingDragForce = usingDragForce
+        self.chunkSize = chunkSize if chunkSize is not None else self.CHUNK
+        # validates each row exactly as the GUI does
+        self.checker = ProjectileMotion()
+        self.defaults = dict(self.checker.basicParams)
+        self.defaults.update(self.checker.dragParams)
+        self.defaults.update(defaults or {})
+        self.errors = 0
+
+
+    def parseRow(self, row):
+        """(basicParams, dragParams, usingDragForce) for one record; raises
+        ValueError/KeyError for bad input"""
+        values = dict(self.defaults)
+        usingDragForce = self.usingDragForce
+        for name, value in row.items():
+            name = ALIASES.get(name, name)
+            if value in (None, ''):
+                # blank cells take the default
+                continue
+            if (name == 'usingDragForce'):
+                usingDragForce = int(ProjectileMotion.toNumber(name, value) != 0)
+            elif name in values:
+                values[name] = value
+        self.checker.setParams(dict((k, values[k]) for k in BASIC_FIELDS), \
+                               dict((k, values[k]) for k in DRAG_FIELDS))
+        return dict(self.checker.basicParams), dict(self.checker.dragParams), usingDragForce
+
+
+    def solveChunk(self, parsed):
+        """(maxTime, maxRange, maxHeight) per parsed row, None for bad rows"""
+        results = [None] * len(parsed)
+        for flag in (0, 1):
+            rows = [k for k, p in enumerate(parsed) if p is not None and p[2] == flag]
+            if (len(rows) == 0):
+                continue
+            batch = PMBatch()
+            # every scenario is new, so caching would only grow memory
+            batch.cache = None
+            batch.setValues(dict((k, [parsed[r][0][k] for r in rows]) for k in BASIC_FIELDS), \
+                            dict((k, [parsed[r][1][k] for r in rows]) for k in DRAG_FIELDS))
+            res = batch.evolve(flag, trajectories=False)
+            for j, r in enumerate(rows):
+                results[r] = (res.maxTime[j], res.maxRange[j], res.maxHeight[j])
+        return results
+
+
+    def run(self, records, writeRow):
+        """solve (line number, record) pairs chunk by chunk, passing each
+        record, its results (or None) and any error message to writeRow"""
+        records = iter(records)
+        while True:
+            chunk = list(itertools.islice(records, self.chunkSize))
+            if (len(chunk) == 0):
+                break
+            parsed, messages = [], []
+            for lineNo, row in chunk:
+                try:
+                    if isinstance(row, ValueError):
+                        raise row
+                    parsed.append(self.parseRow(row))
+                    messages.append(None)
+                except (KeyError, ValueError) as err:
+                    parsed.append(None)
+                    messages.append("line %d: %s" % (lineNo, err))
+                    self.errors += 1
+            for (lineNo, row), result, message in zip(chunk, self.solveChunk(parsed), messages):
+                writeRow(OrderedDict() if isinstance(row, ValueError) else row, result, message)
+
+
+class RowWriter:
+    """writes records with their results as CSV or JSON lines"""
+
+    def __init__(self, stream, fmt, errors=sys.stderr):
+        self.stream = stream
+        self.fmt = fmt
+        self.errors = errors
+        self.writer = None
+
+
+    def __call__(self, row, result, message):
+        out = OrderedDict(row)
+        for name, value in zip(RESULT_FIELDS, result or (None,) * 3):
+            # JSON has no NaN, and CSV leaves missing values empty
+            out[name] = None if value is None or np.isnan(value) else float(value)
+        out['error'] = message
+        if (message is not None):
+            self.errors.write(message + '\n')
+
+        if (self.fmt == 'jsonl'):
+            self.stream.write(json.dumps(out) + '\n')
+        else:
+            if (self.writer is None and len(row) == 0):
+                # an unreadable line cannot set the CSV header; stderr has it
+                return
+            if (self.writer is None):
+                fields = [k for k in row if k not in RESULT_FIELDS + ('error',)]
+                self.writer = csv.DictWriter(self.stream, fields + list(RESULT_FIELDS) + ['error'], \
+                                             extrasaction='ignore', lineterminator='\n')
+                self.writer.writeheader()
+            self.writer.writerow(dict((k, '' if v is None else v) for k, v in out.items()))
+
+
+### MAIN EXECUTABLE ###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve projectile launches streamed as CSV or JSON lines")
+    parser.add_argument('input', nargs='?', help="input file (default stdin)")
+    parser.add_argument('-o', '--output', help="output file (default stdout)")
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help="input format (default from the name or content)")
+    parser.add_argument('--output-format', choices=('csv', 'jsonl'), help="output format (default the input format)")
+    parser.add_argument('--drag', action='store_true', help="include air resistance unless a row says otherwise")
+    parser.add_argument('--chunk', type=int, default=PMCli.CHUNK, help="rows solved per batch")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', \
+                        help="default for a parameter missing from the input")
+    args = parser.parse_args()
+
+    defaults = {}
+    for item in args.set:
+        name, value = item.split('=', 1)
+        defaults[ALIASES.get(name, name)] = value
+
+    inStream = open(args.input) if args.input else sys.stdin
+    outStream = open(args.output, 'w') if args.output else sys.stdout
+    fmt, lines = (args.format, inStream) if args.format else detectFormat(args.input, inStream)
+    cli = PMCli(int(args.drag), args.chunk, defaults)
+    writer = RowWriter(outStream, args.output_format or fmt)
+    try:
+        cli.run(readRows(lines, fmt), writer)
+        outStream.flush()
+    except IOError as err:
+        # the reader went away (e.g. piped into head)
+        if (err.errno != errno.EPIPE):
+            raise
+    sys.exit(1 if cli.errors > 0 else 0)
@@ -0,0 +1,41 @@
+"""
+Tolerance-driven thinning of sampled trajectories.
+
+Samples are dropped wherever linear interpolation in time between the
+kept neighbours reproduces the position within a geometric tolerance.
+This is Douglas-Peucker with the synchronized (time-matched) distance,
+so the kept samples cluster where the path bends or the speed changes,
+and long nearly straight stretches collapse to a few points.
+"""
+
+import numpy as np
+
+
+def keepIndices(t, pos, tol):
+    """sorted indices of the samples to keep so that linear interpolation
+    in t reproduces every (N,2) position within tol"""
+    n = len(t)
+    if (n <= 2):
+        return np.arange(n)
+    t = np.asarray(t, dtype=float)
+    pos = np.asarray(pos, dtype=float)
+    tol2 = float(tol)**2
+
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    # explicit stack rather than recursion: long flights have many levels
+    stack = [(0, n-1)]
+    while (len(stack) > 0):
+        i, j = stack.pop()
+        if (j - i < 2):
+            continue
+        frac = ((t[i+1:j] - t[i]) / (t[j] - t[i]))[:,None]
+        err = np.sum(np.square(pos[i+1:j] - (pos[i] + frac*(pos[j] - pos[i]))), axis=1)
+        k = np.argmax(err)
+        if (err[k] > tol2):
+            k += i + 1
+            keep[k] = True
+            stack.append((i, k))
+            stack.append((k, j))
+    return np.nonzero(keep)[0]
+
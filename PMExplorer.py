@@ -0,0 +1,187 @@
+"""
+Live parameter explorer: sliders for v0, theta and the drag parameters
+re-solve and redraw an embedded trajectory plot while they move.
+
+While a slider is dragged, previews are throttled to the frame rate,
+solved on a coarse output grid (revisited slider values come straight
+from the result cache) and only the trajectory is blitted onto a saved
+background. Once the sliders rest for REFINE_DELAY ms, or the mouse is
+released, a full-accuracy solve replaces the preview and the axes are
+refitted.
+"""
+
+import time
+import Tkinter as tk
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+import ProjectileMotion as pm
+
+
+class PMExplorer:
+
+    # (parameter, low, high, resolution) for each slider
+    BASIC_SLIDERS = [('v0', 1., 200., 0.5), ('theta', 1., 89., 0.5)]
+    DRAG_SLIDERS = [('drag coefficient', 0., 2., 0.01), ('diameter', 0., 1., 0.005), \
+                    ('air density', 0., 2., 0.005)]
+
+    # at most one preview per frame (30 per second)
+    FRAME_MS = 33
+    # quiet time before the full-accuracy solve
+    REFINE_DELAY = 200
+    # output grid of previews; odeint's own steps do not depend on it
+    PREVIEW_DT = 0.05
+    # head room when a preview outgrows the axes, so that growing
+    # (a full redraw) does not happen every frame
+    GROW = 1.3
+    SCALE_FACTOR = 1.05
+
+    def __init__(self, master):
+        self.master = master
+        master.title("Projectile Motion Explorer")
+        self.pm = pm.ProjectileMotion()
+        self.fineDt = self.pm.dt
+
+        self.fig = Figure(figsize=(7, 4.5))
+        self.ax = self.fig.add_subplot(111)
+        self.ax.set_xlabel("Horizontal position (m)")
+        self.ax.set_ylabel("Vertical position (m)")
+        self.ax.grid(True)
+        # animated artists are left out of full draws and blitted on top
+        self.line, = self.ax.plot([], [], 'k-', animated=True)
+        self.impact, = self.ax.plot([], [], 'ro', animated=True)
+        self.canvas = FigureCanvasTkAgg(self.fig, master=master)
+        self.canvas.get_tk_widget().pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+        self.canvas.mpl_connect('draw_event', self.onDraw)
+        self.background = None
+
+        self.results = tk.Label(master, text="", anchor='w', font=("Courier", 12))
+        self.results.pack(side=tk.TOP, fill=tk.X, padx=5)
+
+        self.previewJob = None
+        self.refineJob = None
+        self.lastPreview = 0.
+        self.scales = {}
+        for name, low, high, step in self.BASIC_SLIDERS + self.DRAG_SLIDERS:
+            self.scales[name] = self.addSlider(name, low, high, step)
+            self.scales[name].set(self.pm.basicParams[name] if name in self.pm.basicParams \
+                                  else self.pm.dragParams[name])
+        self.dragVar = tk.IntVar()
+        cb = tk.Checkbutton(master, text="Include air resistance", variable=self.dragVar, command=self.refine)
+        cb.pack(side=tk.TOP, anchor=tk.W)
+        self.refine()
+
+
+    def addSlider(self, name, low, high, step):
+        scale = tk.Scale(self.master, label="%s %s" % (name, self.units(name)), from_=low, to=high, \
+                         resolution=step, orient=tk.HORIZONTAL, command=self.onSlide)
+        scale.pack(side=tk.TOP, fill=tk.X, padx=5)
+        scale.bind('<ButtonRelease-1>', lambda event: self.refine())
+        return scale
+
+
+    def units(self, name):
+        if name in self.pm.basicParamsUnits:
+            return self.pm.basicParamsUnits[name]
+        return self.pm.dragParamsUnits[name]
+
+
+    def onSlide(self, value=None):
+        """throttle previews to the frame rate and push the full solve back"""
+        if (self.previewJob is None):
+            wait = max(0, int(self.FRAME_MS - 1e3*(time.time() - self.lastPreview)))
+            self.previewJob = self.master.after(wait, self.preview)
+        if (self.refineJob is not None):
+            self.master.after_cancel(self.refineJob)
+        self.refineJob = self.master.after(self.REFINE_DELAY, self.refine)
+
+
+    def preview(self):
+        self.previewJob = None
+        self.lastPreview = time.time()
+        self.update(accurate=False)
+
+
+    def refine(self):
+        if (self.refineJob is not None):
+            self.master.after_cancel(self.refineJob)
+            self.refineJob = None
+        self.update(accurate=True)
+
+
+    def solve(self, accurate):
+        """evolve with the slider values: a coarse grid while previewing,
+        the event-driven solver and the normal dt once settled"""
+        basic = dict((name, self.scales[name].get()) for name, low, high, step in self.BASIC_SLIDERS)
+        drag = dict((name, self.scales[name].get()) for name, low, high, step in self.DRAG_SLIDERS)
+        self.pm.setParams(basic, drag)
+        self.pm.dt = self.fineDt if accurate else self.PREVIEW_DT
+        usingDragForce = self.dragVar.get()
+        solver = 'events' if (accurate and usingDragForce) else None
+        return self.pm.evolve(usingDragForce, solver)
+
+
+    def update(self, accurate):
+        start = time.time()
+        try:
+            maxTime, maxRange, maxHeight = self.solve(accurate)
+        except (RuntimeError, ValueError) as err:
+            self.results.config(text=str(err))
+            return
+        solveTime = time.time() - start
+
+        x = np.append(self.pm.pos[:,0], maxRange)
+        y = np.append(self.pm.pos[:,1], 0.)
+        self.line.set_data(x, y)
+        self.impact.set_data([maxRange], [0.])
+        self.results.config(text="range %8.3f (m)  height %8.3f (m)  time %7.3f (s)  %s %.1f ms" % \
+                            (maxRange, maxHeight, maxTime, 'solve' if accurate else 'preview', 1e3*solveTime))
+
+        if (accurate):
+            self.fitLimits(x, y, 1.)
+        elif (not self.fits(x, y)):
+            self.fitLimits(x, y, self.GROW)
+        else:
+            self.blit()
+
+
+    def fits(self, x, y):
+        xlim = self.ax.get_xlim()
+        ylim = self.ax.get_ylim()
+        return (np.min(x) >= xlim[0] and np.max(x) <= xlim[1] and \
+                np.min(y) >= ylim[0] and np.max(y) <= ylim[1])
+
+
+    def fitLimits(self, x, y, grow):
+        """new limits need a full redraw, which also refreshes the background"""
+        pad = self.SCALE_FACTOR * grow
+        self.ax.set_xlim(min(0., np.min(x)), pad*max(np.max(x), 1e-3))
+        self.ax.set_ylim(min(0., np.min(y)), pad*max(np.max(y), 1e-3))
+        self.canvas.draw()
+
+
+    def onDraw(self, event):
+        self.background = self.canvas.copy_from_bbox(self.ax.bbox)
+        self.drawArtists()
+
+
+    def blit(self):
+        if (self.background is None):
+            self.canvas.draw_idle()
+            return
+        self.canvas.restore_region(self.background)
+        self.drawArtists()
+
+
+    def drawArtists(self):
+        self.ax.draw_artist(self.line)
+        self.ax.draw_artist(self.impact)
+        self.canvas.blit(self.ax.bbox)
+
+
+
+### MAIN EXECUTABLE ###
+if __name__ == "__main__":
+    root = tk.Tk()
+    explorer = PMExplorer(root)
+    root.mainloop()
@@ -0,0 +1,202 @@
+"""
+Headless export of projectile motion animations.
+
+Frames are rendered with the non-interactive Agg backend, split across
+worker processes, and then joined into an MP4 (needs ffmpeg), a GIF
+(needs Pillow) or left as a numbered PNG sequence.
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import ProjectileMotion as pm
+from PMPlots import PMPlots, PMMultiPlots
+
+FRAME_PATTERN = 'frame_%05d.png'
+
+# what a worker needs to rebuild the evolved run; derived quantities
+# are recomputed there, and only for the plots it draws
+SNAPSHOT_FIELDS = ('t', 'pos', 'v', 'state', 'dt', 'basicParams', 'dragParams', \
+                   'forceModel', 'storageType', 'outputTolerance', 'compressionRatio')
+
+
+def snapshot(proj):
+    """the picklable parts of an evolved ProjectileMotion"""
+    return dict((name, getattr(proj, name)) for name in SNAPSHOT_FIELDS)
+
+
+def restore(snap):
+    proj = pm.ProjectileMotion()
+    proj.cache = None
+    for name in SNAPSHOT_FIELDS:
+        setattr(proj, name, snap[name])
+    return proj
+
+
+def frameTimes(t, fps):
+    """time and last sample shown in each frame, paced as PMMultiPlots does"""
+    frameTime = PMMultiPlots.PLAYBACK_RATE / fps
+    times = np.arange(int(np.floor(t[-1] / frameTime)) + 1) * frameTime
+    if (times[-1] < t[-1]):
+        # always finish on the impact sample
+        times = np.append(times, t[-1])
+    idx = np.clip(np.searchsorted(t, times, side='right') - 1, 0, len(t) - 1)
+    return times, idx
+
+
+def renderFrameRange(args):
+    """render frames [start, stop) of the animation (runs in a worker)"""
+    snap, plot_types, fps, dpi, outDir, start, stop = args
+    # a forked worker may have inherited an interactive backend
+    plt.switch_backend('Agg')
+    proj = restore(snap)
+
+    plots = PMMultiPlots(proj, plot_types, fps=fps)
+    plots.t = proj.t
+    for panel in plots.panels:
+        panel.x, panel.y = panel.prepare()
+        panel.time_text.set_animated(False)
+    plots.fig.tight_layout()
+
+    times, frames = frameTimes(proj.t, fps)
+    for frame in range(start, stop):
+        idx = frames[frame]
+        for panel in plots.panels:
+            panel.line.set_data(*PMPlots.curveUpTo(proj.t, panel.x, panel.y, 0, idx, times[frame]))
+            panel.time_text.set_text('time = %.3f (s)' % times[frame])
+        plots.fig.savefig(os.path.join(outDir, FRAME_PATTERN % frame), dpi=dpi)
+    plt.close(plots.fig)
+    return stop - start
+
+
+def renderFrames(proj, plot_types, outDir, fps=30, dpi=100, processes=None):
+    """render every frame as a PNG in outDir, split across processes"""
+    if (processes is None):
+        processes = multiprocessing.cpu_count()
+    nFrames = len(frameTimes(proj.t, fps)[0])
+    bounds = np.linspace(0, nFrames, min(processes, nFrames) + 1).astype(int)
+    snap = snapshot(proj)
+    tasks = [(snap, plot_types, fps, dpi, outDir, bounds[k], bounds[k+1]) for k in range(len(bounds) - 1)]
+
+    if (processes <= 1):
+        for task in tasks:
+            renderFrameRange(task)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            pool.map(renderFrameRange, tasks)
+        except:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+    return nFrames
+
+
+def joinMP4(frameDir, outPath, fps):
+    cmd = ['ffmpeg', '-y', '-loglevel', 'error', '-framerate', str(fps), \
+           '-i', os.path.join(frameDir, FRAME_PATTERN), \
+           # even frame sizes and yuv420p keep the file playable everywhere
+           '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', outPath]
+    try:
+        subprocess.check_call(cmd)
+    except OSError:
+        raise RuntimeError("MP4 export needs ffmpeg on the PATH")
+
+
+def joinGIF(frameDir, outPath, fps, nFrames):
+    try:
+        from PIL import Image
+    except ImportError:
+        raise RuntimeError("GIF export needs Pillow")
+    images = [Image.open(os.path.join(frameDir, FRAME_PATTERN % k)) for k in range(nFrames)]
+    images[0].save(outPath, save_all=True, append_images=images[1:], \
+                   duration=int(round(1000.0 / fps)), loop=0)
+
+
+def exportAnimation(proj, plot_types, outPath, fps=30, dpi=100, processes=None):
+    """Write the animation of an evolved run to outPath: '.mp4', '.gif',
+    or a directory that receives the PNG frame sequence. plot_types is
+    one plot type, a list of them (panels of one figure) or 'all'."""
+    if (plot_types == 'all'):
+        plot_types = list(PMPlots.PLOT_ORDER)
+    elif isinstance(plot_types, str):
+        plot_types = [plot_types]
+
+    ext = os.path.splitext(outPath)[1].lower()
+    if (ext not in ('.mp4', '.gif')):
+        if not os.path.isdir(outPath):
+            os.makedirs(outPath)
+        return renderFrames(proj, plot_types, outPath, fps, dpi, processes)
+
+    frameDir = tempfile.mkdtemp(prefix='pmframes')
+    try:
+        nFrames = renderFrames(proj, plot_types, frameDir, fps, dpi, processes)
+        if (ext == '.mp4'):
+            joinMP4(frameDir, outPath, fps)
+        else:
+            joinGIF(frameDir, outPath, fps, nFrames)
+    finally:
+        shutil.rmtree(frameDir, ignore_errors=True)
+    return nFrames
+
+
+def exportEach(proj, outDir, fmt='mp4', fps=30, dpi=100, processes=None):
+    """one file per plot type in outDir, named after the plot type"""
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir)
+    paths = []
+    for plot_type in PMPlots.PLOT_ORDER:
+        if (fmt == 'png'):
+            path = os.path.join(outDir, plot_type)
+        else:
+            path = os.path.join(outDir, plot_type + '.' + fmt)
+        exportAnimation(proj, plot_type, path, fps, dpi, processes)
+        paths.append(path)
+    return paths
+
+
+### MAIN EXECUTABLE ###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export projectile motion animations without a display")
+    parser.add_argument('output', help="output .mp4/.gif file, or a directory for PNG frames")
+    parser.add_argument('--plot', action='append', dest='plots', \
+                        help="plot type (repeat for several panels, or 'all'); default y_vs_x")
+    parser.add_argument('--each', metavar='FMT', help="write one mp4/gif/png export per plot type into output")
+    parser.add_argument('--drag', action='store_true', help="include air resistance")
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--dpi', type=int, default=100)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--tolerance', type=float, help="thin the output to this geometric tolerance (m)")
+    for field in ('mass', 'g', 'v0', 'theta', 'x0', 'y0'):
+        parser.add_argument('--' + field, type=float)
+    parser.add_argument('--drag-coefficient', type=float)
+    parser.add_argument('--diameter', type=float)
+    parser.add_argument('--air-density', type=float)
+    args = parser.parse_args()
+
+    proj = pm.ProjectileMotion()
+    basicParams = dict((field, getattr(args, field)) for field in ('mass', 'g', 'v0', 'theta', 'x0', 'y0') \
+                       if getattr(args, field) is not None)
+    dragParams = dict((field, getattr(args, field.replace(' ', '_'))) \
+                      for field in ('drag coefficient', 'diameter', 'air density') \
+                      if getattr(args, field.replace(' ', '_')) is not None)
+    proj.setParams(basicParams, dragParams)
+    proj.outputTolerance = args.tolerance
+    proj.evolve(int(args.drag))
+
+    if (args.each is not None):
+        for path in exportEach(proj, args.output, args.each, args.fps, args.dpi, args.processes):
+            sys.stdout.write(path + '\n')
+    else:
+        plots = args.plots or ['y_vs_x']
+        exportAnimation(proj, 'all' if 'all' in plots else plots, args.output, \
+                        args.fps, args.dpi, args.processes)
@@ -0,0 +1,277 @@
+"""
+Least-squares fits of the drag model to recorded throws.
+
+Each throw is a series of tracked (t, x, y) positions. Its launch state
+(x0, vx0, y0, vy0 at the first sample) and the drag constant k of the
+selected PMForces model are fitted by Levenberg-Marquardt, with the
+Jacobian taken from the sensitivity equations integrated alongside the
+trajectory rather than from finite differences. For the quadratic
+models Cd, diameter and air density only enter through
+k = Cd * rho * (pi/4) * diameter / 2, so the drag coefficient is
+reported for the given diameter and air density. Throws are fitted independently, across worker processes, e.g.
+
+    python PMFit.py throws.csv --processes 4
+
+where the CSV has the columns throw, t, x, y.
+"""
+
+import sys
+import csv
+import copy
+import time
+import argparse
+import multiprocessing
+import numpy as np
+import scipy.integrate as integrate
+from collections import OrderedDict
+from ProjectileMotion import ProjectileMotion
+import PMForces
+import PMStats
+
+
+# fitted parameters, in the order of the sensitivity columns
+PARAMS = ('k', 'x0', 'vx0', 'y0', 'vy0')
+
+
+def dragConstant(model):
+    """name of the model attribute fitted as k; the drag acceleration is
+    proportional to it in every model"""
+    return 'gamma' if isinstance(model, PMForces.LinearDrag) else 'dragCoeff'
+
+
+def augmentedDerivs(aug, t, model, unit, name):
+    """d/dt of the state (x, vx, y, vy), its sensitivities to PARAMS
+    (4x5, row-major) and k carried along as aug[-1]. The model's
+    attribute name is set to k; unit is the model without gravity and
+    with k = 1, so its derivs give the direct dependence on k."""
+    state = aug[0:4]
+    S = aug[4:24].reshape(4, 5)
+    setattr(model, name, aug[24])
+    dS = np.dot(model.jacobian(state, t), S)
+    drag = unit.derivs(state, t)
+    dS[1,0] += drag[1]
+    dS[3,0] += drag[3]
+    return np.concatenate([model.derivs(state, t), dS.ravel(), [0.]])
+
+
+def simulate(params, t, model):
+    """model positions (K,2) at the sample times t, their Jacobian
+    (K,2,len(PARAMS)) and odeint's info dict"""
+    k, x0, vx0, y0, vy0 = params
+    model = copy.copy(model)
+    name = dragConstant(model)
+    unit = copy.copy(model)
+    setattr(unit, name, 1.)
+    unit.g = 0.
+    S0 = np.zeros((4, 5))
+    S0[0,1] = S0[1,2] = S0[2,3] = S0[3,4] = 1.
+    aug0 = np.concatenate([[x0, vx0, y0, vy0], S0.ravel(), [k]])
+    sol, info = integrate.odeint(augmentedDerivs, aug0, t, args=(model, unit, name), full_output=True)
+    pos = sol[:,[0,2]]
+    S = sol[:,4:24].reshape(len(t), 4, 5)
+    return pos, S[:,[0,2],:], info
+
+
+def initialGuess(t, x, y, g):
+    """drag-free launch state from a quadratic fit to the first samples"""
+    if (len(t) < 3):
+        raise ValueError('A throw needs at least 3 samples, got %d' % len(t))
+    m = max(3, min(len(t), len(t) // 5))
+    dt = t[0:m] - t[0]
+    vx0, x0 = np.polyfit(dt, x[0:m], 1)
+    # with gravity known, y - g t^2/2 is linear in t
+    vy0, y0 = np.polyfit(dt, y[0:m] - 0.5*g*dt*dt, 1)
+    return np.array([0., x0, vx0, y0, vy0])
+
+
+class PMFitResult:
+    """Fitted parameters of one throw, their standard errors and the
+    quality and cost of the fit"""
+
+    def __init__(self, params, stderr, rms, cost, iterations, converged, stalled, stats):
+        self.params = OrderedDict(zip(PARAMS, params))
+        self.stderr = OrderedDict(zip(PARAMS, stderr))
+        # root-mean-square position residual (m)
+        self.rms = rms
+        self.cost = cost
+        self.iterations = iterations
+        self.converged = converged
+        # no step lowered the cost before the damping ran out
+        self.stalled = stalled
+        # PMStats with the time per iteration and solver counters
+        self.stats = stats
+
+
+    def timePerIteration(self):
+        seconds, calls = self.stats.phases.get('iteration', (0., 0))
+        return seconds / calls if calls > 0 else np.nan
+
+
+def fitThrow(args):
+    """Levenberg-Marquardt fit of one throw (runs in a worker process)"""
+    t, x, y, dragModel, basicParams, dragParams, modelParams, maxIter, tol = args
+    t, x, y = [np.asarray(a, dtype=float) for a in (t, x, y)]
+    measured = np.column_stack([x, y])
+    stats = PMStats.PMStats()
+    model = PMForces.makeForceModel(dragModel, basicParams, dragParams, modelParams)
+
+    params = initialGuess(t, x, y, basicParams['g'])
+    pos, J, info = simulate(params, t, model)
+    stats.recordOdeint(info)
+    r = (pos - measured).ravel()
+    cost = np.dot(r, r)
+    lam = 1e-3
+    converged = False
+    stalled = False
+    iterations = 0
+    while (iterations < maxIter and not (converged or stalled)):
+        start = time.time()
+        iterations += 1
+        Jf = J.reshape(-1, len(PARAMS))
+        A = np.dot(Jf.T, Jf)
+        grad = np.dot(Jf.T, r)
+        # raise the damping until a step lowers the cost
+        while True:
+            D = np.diag(np.maximum(np.diag(A), 1e-12))
+            step = np.linalg.solve(A + lam*D, -grad)
+            trial = params + step
+            trial[0] = max(trial[0], 0.)
+            tpos, tJ, info = simulate(trial, t, model)
+            stats.recordOdeint(info)
+            tr = (tpos - measured).ravel()
+            tcost = np.dot(tr, tr)
+            if (tcost <= cost):
+                break
+            lam *= 10.
+            if (lam > 1e12):
+                break
+        if (tcost <= cost):
+            converged = (cost - tcost) <= tol * max(cost, 1e-300)
+            params, pos, J, r, cost = trial, tpos, tJ, tr, tcost
+            lam = max(lam / 10., 1e-12)
+        else:
+            # no step lowers the cost, but it did not settle either
+            stalled = True
+        stats.add('iteration', time.time() - start)
+
+    # standard errors from the Gauss-Newton covariance
+    Jf = J.reshape(-1, len(PARAMS))
+    dof = max(len(r) - len(PARAMS), 1)
+    try:
+        cov = np.linalg.inv(np.dot(Jf.T, Jf)) * cost / dof
+        stderr = np.sqrt(np.abs(np.diag(cov)))
+    except np.linalg.LinAlgError:
+        stderr = np.full(len(PARAMS), np.nan)
+    rms = np.sqrt(cost / len(t))
+    return PMFitResult(params, stderr, rms, cost, iterations, converged, stalled, stats)
+
+
+class PMFit:
+
+    MAX_ITER = 50
+    # relative drop in the cost below which a fit has converged
+    TOL = 1e-10
+
+    def __init__(self, processes=1):
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+        pm = ProjectileMotion()
+        self.basicParams = dict(pm.basicParams)
+        self.dragParams = dict(pm.dragParams)
+        self.dragModel = pm.dragModel
+        self.modelParams = OrderedDict(pm.modelParams)
+        # wall time of the last fit
+        self.elapsed = 0.
+
+
+    def fit(self, throws):
+        """fit every (t, x, y) throw, returning a PMFitResult per throw"""
+        tasks = [(t, x, y, self.dragModel, self.basicParams, self.dragParams, self.modelParams, \
+                  self.MAX_ITER, self.TOL) for t, x, y in throws]
+        start = time.time()
+        if (self.processes <= 1):
+            results = [fitThrow(task) for task in tasks]
+        else:
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                results = pool.map(fitThrow, tasks)
+            finally:
+                pool.close()
+                pool.join()
+        self.elapsed = time.time() - start
+        return results
+
+
+    def dragCoefficient(self, k):
+        """Cd giving the drag constant k with this diameter and air density
+        (NaN for the linear model, whose k is not set by Cd)"""
+        if (self.dragModel == 'linear'):
+            return np.nan
+        area = 0.25 * np.pi * self.dragParams['diameter']
+        return k / (0.5 * self.dragParams['air density'] * area)
+
+
+    def combined(self, results):
+        """inverse-variance weighted k over all throws and its standard error"""
+        k = np.array([r.params['k'] for r in results])
+        err = np.array([r.stderr['k'] for r in results])
+        ok = np.isfinite(err) & (err > 0.)
+        if not np.any(ok):
+            return np.nan, np.nan
+        w = 1. / np.square(err[ok])
+        return np.sum(w * k[ok]) / np.sum(w), 1. / np.sqrt(np.sum(w))
+
+
+    def summary(self, results, names=None):
+        """multi-line table of the per-throw fits and the combined estimate"""
+        unit = '(1/s)' if self.dragModel == 'linear' else '(1/m)'
+        lines = ["%-8s %12s %12s %10s %10s %6s %10s" % ('throw', 'k ' + unit, 'Cd', '+/-', 'rms (m)', \
+                                                         'iters', 'ms/iter')]
+        for i, r in enumerate(results):
+            name = names[i] if names is not None else str(i)
+            lines.append("%-8s %12.6g %12.6g %10.3g %10.3g %6d %10.2f%s" % \
+                         (name, r.params['k'], self.dragCoefficient(r.params['k']), \
+                          self.dragCoefficient(r.stderr['k']), r.rms, r.iterations, \
+                          1e3*r.timePerIteration(), \
+                          '' if r.converged else '  (stalled)' if r.stalled else '  (not converged)'))
+        k, err = self.combined(results)
+        lines.append("combined k = %.6g +/- %.3g, Cd = %.6g +/- %.3g (diameter %g m, air density %g kg/m^3)" % \
+                     (k, err, self.dragCoefficient(k), self.dragCoefficient(err), \
+                      self.dragParams['diameter'], self.dragParams['air density']))
+        lines.append("%d throws fitted in %.2f s" % (len(results), self.elapsed))
+        return "\n".join(lines)
+
+
+def readThrows(stream):
+    """(names, [(t, x, y)]) from CSV rows with throw, t, x and y columns"""
+    throws = OrderedDict()
+    for row in csv.DictReader(stream):
+        throws.setdefault(row['throw'], []).append((float(row['t']), float(row['x']), float(row['y'])))
+    data = []
+    for samples in throws.values():
+        samples = np.array(sorted(samples))
+        data.append((samples[:,0], samples[:,1], samples[:,2]))
+    return list(throws.keys()), data
+
+
+
+### MAIN EXECUTABLE ###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit the drag model to recorded (t, x, y) throws")
+    parser.add_argument('input', nargs='?', help="CSV with throw, t, x, y columns (default stdin)")
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--model', choices=list(PMForces.MODELS), default='quadratic', help="drag model")
+    parser.add_argument('--diameter', type=float, default=None, help="diameter (m) used to report Cd")
+    parser.add_argument('--air-density', type=float, default=None, help="air density (kg/m^3) used to report Cd")
+    parser.add_argument('--g', type=float, default=None, help="gravitational acceleration (m/s^2)")
+    args = parser.parse_args()
+
+    fitter = PMFit(args.processes)
+    fitter.dragModel = args.model
+    if (args.diameter is not None):
+        fitter.dragParams['diameter'] = args.diameter
+    if (args.air_density is not None):
+        fitter.dragParams['air density'] = args.air_density
+    if (args.g is not None):
+        fitter.basicParams['g'] = -abs(args.g)
+    names, throws = readThrows(open(args.input) if args.input else sys.stdin)
+    print(fitter.summary(fitter.fit(throws), names))
@@ -0,0 +1,248 @@
+"""
+Force models for 2D-projectile motion.
+
+Each model precomputes its constants once and then supplies the state
+derivative and its analytic Jacobian for the integrators. States use the
+ProjectileMotion layout [x, vx, y, vy] and may be a single (4,) state or
+an (N,4) stack; model constants may likewise be scalars or (N,) arrays.
+Single states (what odeint hands over) take a plain-float fast path.
+As in ProjectileMotion.derivs, the quadratic drag constant
+0.5 * Cd * rho * A acts directly as an acceleration coefficient.
+"""
+
+import copy
+import math
+import numpy as np
+from collections import OrderedDict
+
+
+class ForceModel:
+    """Gravity only; the base class for the drag models"""
+
+    def __init__(self, mass, g):
+        self.mass = mass
+        self.g = g
+
+
+    def scalarAcceleration(self, y, vx, vy):
+        """(ax, ay) for a single state, as floats"""
+        return 0.0, self.g
+
+
+    def scalarAccelerationJacobian(self, y, vx, vy):
+        """rows d(ax)/d(state) and d(ay)/d(state) for a single state"""
+        return (0.0, 0.0, 0.0, 0.0), (0.0, 0.0, 0.0, 0.0)
+
+
+    def acceleration(self, state):
+        """(ax, ay) arrays for an (..., 4) array of states"""
+        ax = 0.0 * state[...,1]
+        return ax, self.g + ax
+
+
+    def accelerationJacobian(self, state):
+        """d(ax, ay)/d(x, vx, y, vy) as a (..., 2, 4) array"""
+        return np.zeros(np.shape(state)[:-1] + (2, 4))
+
+
+    def derivs(self, state, t):
+        """state derivative, same call signature as ProjectileMotion.derivs"""
+        if (np.ndim(state) == 1):
+            vx = float(state[1])
+            vy = float(state[3])
+            ax, ay = self.scalarAcceleration(float(state[2]), vx, vy)
+            return np.array([vx, ax, vy, ay])
+
+        ax, ay = self.acceleration(state)
+        derivs = np.empty(np.shape(state))
+        derivs[...,0] = state[...,1]
+        derivs[...,1] = ax
+        derivs[...,2] = state[...,3]
+        derivs[...,3] = ay
+        return derivs
+
+
+    def jacobian(self, state, t):
+        """d(derivs)/d(state) as a (..., 4, 4) array (odeint's Dfun)"""
+        if (np.ndim(state) == 1):
+            rowX, rowY = self.scalarAccelerationJacobian(float(state[2]), float(state[1]), float(state[3]))
+            return np.array([(0.0, 1.0, 0.0, 0.0), rowX, (0.0, 0.0, 0.0, 1.0), rowY])
+
+        state = np.asarray(state)
+        jac = np.zeros(state.shape[:-1] + (4, 4))
+        jac[...,0,1] = 1.0
+        jac[...,2,3] = 1.0
+        jac[...,[1,3],:] = self.accelerationJacobian(state)
+        return jac
+
+
+    def force(self, state):
+        """(..., 2) array of the net force on the projectile"""
+        ax, ay = self.acceleration(np.asarray(state))
+        F = np.empty(np.shape(state)[:-1] + (2,))
+        F[...,0] = self.mass * ax
+        F[...,1] = self.mass * ay
+        return F
+
+
+class QuadraticDrag(ForceModel):
+    """Drag alpha |u| u against the velocity u relative to the air, with
+    an optional constant wind and exponentially thinning air"""
+
+    def __init__(self, mass, g, dragCoeff, wind=(0.0, 0.0), scaleHeight=None):
+        ForceModel.__init__(self, mass, g)
+        self.dragCoeff = dragCoeff
+        self.windX, self.windY = wind
+        # None means the density does not change with altitude
+        self.invScaleHeight = None if scaleHeight is None else 1.0 / scaleHeight
+
+
+    def scalarAcceleration(self, y, vx, vy):
+        ux = vx - self.windX
+        uy = vy - self.windY
+        k = self.dragCoeff
+        if (self.invScaleHeight is not None):
+            k = k * math.exp(-y * self.invScaleHeight)
+        beta = k * math.sqrt(ux*ux + uy*uy)
+        return -beta * ux, self.g - beta * uy
+
+
+    def scalarAccelerationJacobian(self, y, vx, vy):
+        ux = vx - self.windX
+        uy = vy - self.windY
+        k = self.dragCoeff
+        if (self.invScaleHeight is not None):
+            k = k * math.exp(-y * self.invScaleHeight)
+        speed = math.sqrt(ux*ux + uy*uy)
+        # d|u|/du_i = u_i/|u|, taken as zero when the projectile is at rest
+        invSpeed = 1.0 / speed if speed > 0.0 else 0.0
+        cross = -k * ux*uy*invSpeed
+        # dk/dy = -k/H
+        dy = 0.0 if self.invScaleHeight is None else k * self.invScaleHeight * speed
+        return (0.0, -k * (speed + ux*ux*invSpeed), dy * ux, cross), \
+               (0.0, cross, dy * uy, -k * (speed + uy*uy*invSpeed))
+
+
+    def localDragCoeff(self, state):
+        if (self.invScaleHeight is None):
+            return self.dragCoeff
+        return self.dragCoeff * np.exp(-state[...,2] * self.invScaleHeight)
+
+
+    def acceleration(self, state):
+        ux = state[...,1] - self.windX
+        uy = state[...,3] - self.windY
+        beta = self.localDragCoeff(state) * np.sqrt(ux*ux + uy*uy)
+        return -beta * ux, self.g - beta * uy
+
+
+    def accelerationJacobian(self, state):
+        ux = state[...,1] - self.windX
+        uy = state[...,3] - self.windY
+        k = self.localDragCoeff(state)
+        speed = np.sqrt(ux*ux + uy*uy)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            invSpeed = np.where(speed > 0.0, 1.0 / speed, 0.0)
+
+        jac = np.zeros(np.shape(state)[:-1] + (2, 4))
+        jac[...,0,1] = -k * (speed + ux*ux*invSpeed)
+        jac[...,0,3] = -k * ux*uy*invSpeed
+        jac[...,1,1] = jac[...,0,3]
+        jac[...,1,3] = -k * (speed + uy*uy*invSpeed)
+        if (self.invScaleHeight is not None):
+            jac[...,0,2] = k * self.invScaleHeight * speed * ux
+            jac[...,1,2] = k * self.invScaleHeight * speed * uy
+        return jac
+
+
+class ConstantWind(QuadraticDrag):
+    """Quadratic drag in a steady (windX, windY) wind"""
+
+    def __init__(self, mass, g, dragCoeff, windX, windY):
+        QuadraticDrag.__init__(self, mass, g, dragCoeff, wind=(windX, windY))
+
+
+class ExponentialAtmosphere(QuadraticDrag):
+    """Quadratic drag with air density rho0 * exp(-y/H)"""
+
+    def __init__(self, mass, g, dragCoeff, scaleHeight):
+        QuadraticDrag.__init__(self, mass, g, dragCoeff, scaleHeight=scaleHeight)
+
+
+class LinearDrag(ForceModel):
+    """Stokes drag -b v with b = 3 pi mu D"""
+
+    def __init__(self, mass, g, stokesCoeff):
+        ForceModel.__init__(self, mass, g)
+        self.stokesCoeff = stokesCoeff
+        self.gamma = stokesCoeff / mass
+
+
+    def scalarAcceleration(self, y, vx, vy):
+        return -self.gamma * vx, self.g - self.gamma * vy
+
+
+    def scalarAccelerationJacobian(self, y, vx, vy):
+        return (0.0, -self.gamma, 0.0, 0.0), (0.0, 0.0, 0.0, -self.gamma)
+
+
+    def acceleration(self, state):
+        return -self.gamma * state[...,1], self.g - self.gamma * state[...,3]
+
+
+    def accelerationJacobian(self, state):
+        jac = np.zeros(np.shape(state)[:-1] + (2, 4))
+        jac[...,0,1] = -self.gamma
+        jac[...,1,3] = -self.gamma
+        return jac
+
+
+MODELS = OrderedDict([('quadratic', QuadraticDrag), ('linear', LinearDrag), \
+                      ('wind', ConstantWind), ('exponential', ExponentialAtmosphere)])
+
+# extra parameters the non-default models need
+MODEL_PARAMS = OrderedDict([('wind x', 0.0), ('wind y', 0.0), ('scale height', 8500.0), \
+                            ('air viscosity', 1.81e-5)])
+MODEL_PARAMS_UNITS = {'wind x':'(m/s)', 'wind y':'(m/s)', 'scale height':'(m)', \
+                      'air viscosity':'(Pa s)'}
+
+
+def dragCoefficient(dragParams):
+    """the quadratic drag constant used by ProjectileMotion.derivs"""
+    area = 0.25 * np.pi * dragParams['diameter']
+    return 0.5 * dragParams['drag coefficient'] * dragParams['air density'] * area
+
+
+def selectRows(model, ids, n):
+    """copy of a model built for n states with its per-state constants
+    narrowed to the states ids"""
+    sub = copy.copy(model)
+    for name, value in vars(model).items():
+        if (isinstance(value, np.ndarray) and value.shape == (n,)):
+            setattr(sub, name, value[ids])
+    return sub
+
+
+def makeForceModel(name, basicParams, dragParams, modelParams=None, usingDragForce=1):
+    """build the named model from ProjectileMotion-style parameter dicts"""
+    if (name not in MODELS):
+        raise ValueError("Unknown force model: %s" % name)
+    params = dict(MODEL_PARAMS)
+    if (modelParams is not None):
+        params.update(modelParams)
+
+    mass = basicParams['mass']
+    g = basicParams['g']
+    if (usingDragForce == 0):
+        return ForceModel(mass, g)
+
+    if (name == 'linear'):
+        stokesCoeff = 3.0 * np.pi * params['air viscosity'] * dragParams['diameter']
+        return LinearDrag(mass, g, stokesCoeff)
+
+    dragCoeff = dragCoefficient(dragParams)
+    if (name == 'wind'):
+        return ConstantWind(mass, g, dragCoeff, params['wind x'], params['wind y'])
+    elif (name == 'exponential'):
+        return ExponentialAtmosphere(mass, g, dragCoeff, params['scale height'])
+    return QuadraticDrag(mass, g, dragCoeff)
@@ -0,0 +1,220 @@
+"""
+Vectorized integrators for batches of independent systems.
+
+Each row of an (n, m) state array is its own ODE system, so each row
+gets its own adaptive step: the cost of a batch follows its hardest row
+instead of growing with the number of rows, as it does when a flattened
+batch shares one odeint step size.
+
+rk4, verlet and rk45 sample the rows on an output time grid like odeint
+does. rk4 and verlet step once per grid interval; rk45 steps adaptively
+and fills the grid from its dense output. Velocity Verlet is symplectic
+(and, for constant gravity, exact) only when the force does not depend on
+the velocity, so the solvers only offer it for drag-free runs. With
+full_output they also return an odeint-style info dict, where 'nfe'
+counts calls of func (each covering every row).
+"""
+
+import numpy as np
+
+
+# Dormand-Prince 5(4) tableau
+DP_C = np.array([0., 1./5, 3./10, 4./5, 8./9, 1., 1.])
+DP_A = [[],
+        [1./5],
+        [3./40, 9./40],
+        [44./45, -56./15, 32./9],
+        [19372./6561, -25360./2187, 64448./6561, -212./729],
+        [9017./3168, -355./33, 46732./5247, 49./176, -5103./18656],
+        [35./384, 0., 500./1113, 125./192, -2187./6784, 11./84]]
+DP_B = np.array([35./384, 0., 500./1113, 125./192, -2187./6784, 11./84, 0.])
+# fifth minus fourth order weights, for the error estimate
+DP_E = DP_B - np.array([5179./57600, 0., 7571./16695, 393./640, -92097./339200, 187./2100, 1./40])
+# quartic dense output: stage weights are polynomials in theta (Shampine)
+DP_P = np.array([[1., -8048581381./2820520608, 8663915743./2820520608, -12715105075./11282082432],
+                 [0., 0., 0., 0.],
+                 [0., 131558114200./32700410799, -68118460800./10900136933, 87487479700./32700410799],
+                 [0., -1754552775./470086768, 14199869525./1410260304, -10690763975./1880347072],
+                 [0., 127303824393./49829197408, -318862633887./49829197408, 701980252875./199316789632],
+                 [0., -282668133./205662961, 2019193451./616988883, -1453857185./822651844],
+                 [0., 40617522./29380423, -110615467./29380423, 69997945./29380423]])
+
+# columns of positions and velocities in the [x, vx, y, vy] layout
+POSITIONS = (0, 2)
+VELOCITIES = (1, 3)
+
+
+def dpStep(func, ta, ya, ha, first, rows, rtol, atol):
+    """one Dormand-Prince step of the rows: the stages, the fifth order
+    solution and the RMS of the scaled error estimate per row"""
+    k = [first]
+    for c, a in zip(DP_C[1:], DP_A[1:]):
+        yi = ya.copy()
+        for aj, kj in zip(a, k):
+            if (aj != 0.):
+                yi += (ha * aj)[:,None] * kj
+        k.append(func(ta + c*ha, yi, rows))
+    y5 = ya + ha[:,None] * sum(b * kb for b, kb in zip(DP_B, k) if b != 0.)
+    err = ha[:,None] * sum(e * ke for e, ke in zip(DP_E, k))
+    scale = atol + rtol * np.maximum(np.abs(ya), np.abs(y5))
+    norm = np.sqrt(np.mean(np.square(err / scale), axis=1))
+    return k, y5, norm
+
+
+def nextStep(h, norm, accept):
+    """step sizes after a step with the given error norms"""
+    with np.errstate(divide='ignore'):
+        factor = np.clip(0.9 * norm**-0.2, 0.2, 5.)
+    # a rejected step never grows
+    factor[~accept] = np.minimum(factor[~accept], 1.)
+    return h * np.where(np.isfinite(norm), factor, 0.2)
+
+
+def odeintInfo(nfe, nst):
+    return {'nfe': np.array([nfe]), 'nje': np.array([0]), 'nst': np.array([nst])}
+
+
+def dormandPrince(func, y0, t0, t1, rtol=1e-9, atol=1e-9, h0=None, maxSteps=10000, stop=None):
+    """Integrate every row of y0 from t0 to t1 with its own adaptive
+    Dormand-Prince 5(4) step. func(t, y, rows) returns dy/dt for the rows
+    (indices into y0) at their times t. stop(t, y, rows), if given, marks
+    rows to stop early after an accepted step. Returns the final states,
+    the times reached and the number of accepted steps per row."""
+    y = np.array(y0, dtype=float)
+    n = len(y)
+    t = np.full(n, float(t0))
+    span = float(t1) - float(t0)
+    h = np.full(n, span / 100. if h0 is None else float(h0))
+    steps = np.zeros(n, dtype=int)
+    active = np.arange(n)
+    # the last stage of an accepted step is the first of the next (FSAL)
+    first = func(t, y, active) if n > 0 else y.copy()
+    for it in range(maxSteps):
+        if (len(active) == 0):
+            break
+        ya = y[active]
+        ta = t[active]
+        ha = np.minimum(h[active], t1 - ta)
+
+        k, y5, norm = dpStep(func, ta, ya, ha, first[active], active, rtol, atol)
+
+        accept = norm <= 1.
+        rows = active[accept]
+        y[rows] = y5[accept]
+        first[rows] = k[6][accept]
+        t[rows] = ta[accept] + ha[accept]
+        steps[rows] += 1
+        h[active] = nextStep(ha, norm, accept)
+
+        done = accept & (t[active] >= t1 - 1e-12 * abs(span))
+        if (stop is not None and len(rows) > 0):
+            done[accept] |= stop(t[rows], y[rows], rows)
+        active = active[~done]
+    return y, t, steps
+
+
+def rk4(func, y0, t, full_output=False):
+    """Classical fourth order Runge-Kutta over the (n, m) rows of y0, one
+    step per interval of the output grid t. Returns (len(t), n, m) states."""
+    t = np.asarray(t, dtype=float)
+    y = np.array(y0, dtype=float)
+    rows = np.arange(len(y))
+    out = np.empty((len(t),) + y.shape)
+    out[0] = y
+    for i in range(len(t) - 1):
+        h = t[i+1] - t[i]
+        k1 = func(t[i], y, rows)
+        k2 = func(t[i] + 0.5*h, y + 0.5*h*k1, rows)
+        k3 = func(t[i] + 0.5*h, y + 0.5*h*k2, rows)
+        k4 = func(t[i+1], y + h*k3, rows)
+        y = y + h/6. * (k1 + 2.*(k2 + k3) + k4)
+        out[i+1] = y
+    if (full_output):
+        return out, odeintInfo(4 * (len(t) - 1), len(t) - 1)
+    return out
+
+
+def verlet(func, y0, t, full_output=False):
+    """Velocity Verlet (kick-drift-kick) over the (n, m) rows of y0, one
+    step per interval of t; the accelerations are the VELOCITIES columns of
+    func and the last one of a step starts the next. Returns (len(t), n, m)
+    states."""
+    t = np.asarray(t, dtype=float)
+    y = np.array(y0, dtype=float)
+    rows = np.arange(len(y))
+    pos = list(POSITIONS)
+    vel = list(VELOCITIES)
+    out = np.empty((len(t),) + y.shape)
+    out[0] = y
+    a = func(t[0], y, rows)[:,vel] if len(t) > 1 else None
+    for i in range(len(t) - 1):
+        h = t[i+1] - t[i]
+        y = y.copy()
+        y[:,vel] += 0.5*h * a
+        y[:,pos] += h * y[:,vel]
+        a = func(t[i+1], y, rows)[:,vel]
+        y[:,vel] += 0.5*h * a
+        out[i+1] = y
+    if (full_output):
+        return out, odeintInfo(len(t) if len(t) > 1 else 0, len(t) - 1)
+    return out
+
+
+def rk45(func, y0, t, rtol=1e-9, atol=1e-9, h0=None, maxSteps=100000, full_output=False):
+    """Adaptive Dormand-Prince 5(4) over the (n, m) rows of y0, each with
+    its own step, sampled on the output grid t by the quartic dense output.
+    Steps are not tied to the grid. Returns (len(t), n, m) states."""
+    t = np.asarray(t, dtype=float)
+    y = np.array(y0, dtype=float)
+    n = len(y)
+    out = np.full((len(t),) + y.shape, np.nan)
+    out[0] = y
+    t1 = t[-1]
+    span = t1 - t[0]
+    tc = np.full(n, t[0])
+    h = np.full(n, (t[1] - t[0] if len(t) > 1 else 0.) if h0 is None else float(h0))
+    # next grid point to fill, per row
+    nextIdx = np.ones(n, dtype=int)
+    active = np.arange(n) if len(t) > 1 else np.arange(0)
+    first = func(tc, y, active) if len(active) > 0 else y.copy()
+    nfe = 1 if len(active) > 0 else 0
+    nst = 0
+    for it in range(maxSteps):
+        if (len(active) == 0):
+            break
+        ya = y[active]
+        ta = tc[active]
+        ha = np.minimum(h[active], t1 - ta)
+        k, y5, norm = dpStep(func, ta, ya, ha, first[active], active, rtol, atol)
+        nfe += 6
+        nst += 1
+
+        accept = norm <= 1.
+        rows = active[accept]
+        stages = np.array([kk[accept] for kk in k])
+        y0a, t0a, ha0 = ya[accept], ta[accept], ha[accept]
+        y[rows] = y5[accept]
+        first[rows] = k[6][accept]
+        tc[rows] = t0a + ha0
+        # every grid point inside an accepted step, as flat (row, point) pairs
+        end = np.searchsorted(t, t0a + ha0 + 1e-12 * abs(span), side='right')
+        counts = np.maximum(end - nextIdx[rows], 0)
+        if (np.sum(counts) > 0):
+            r = np.repeat(np.arange(len(rows)), counts)
+            idx = nextIdx[rows][r] + np.arange(len(r)) - np.repeat(np.cumsum(counts) - counts, counts)
+            theta = (t[idx] - t0a[r]) / ha0[r]
+            powers = np.cumprod(np.repeat(theta[None,:], 4, axis=0), axis=0)
+            weights = np.dot(DP_P, powers)
+            out[idx, rows[r]] = y0a[r] + ha0[r][:,None] * np.einsum('sp,spm->pm', weights, stages[:,r])
+            nextIdx[rows] += counts
+        h[active] = nextStep(ha, norm, accept)
+
+        done = accept & (tc[active] >= t1 - 1e-12 * abs(span))
+        active = active[~done]
+    if (full_output):
+        return out, odeintInfo(nfe, nst)
+    return out
+
+
+# fixed output-grid integrators by solver name
+GRID_SOLVERS = {'rk4': rk4, 'verlet': verlet, 'rk45': rk45}
@@ -0,0 +1,253 @@
+"""
+Optional Numba-compiled kernels for single-trajectory runs.
+
+The force models of PMForces reduce to a handful of constants, so their
+acceleration is written once as a scalar function and the RK4 and
+Dormand-Prince 5(4) loops of PMIntegrators are written as plain loops
+over it. With Numba installed these compile to machine code (cached on
+disk after the first call), removing the Python overhead per RHS call;
+without it, or for a model or solver the kernels do not cover, callers
+get None back and take the NumPy path. Results are checked against a
+tight-tolerance odeint by
+
+    python PMJit.py
+"""
+
+import sys
+import math
+import time
+import argparse
+import numpy as np
+import PMForces
+import PMIntegrators
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# largest position error against the odeint reference that check() accepts,
+# relative to the largest coordinate of the flight (about 7x ProjectileMotion.RTOL)
+TOLERANCE = 1e-7
+
+# constants of a force model, in the order the kernels take them
+CONSTANTS = ('g', 'dragCoeff', 'windX', 'windY', 'invScaleHeight', 'gamma')
+
+# the models covered by derivs()
+MODELS = (PMForces.ForceModel, PMForces.QuadraticDrag, PMForces.ConstantWind, \
+          PMForces.ExponentialAtmosphere, PMForces.LinearDrag)
+
+# Dormand-Prince tableau as square arrays for the compiled loops
+DP_A = np.zeros((7, 7))
+for ii, row in enumerate(PMIntegrators.DP_A):
+    DP_A[ii,0:len(row)] = row
+DP_B = PMIntegrators.DP_B
+DP_E = PMIntegrators.DP_E
+DP_P = PMIntegrators.DP_P
+
+
+def jit(func):
+    """compile func with Numba when it is installed"""
+    if (numba is None):
+        return func
+    return numba.njit(cache=True)(func)
+
+
+def available():
+    return numba is not None
+
+
+@jit
+def derivs(s, c, out):
+    """[x, vx, y, vy] derivative of state s into out; quadratic drag
+    against the wind (thinning with height) plus linear drag"""
+    ux = s[1] - c[2]
+    uy = s[3] - c[3]
+    k = c[1]
+    if (c[4] != 0.):
+        k = k * math.exp(-s[2] * c[4])
+    beta = k * math.sqrt(ux*ux + uy*uy)
+    out[0] = s[1]
+    out[1] = -beta * ux - c[5] * s[1]
+    out[2] = s[3]
+    out[3] = c[0] - beta * uy - c[5] * s[3]
+
+
+@jit
+def rk4Kernel(state0, t, c):
+    """PMIntegrators.rk4 for one state: (len(t), 4) states"""
+    n = len(t)
+    out = np.empty((n, 4))
+    s = state0.copy()
+    tmp = np.empty(4)
+    k1 = np.empty(4)
+    k2 = np.empty(4)
+    k3 = np.empty(4)
+    k4 = np.empty(4)
+    out[0,:] = s
+    for i in range(n - 1):
+        h = t[i+1] - t[i]
+        derivs(s, c, k1)
+        for j in range(4):
+            tmp[j] = s[j] + 0.5*h*k1[j]
+        derivs(tmp, c, k2)
+        for j in range(4):
+            tmp[j] = s[j] + 0.5*h*k2[j]
+        derivs(tmp, c, k3)
+        for j in range(4):
+            tmp[j] = s[j] + h*k3[j]
+        derivs(tmp, c, k4)
+        for j in range(4):
+            s[j] += h/6. * (k1[j] + 2.*(k2[j] + k3[j]) + k4[j])
+            out[i+1,j] = s[j]
+    return out, 4 * (n - 1), n - 1
+
+
+@jit
+def rk45Kernel(state0, t, c, rtol, atol, h0, maxSteps):
+    """PMIntegrators.rk45 for one state: (len(t), 4) states (NaN past
+    maxSteps), RHS evaluations and steps"""
+    n = len(t)
+    out = np.full((n, 4), np.nan)
+    y = state0.copy()
+    out[0,:] = y
+    K = np.empty((7, 4))
+    tmp = np.empty(4)
+    t1 = t[n-1]
+    span = abs(t1 - t[0])
+    tc = t[0]
+    h = h0
+    derivs(y, c, K[0])
+    nfe = 1
+    nst = 0
+    nxt = 1
+    while (nxt < n and nst < maxSteps):
+        if (h > t1 - tc):
+            h = t1 - tc
+        for st in range(1, 7):
+            for j in range(4):
+                acc = 0.
+                for r in range(st):
+                    acc += DP_A[st,r] * K[r,j]
+                tmp[j] = y[j] + h*acc
+            derivs(tmp, c, K[st])
+        nfe += 6
+        nst += 1
+        # the last stage is taken at the fifth order solution, now in tmp
+        err = 0.
+        for j in range(4):
+            e = 0.
+            for r in range(7):
+                e += DP_E[r] * K[r,j]
+            scale = atol + rtol * max(abs(y[j]), abs(tmp[j]))
+            err += (h*e / scale)**2
+        norm = math.sqrt(err / 4.)
+
+        if (norm <= 1.):
+            while (nxt < n and t[nxt] <= tc + h + 1e-12*span):
+                theta = (t[nxt] - tc) / h
+                for j in range(4):
+                    q = 0.
+                    for r in range(7):
+                        q += theta*(DP_P[r,0] + theta*(DP_P[r,1] + theta*(DP_P[r,2] + theta*DP_P[r,3]))) * K[r,j]
+                    out[nxt,j] = y[j] + h*q
+                nxt += 1
+            tc += h
+            for j in range(4):
+                y[j] = tmp[j]
+                K[0,j] = K[6,j]
+        if (norm > 0. and not (math.isnan(norm) or math.isinf(norm))):
+            factor = min(max(0.9 * norm**-0.2, 0.2), 5.)
+        elif (norm == 0.):
+            factor = 5.
+        else:
+            factor = 0.2
+        # a rejected step never grows
+        if (norm > 1.):
+            factor = min(factor, 1.)
+        h *= factor
+    return out, nfe, nst
+
+
+def modelConstants(model):
+    """CONSTANTS of a single-trajectory force model, or None if the
+    kernels do not cover it"""
+    if getattr(model, '__class__', None) not in MODELS:
+        return None
+    values = [getattr(model, name, None) for name in CONSTANTS]
+    values = [0. if v is None else v for v in values]
+    if any(np.ndim(v) != 0 for v in values):
+        return None
+    return np.array(values, dtype=float)
+
+
+def integrate(solver, model, state, t, rtol=1e-9, atol=1e-9):
+    """(states, odeint-style info) from the compiled solver kernel, or
+    None when Numba, the solver or the model is not supported"""
+    if (numba is None or solver not in ('rk4', 'rk45')):
+        return None
+    c = modelConstants(model)
+    if (c is None):
+        return None
+    state = np.asarray(state, dtype=float)
+    t = np.asarray(t, dtype=float)
+    if (solver == 'rk4'):
+        states, nfe, nst = rk4Kernel(state, t, c)
+    else:
+        h0 = t[1] - t[0] if len(t) > 1 else 0.
+        states, nfe, nst = rk45Kernel(state, t, c, rtol, atol, h0, 100000)
+    return states, PMIntegrators.odeintInfo(nfe, nst)
+
+
+def check(cases=None, solvers=('rk4', 'rk45'), dt=0.001, tolerance=TOLERANCE):
+    """largest position error of each jit solver against odeint at tight
+    tolerances, relative to the size of the flight, and whether it is
+    within tolerance; one row per case"""
+    import scipy.integrate as integrate
+    from ProjectileMotion import ProjectileMotion
+    if cases is None:
+        cases = [('quadratic', 30., 45., 0.), ('quadratic', 30., 45., 0.1), ('quadratic', 100., 60., 0.5), \
+                 ('linear', 20., 30., 0.01), ('wind', 40., 50., 0.1), ('exponential', 200., 70., 0.05)]
+    rows = []
+    for dragModel, v0, theta, diameter in cases:
+        for solver in solvers:
+            proj = ProjectileMotion()
+            proj.cache = None
+            proj.instrument = True
+            proj.dt = dt
+            proj.dragModel = dragModel
+            proj.setParams({'v0': v0, 'theta': theta}, {'diameter': diameter})
+            usingDragForce = int(diameter > 0)
+            start = time.time()
+            proj.evolve(usingDragForce, solver, backend='jit')
+            elapsed = time.time() - start
+            model = proj.getForceModel(usingDragForce)
+            ref = integrate.odeint(model.derivs, proj.state, proj.t, Dfun=model.jacobian, rtol=1e-12, atol=1e-12)
+            error = np.max(np.hypot(proj.pos[:,0] - ref[:,0], proj.pos[:,1] - ref[:,2])) / \
+                    max(np.max(np.abs(ref[:,[0,2]])), 1e-300)
+            rows.append({'model': dragModel, 'case': (v0, theta, diameter), 'solver': solver, \
+                         'compiled': proj.stats.counters.get('jit kernels', 0) > 0, \
+                         'error': error, 'ok': error <= tolerance, 'time': elapsed})
+    return rows
+
+
+
+### MAIN EXECUTABLE ###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the jit backend against odeint")
+    parser.add_argument('--dt', type=float, default=0.001)
+    parser.add_argument('--tolerance', type=float, default=TOLERANCE, \
+                        help="largest position error relative to the size of the flight")
+    args = parser.parse_args()
+
+    if (not available()):
+        print("Numba is not installed: evolve(..., backend='jit') runs the NumPy integrators")
+    rows = check(dt=args.dt, tolerance=args.tolerance)
+    print("%-12s %-18s %-6s %-9s %11s %10s" % ('model', 'case (v0,theta,D)', 'solver', 'backend', \
+                                                'rel. error', 'time (ms)'))
+    for row in rows:
+        print("%-12s %-18s %-6s %-9s %11.3e %10.3f %s" % (row['model'], str(row['case']), row['solver'], \
+                                                          'jit' if row['compiled'] else 'numpy', row['error'], \
+                                                          1e3*row['time'], '' if row['ok'] else 'FAIL'))
+    sys.exit(0 if all(row['ok'] for row in rows) else 1)
@@ -0,0 +1,310 @@
+"""
+Monte Carlo propagation of launch-parameter uncertainty.
+
+Any basicParams/dragParams field can be given a distribution; samples are
+drawn and solved with PMBatch a chunk at a time, and the spread of range,
+height and flight time is accumulated in streaming form (count, mean and
+variance merged with Chan's formula, min/max and a fixed-bin histogram
+from which quantiles are interpolated), so memory does not grow with the
+number of samples. Chunk k always draws from its own RandomState seeded
+with (seed, k), so results do not depend on how the chunks are spread
+over worker processes, e.g.
+
+    python PMMonteCarlo.py -n 1000000 --drag --dist v0=normal:30:1 \\
+        --dist theta=uniform:40:50 --dist diameter=normal:0.1:0.005
+"""
+
+import sys
+import time
+import argparse
+import multiprocessing
+import numpy as np
+from PMBatch import PMBatch
+from PMCli import ALIASES, BASIC_FIELDS, DRAG_FIELDS
+
+
+OUTPUTS = ('maxRange', 'maxHeight', 'maxTime')
+
+# distribution name -> (number of arguments, sampler)
+DISTRIBUTIONS = {
+    'const': (1, lambda rng, n, value: np.full(n, value)),
+    'normal': (2, lambda rng, n, mean, sd: rng.normal(mean, sd, n)),
+    'uniform': (2, lambda rng, n, low, high: rng.uniform(low, high, n)),
+    'triangular': (3, lambda rng, n, low, mode, high: rng.triangular(low, mode, high, n)),
+    'lognormal': (2, lambda rng, n, mean, sigma: rng.lognormal(mean, sigma, n)),
+}
+
+# samples are clipped into each field's valid range
+LIMITS = {'theta': (0., 180.), 'mass': (0., np.inf), 'v0': (0., np.inf), \
+          'drag coefficient': (0., np.inf), 'diameter': (0., np.inf), 'air density': (0., np.inf)}
+
+
+def parseDistribution(text):
+    """'normal:30:1' -> ('normal', 30., 1.); a bare number is a constant"""
+    parts = text.split(':')
+    if (len(parts) == 1):
+        parts = ['const'] + parts
+    name, args = parts[0], tuple(float(a) for a in parts[1:])
+    if name not in DISTRIBUTIONS:
+        raise ValueError("Unknown distribution: %s" % name)
+    if (len(args) != DISTRIBUTIONS[name][0]):
+        raise ValueError("%s takes %d parameters" % (name, DISTRIBUTIONS[name][0]))
+    return (name,) + args
+
+
+def drawSamples(rng, spec, n):
+    """dict of n samples per field of spec (field -> distribution tuple),
+    drawn in sorted field order so a seed always gives the same values"""
+    samples = {}
+    for field in sorted(spec):
+        dist = spec[field]
+        values = DISTRIBUTIONS[dist[0]][1](rng, n, *dist[1:])
+        if field in LIMITS:
+            values = np.clip(values, *LIMITS[field])
+        samples[field] = values
+    return samples
+
+
+class RunningStats:
+    """Streaming count/mean/variance/min/max and a histogram over fixed
+    bin edges (values outside them are only counted)"""
+
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=float)
+        self.counts = np.zeros(len(self.edges) - 1, dtype=np.int64)
+        self.below = 0
+        self.above = 0
+        # NaN values (launches that never landed)
+        self.missing = 0
+        self.n = 0
+        self.mean = 0.
+        # sum of squared deviations from the mean
+        self.m2 = 0.
+        self.min = np.inf
+        self.max = -np.inf
+
+
+    def add(self, values):
+        """accumulate a chunk of values (NaN are skipped)"""
+        values = np.asarray(values, dtype=float)
+        nan = np.isnan(values)
+        self.missing += int(np.sum(nan))
+        values = values[~nan]
+        if (len(values) == 0):
+            return
+        other = RunningStats(self.edges)
+        other.n = len(values)
+        other.mean = np.mean(values)
+        other.m2 = np.sum(np.square(values - other.mean))
+        other.min = np.min(values)
+        other.max = np.max(values)
+        other.counts = np.histogram(values, self.edges)[0]
+        other.below = int(np.sum(values < self.edges[0]))
+        other.above = int(np.sum(values > self.edges[-1]))
+        self.merge(other)
+
+
+    def merge(self, other):
+        """fold in another RunningStats over the same edges (Chan et al.)"""
+        self.missing += other.missing
+        if (other.n == 0):
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / float(n)
+        self.m2 += other.m2 + delta*delta * self.n * other.n / float(n)
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.counts += other.counts
+        self.below += other.below
+        self.above += other.above
+
+
+    def variance(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.nan
+
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+
+    def quantile(self, q):
+        """q-quantile(s) interpolated linearly within histogram bins; values
+        outside the edges are taken as spread between min/max and the edge"""
+        counts = np.concatenate([[self.below], self.counts, [self.above]])
+        edges = np.concatenate([[min(self.min, self.edges[0])], self.edges, \
+                                [max(self.max, self.edges[-1])]])
+        cumulative = np.concatenate([[0], np.cumsum(counts)])
+        return np.interp(np.asarray(q) * self.n, cumulative, edges)
+
+
+def solveChunk(args):
+    """draw and solve chunk k, returning its RunningStats per output
+    (runs in a worker process)"""
+    seed, k, size, spec, basicParams, dragParams, usingDragForce, dt, edges = args
+    samples = drawSamples(np.random.RandomState([seed, k]), spec, size)
+    batch = PMBatch()
+    # every sample is new, so caching would only grow memory
+    batch.cache = None
+    batch.dt = dt
+    batch.setValues(dict((f, samples.get(f, basicParams[f])) for f in basicParams), \
+                    dict((f, samples.get(f, dragParams[f])) for f in dragParams))
+    res = batch.evolve(usingDragForce, trajectories=False)
+
+    values = dict((name, getattr(res, name)) for name in OUTPUTS)
+    if (edges is None):
+        # the pilot chunk: return the samples themselves to place the bins
+        return k, values
+    stats = {}
+    for name in OUTPUTS:
+        stats[name] = RunningStats(edges[name])
+        stats[name].add(values[name])
+    return k, stats
+
+
+def printProgress(done, total, elapsed):
+    """default progress report: samples done and throughput"""
+    rate = done / elapsed if elapsed > 0 else 0.
+    sys.stderr.write("\r%d/%d samples (%.1f%%), %.0f samples/s" % (done, total, 100.*done/total, rate))
+    if (done == total):
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+
+class PMMonteCarlo:
+
+    CHUNK = 10000
+    # histogram bins per output
+    BINS = 2000
+    # the pilot chunk's spread is widened by this fraction on each side
+    # to place the histogram edges
+    MARGIN = 0.5
+
+    def __init__(self, processes=1, chunkSize=None, seed=0, progress=printProgress):
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+        self.chunkSize = chunkSize if chunkSize is not None else self.CHUNK
+        self.seed = seed
+        self.progress = progress
+        # fixed parameters for the fields that are not sampled
+        batch = PMBatch()
+        self.basicParams = dict((k, float(v[0])) for k, v in batch.basicParams.items())
+        self.dragParams = dict((k, float(v[0])) for k, v in batch.dragParams.items())
+        self.dt = batch.dt
+        # samples/s of the last run
+        self.throughput = 0.
+
+
+    def setValues(self, basicParams=None, dragParams=None):
+        """fixed values for fields without a distribution"""
+        for params, values in ((self.basicParams, basicParams), (self.dragParams, dragParams)):
+            for field, value in (values or {}).items():
+                if field not in params:
+                    raise KeyError("Unknown parameter: %s" % field)
+                params[field] = float(value)
+
+
+    def makeEdges(self, values):
+        """histogram edges around the pilot chunk's values"""
+        edges = {}
+        for name in OUTPUTS:
+            finite = values[name][np.isfinite(values[name])]
+            low, high = (np.min(finite), np.max(finite)) if len(finite) > 0 else (0., 1.)
+            margin = self.MARGIN * max(high - low, 1e-6 * max(abs(high), 1.))
+            edges[name] = np.linspace(low - margin, high + margin, self.BINS + 1)
+        return edges
+
+
+    def run(self, spec, samples, usingDragForce=1):
+        """propagate spec (field -> distribution tuple) through samples
+        launches, returning a dict of RunningStats per output"""
+        for field in spec:
+            if field not in self.basicParams and field not in self.dragParams:
+                raise KeyError("Unknown parameter: %s" % field)
+        sizes = [min(self.chunkSize, samples - start) for start in range(0, samples, self.chunkSize)]
+        args = (spec, self.basicParams, self.dragParams, usingDragForce, self.dt)
+
+        startTime = time.time()
+        # chunk 0 places the histogram edges, then is accumulated like the rest
+        k, pilot = solveChunk((self.seed, 0, sizes[0]) + args + (None,))
+        edges = self.makeEdges(pilot)
+        stats = dict((name, RunningStats(edges[name])) for name in OUTPUTS)
+        for name in OUTPUTS:
+            stats[name].add(pilot[name])
+        done = sizes[0]
+        if (self.progress is not None):
+            self.progress(done, samples, time.time() - startTime)
+
+        tasks = ((self.seed, k, sizes[k]) + args + (edges,) for k in range(1, len(sizes)))
+        if (self.processes <= 1):
+            results = (solveChunk(task) for task in tasks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(self.processes)
+            # in order, so the floating-point merge is reproducible too
+            results = pool.imap(solveChunk, tasks)
+
+        try:
+            for k, chunkStats in results:
+                for name in OUTPUTS:
+                    stats[name].merge(chunkStats[name])
+                done += sizes[k]
+                if (self.progress is not None):
+                    self.progress(done, samples, time.time() - startTime)
+        except:
+            if (pool is not None):
+                pool.terminate()
+            raise
+        if (pool is not None):
+            pool.close()
+            pool.join()
+
+        elapsed = time.time() - startTime
+        self.throughput = samples / elapsed if elapsed > 0 else 0.
+        return stats
+
+
+def summary(stats, quantiles=(0.05, 0.5, 0.95)):
+    """multi-line table of the statistics of every output"""
+    lines = ["%-10s %10s %10s %10s %10s" % ('', 'mean', 'std', 'min', 'max') + \
+             "".join(" %9s" % ('q%g' % (100*q)) for q in quantiles)]
+    for name in OUTPUTS:
+        s = stats[name]
+        lines.append("%-10s %10.4f %10.4f %10.4f %10.4f" % (name, s.mean, s.std(), s.min, s.max) + \
+                     "".join(" %9.4f" % v for v in s.quantile(quantiles)))
+    s = stats[OUTPUTS[0]]
+    lines.append("samples: %d landed, %d did not" % (s.n, s.missing))
+    return "\n".join(lines)
+
+
+
+### MAIN EXECUTABLE ###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Monte Carlo spread of range, height and flight time")
+    parser.add_argument('-n', '--samples', type=int, default=100000)
+    parser.add_argument('--dist', action='append', default=[], metavar='NAME=DIST:ARGS', \
+                        help="distribution of a parameter: normal:mean:sd, uniform:low:high, " \
+                             "triangular:low:mode:high, lognormal:mean:sigma or a constant")
+    parser.add_argument('--drag', action='store_true', help="include air resistance")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--chunk', type=int, default=PMMonteCarlo.CHUNK, help="samples solved per batch")
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--dt', type=float, default=None)
+    args = parser.parse_args()
+
+    mc = PMMonteCarlo(args.processes, args.chunk, args.seed)
+    if (args.dt is not None):
+        mc.dt = args.dt
+    spec = {}
+    for item in args.dist:
+        name, text = item.split('=', 1)
+        name = ALIASES.get(name, name)
+        if name not in BASIC_FIELDS + DRAG_FIELDS:
+            parser.error("unknown parameter: %s" % name)
+        try:
+            spec[name] = parseDistribution(text)
+        except ValueError as err:
+            parser.error(str(err))
+    stats = mc.run(spec, args.samples, int(args.drag))
+    print(summary(stats))
+    sys.stderr.write("%.0f samples/s\n" % mc.throughput)
@@ -0,0 +1,268 @@
+"""
+Many-particle engine for scenes such as fountain jets and debris bursts.
+
+Every particle has its own launch state, drag and launch time, under
+one of the PMForces models. The live particles are kept as one
+(fields, n) array whose rows (x, vx, y, vy, ...) are contiguous, and are
+advanced together by a fixed-step RK4. A particle stops where it crosses
+the ground, and the array is compacted after every step that lands one,
+so later steps only touch live particles, e.g.
+
+    python PMParticles.py --scene fountain -n 20000 --drag --plot
+"""
+
+import time
+import argparse
+import numpy as np
+from collections import OrderedDict
+from PMBatch import PMBatch, PMBatchResult
+import PMAnalytic
+import PMForces
+import PMStats
+
+
+# rows of the live array; the first four are the [x, vx, y, vy] state
+X, VX, Y, VY, ID, BORN, TOP = range(7)
+FIELDS = 7
+
+
+class PMParticles:
+
+    # give up on particles still airborne after this multiple of the
+    # longest drag-free flight time, counted from the last launch
+    MAX_TIME_FACTOR = 10.
+
+    def __init__(self):
+        self.batch = PMBatch()
+        # every scene is new, so caching would only grow memory
+        self.batch.cache = None
+        self.dt = self.batch.dt
+        self.dragModel = 'quadratic'
+        self.modelParams = OrderedDict(PMForces.MODEL_PARAMS)
+        self.instrument = False
+        self.stats = None
+        self.setValues()
+
+
+    def setValues(self, basicParams=None, dragParams=None, launchTimes=None):
+        """Parameters as for PMBatch.setValues, plus the time (s) at which
+        each particle is launched (rounded up to the step grid)"""
+        self.batch.setValues(basicParams, dragParams)
+        n = len(self.batch.state)
+        launch = 0. if launchTimes is None else np.asarray(launchTimes, dtype=float)
+        if (np.any(launch < 0.)):
+            raise ValueError('Launch times must be >= 0')
+        self.launchTimes = np.array(np.broadcast_to(launch, (n,)))
+        self.reset()
+
+
+    def __len__(self):
+        return len(self.launchTimes)
+
+
+    def reset(self, usingDragForce=1):
+        """put every particle back on the launch pad"""
+        n = len(self)
+        self.usingDragForce = usingDragForce
+        self.t = 0.
+        self.steps = 0
+        # particles advanced, summed over steps
+        self.particleSteps = 0
+        self.order = np.argsort(self.launchTimes, kind='mergesort')
+        self.pending = 0
+        self.live = np.zeros((FIELDS, 0))
+        self.maxTime = np.full(n, np.nan)
+        self.maxRange = np.full(n, np.nan)
+        self.maxHeight = np.full(n, np.nan)
+        self.landed = 0
+
+        state = self.batch.state
+        g = self.batch.basicParams['g']
+        # constants for every particle; model holds those of the live ones
+        self.fullModel = PMForces.makeForceModel(self.dragModel, self.batch.basicParams, self.batch.dragParams, \
+                                                 self.modelParams, usingDragForce)
+        self.model = PMForces.selectRows(self.fullModel, np.zeros(0, dtype=int), n)
+        vacuumTime = PMAnalytic.flightTime(state[:,3], state[:,2], g)
+        longest = np.max(np.nan_to_num(vacuumTime)) if n > 0 else 0.
+        last = np.max(self.launchTimes) if n > 0 else 0.
+        self.endTime = last + self.MAX_TIME_FACTOR * (longest + 1.)
+        self.stats = PMStats.PMStats() if self.instrument else None
+
+
+    def done(self):
+        return (self.pending == len(self) and self.live.shape[1] == 0) or self.t >= self.endTime
+
+
+    def launch(self):
+        """append the particles whose launch time has come to the live array"""
+        end = np.searchsorted(self.launchTimes[self.order], self.t + 1e-9 * self.dt, side='right')
+        if (end <= self.pending):
+            return
+        ids = self.order[self.pending:end]
+        self.pending = end
+        state = self.batch.state[ids]
+        new = np.empty((FIELDS, len(ids)))
+        new[X], new[VX], new[Y], new[VY] = state.T
+        new[ID] = ids
+        new[BORN] = self.t
+        # launched level or downward means the apex is the launch point
+        new[TOP] = np.where(new[VY] <= 0., new[Y], np.nan)
+        self.live = np.concatenate([self.live, new], axis=1)
+        self.selectModel()
+
+
+    def selectModel(self):
+        """narrow the force model to the live particles, in their order"""
+        self.model = PMForces.selectRows(self.fullModel, self.live[ID].astype(int), len(self))
+
+
+    def derivs(self, s):
+        """d/dt of the (4, n) states s"""
+        ax, ay = self.model.acceleration(s.T)
+        return np.array([s[1], ax, s[3], ay])
+
+
+    def step(self):
+        """advance the live particles by one RK4 step of dt"""
+        self.launch()
+        live = self.live
+        h = self.dt
+        self.steps += 1
+        self.particleSteps += live.shape[1]
+        if (live.shape[1] == 0):
+            self.t += h
+            return
+
+        start = time.time() if self.stats is not None else 0.
+        s = live[0:4]
+        k1 = self.derivs(s)
+        k2 = self.derivs(s + 0.5*h*k1)
+        k3 = self.derivs(s + 0.5*h*k2)
+        k4 = self.derivs(s + h*k3)
+        x1, vx1, y1, vy1 = s + h/6. * (k1 + 2.*(k2 + k3) + k4)
+        vy = live[VY]
+
+        # apex lies where vy changes sign
+        peak = (vy > 0.) & (vy1 <= 0.)
+        if (np.any(peak)):
+            frac = vy[peak] / (vy[peak] - vy1[peak])
+            live[TOP,peak] = live[Y,peak] + frac*(y1[peak] - live[Y,peak])
+
+        # a particle has landed once it is below ground on the way down
+        hit = (y1 < 0.) & (vy1 < 0.)
+        if (np.any(hit)):
+            # ground impact lies between the old and new positions
+            frac = live[Y,hit] / (live[Y,hit] - y1[hit])
+            ids = live[ID,hit].astype(int)
+            self.maxTime[ids] = self.t + frac*h - live[BORN,hit]
+            self.maxRange[ids] = live[X,hit] + frac*(x1[hit] - live[X,hit])
+            self.maxHeight[ids] = live[TOP,hit]
+            self.landed += len(ids)
+
+        live[X], live[VX], live[Y], live[VY] = x1, vx1, y1, vy1
+        if (self.stats is not None):
+            self.stats.add('step', time.time() - start)
+        if (np.any(hit)):
+            # compact: later steps only touch live particles
+            start = time.time() if self.stats is not None else 0.
+            self.live = live[:,~hit]
+            self.selectModel()
+            if (self.stats is not None):
+                self.stats.add('compact', time.time() - start)
+        self.t += h
+
+
+    def positions(self):
+        """(x, y) copies of the live particles' positions"""
+        return self.live[X].copy(), self.live[Y].copy()
+
+
+    def frames(self, frameDt=None, usingDragForce=1):
+        """generator of (t, x, y) every frameDt (at least one step) from
+        launch until the last particle has landed"""
+        self.reset(usingDragForce)
+        every = max(1, int(round(frameDt / self.dt))) if frameDt is not None else 1
+        self.launch()
+        x, y = self.positions()
+        yield self.t, x, y
+        while (not self.done()):
+            for i in range(every):
+                self.step()
+                if (self.done()):
+                    break
+            x, y = self.positions()
+            yield self.t, x, y
+
+
+    def evolve(self, usingDragForce=1):
+        """run the scene to the end, returning the flight time, range and
+        height of every particle (NaN for those still airborne)"""
+        self.reset(usingDragForce)
+        while (not self.done()):
+            self.step()
+        if (self.stats is not None):
+            self.stats.count('steps', self.steps)
+            self.stats.count('particle steps', self.particleSteps)
+        lengths = np.where(np.isnan(self.maxTime), 0, np.ceil(np.nan_to_num(self.maxTime) / self.dt)).astype(int)
+        return PMBatchResult(None, None, None, lengths, self.maxTime, self.maxRange, self.maxHeight)
+
+
+def fountainScene(n, rng, v0=20., theta=80., spread=4., duration=5., diameter=0.01):
+    """(basicParams, dragParams, launchTimes) of a jet emitting n droplets
+    of varying size evenly over duration seconds"""
+    basic = {'v0': rng.normal(v0, 0.05*v0, n), 'theta': np.clip(rng.normal(theta, spread, n), 0., 180.), \
+             'x0': 0., 'y0': 0.}
+    drag = {'diameter': rng.lognormal(np.log(diameter), 0.5, n), 'drag coefficient': 0.47}
+    return basic, drag, np.linspace(0., duration, n)
+
+
+def burstScene(n, rng, v0=40., height=50., diameter=0.05):
+    """(basicParams, dragParams, launchTimes) of n fragments of varying
+    size and speed thrown upwards from one point at t = 0"""
+    basic = {'v0': v0 * rng.uniform(0.2, 1., n), 'theta': rng.uniform(0., 180., n), \
+             'x0': 0., 'y0': height}
+    drag = {'diameter': rng.lognormal(np.log(diameter), 0.8, n), 'drag coefficient': 1.0}
+    return basic, drag, 0.
+
+
+SCENES = {'fountain': fountainScene, 'burst': burstScene}
+
+
+
+### MAIN EXECUTABLE ###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate a scene of many projectiles")
+    parser.add_argument('--scene', choices=sorted(SCENES), default='fountain')
+    parser.add_argument('-n', '--particles', type=int, default=20000)
+    parser.add_argument('--drag', action='store_true', help="include air resistance")
+    parser.add_argument('--model', choices=list(PMForces.MODELS), default='quadratic', help="drag model")
+    parser.add_argument('--dt', type=float, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--plot', action='store_true', help="animate the scene")
+    args = parser.parse_args()
+
+    particles = PMParticles()
+    particles.dragModel = args.model
+    if (args.dt is not None):
+        particles.dt = args.dt
+    basic, drag, launchTimes = SCENES[args.scene](args.particles, np.random.RandomState(args.seed))
+    particles.setValues(basic, drag, launchTimes)
+
+    if (args.plot):
+        import matplotlib.pyplot as plt
+        from PMPlots import PMScenePlot
+        scene = PMScenePlot(particles, usingDragForce=int(args.drag))
+        scene.run()
+        plt.show()
+    else:
+        particles.instrument = True
+        start = time.time()
+        res = particles.evolve(int(args.drag))
+        elapsed = time.time() - start
+        print("%d particles, %d landed, mean range %.3f m, mean height %.3f m" % \
+              (len(particles), particles.landed, np.nanmean(res.maxRange), np.nanmean(res.maxHeight)))
+        print("%d steps, %d particle steps (%.1f%% of %d x %d) in %.2f s" % \
+              (particles.steps, particles.particleSteps, \
+               100. * particles.particleSteps / max(particles.steps * len(particles), 1), \
+               particles.steps, len(particles), elapsed))
+        print(particles.stats.summary())
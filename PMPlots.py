@@ -1,40 +1,95 @@
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animation
+import PMAnalytic
+import PMStats
 
 class PMPlots:
 
     SCALE_FACTOR = 1.05
 
-    def __init__(self, pm, plot_type):
+    # (x label, y label, title) for each plot type
+    PLOT_LABELS = {'y_vs_x': ("Horizontal position (m)", "Vertical position (m)", \
+                              "Vertical Position vs. Horizontal Position"),
+                   'x_vs_t': ("Time (s)", "Horizontal position (m)", "Horizontal Position vs. Time"),
+                   'y_vs_t': ("Time (s)", "Vertical position (m)", "Vertical Position vs. Time"),
+                   'fx_vs_t': ("Time (s)", "Horizontal force (N)", "Horizontal Force vs. Time"),
+                   'fy_vs_t': ("Time (s)", "Vertical force (N)", "Vertical Force vs. Time"),
+                   'px_vs_t': ("Time (s)", "Horizontal momentum (kgm/s)", "Horizontal Momentum vs. Time"),
+                   'py_vs_t': ("Time (s)", "Vertical momentum (N)", "Vertical Momentum vs. Time"),
+                   'K_vs_t': ("Time (s)", "Kinetic energy (J)", "Kinetic Energy vs. Time"),
+                   'U_vs_t': ("Time (s)", "Potential energy (J)", "Potential Energy vs. Time"),
+                   'E_vs_t': ("Time (s)", "Total energy (J)", "Total Energy vs. Time")}
+    PLOT_ORDER = ('y_vs_x', 'x_vs_t', 'y_vs_t', 'fx_vs_t', 'fy_vs_t', \
+                  'px_vs_t', 'py_vs_t', 'K_vs_t', 'U_vs_t', 'E_vs_t')
+
+    def __init__(self, pm, plot_type, ax=None):
 
         self.pm = pm
         self.intervalTime = 3000*pm.dt
         self.plot_type = plot_type
-        self.fig, self.ax = plt.subplots()
+        if (ax is None):
+            self.fig, self.ax = plt.subplots()
+        else:
+            # draw into a panel of someone else's figure
+            self.fig, self.ax = ax.figure, ax
         self.line, = self.ax.plot([], [], 'k-')
         self.time_text = self.ax.text(0.02, 0.95, '', transform=self.ax.transAxes)
         self.ax.grid(True)
 
 
     def set_data(self, i, x, y):
+        return PMStats.timed(getattr(self.pm, 'stats', None), 'set_data', self.updateFrame, i, x, y)
+
+
+    def updateFrame(self, i, x, y):
+        # frame i shows time i*dt, whatever the spacing of the samples
         t = self.pm.t
-        
-        self.line.set_data(x[0:i+1], y[0:i+1])
-        self.time_text.set_text('time = %.3f (s)' % t[i])
+        time = min(i*self.pm.dt, t[-1])
+        idx = max(0, np.searchsorted(t, time, side='right') - 1)
+
+        self.line.set_data(*self.curveUpTo(t, x, y, 0, idx, time))
+        self.time_text.set_text('time = %.3f (s)' % time)
         return self.line, self.time_text
 
 
+    @staticmethod
+    def curveUpTo(t, x, y, start, idx, time):
+        """samples start..idx plus the point interpolated at time, so
+        sparse (decimated) samples still advance smoothly"""
+        if (idx >= len(t) - 1 or time <= t[idx]):
+            return x[start:idx+1], y[start:idx+1]
+        frac = (time - t[idx]) / (t[idx+1] - t[idx])
+        tipX = x[idx] + frac*(x[idx+1] - x[idx])
+        tipY = y[idx] + frac*(y[idx+1] - y[idx])
+        return np.append(x[start:idx+1], tipX), np.append(y[start:idx+1], tipY)
+
+
     def runSimulation(self):
 
         t = self.pm.t
-        timeIdxs = np.arange(t.size)
-        
-        if (self.plot_type == 'y_vs_x'):
-            self.ax.set_xlabel("Horizontal position (m)")
-            self.ax.set_ylabel("Vertical position (m)")
-            self.ax.set_title("Vertical Position vs. Horizontal Position")
+        # one frame per dt of simulated time (one per sample on the dt grid)
+        timeIdxs = np.arange(int(np.ceil(t[-1] / self.pm.dt - 1e-9)) + 1)
+        x, y = PMStats.timed(getattr(self.pm, 'stats', None), 'plot setup', self.prepare)
+
+        ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
+                                          fargs=(x,y), interval=self.intervalTime, \
+                                          blit=True, repeat=False)
+        return ani
+
 
+    def setLabels(self):
+        xlabel, ylabel, title = self.PLOT_LABELS[self.plot_type]
+        self.ax.set_xlabel(xlabel)
+        self.ax.set_ylabel(ylabel)
+        self.ax.set_title(title)
+
+
+    def prepare(self):
+        """Label the axes, set their limits from the evolved run and
+        return the (x, y) series to animate"""
+        self.setLabels()
+        if (self.plot_type == 'y_vs_x'):
             x = self.pm.pos[:,0]
             y = self.pm.pos[:,1]
 
@@ -50,15 +105,9 @@ class PMPlots:
             self.ax.set_xlim(min_x, max_x)
             self.ax.set_ylim(min_y, max_y)
 
-            ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
-                                              fargs=(x,y), interval=self.intervalTime, \
-                                              blit=True, repeat=False)
+            data = (x, y)
 
         elif (self.plot_type == 'x_vs_t'):
-            self.ax.set_xlabel("Time (s)")
-            self.ax.set_ylabel("Horizontal position (m)")
-            self.ax.set_title("Horizontal Position vs. Time")
-
             t = self.pm.t
             x = self.pm.pos[:,0]
             y = self.pm.pos[:,1]
@@ -70,15 +119,9 @@ class PMPlots:
             self.ax.set_xlim(0, np.max(t)*self.SCALE_FACTOR)
             self.ax.set_ylim(min_pos, max_pos)
 
-            ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
-                                              fargs=(t,x), interval=self.intervalTime, \
-                                              blit=True, repeat=False)
+            data = (t, x)
 
         elif (self.plot_type == 'y_vs_t'):
-            self.ax.set_xlabel("Time (s)")
-            self.ax.set_ylabel("Vertical position (m)")
-            self.ax.set_title("Vertical Position vs. Time")
-
             t = self.pm.t
             x = self.pm.pos[:,0]
             y = self.pm.pos[:,1]
@@ -90,15 +133,9 @@ class PMPlots:
             self.ax.set_xlim(0, np.max(t)*self.SCALE_FACTOR)
             self.ax.set_ylim(0, max_pos)
 
-            ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
-                                              fargs=(t,y), interval=self.intervalTime, \
-                                              blit=True, repeat=False)
+            data = (t, y)
 
         elif (self.plot_type == 'fx_vs_t'):
-            self.ax.set_xlabel("Time (s)")
-            self.ax.set_ylabel("Horizontal force (N)")
-            self.ax.set_title("Horizontal Force vs. Time")
-
             t = self.pm.t
             fx = self.pm.F[:,0]
             fy = self.pm.F[:,1]
@@ -110,15 +147,9 @@ class PMPlots:
             self.ax.set_xlim(0, np.max(t)*self.SCALE_FACTOR)
             self.ax.set_ylim(min_force, max_force)
 
-            ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
-                                              fargs=(t,fx), interval=self.intervalTime, \
-                                              blit=True, repeat=False)
+            data = (t, fx)
 
         elif (self.plot_type == 'fy_vs_t'):
-            self.ax.set_xlabel("Time (s)")
-            self.ax.set_ylabel("Vertical force (N)")
-            self.ax.set_title("Vertical Force vs. Time")
-
             t = self.pm.t
             fx = self.pm.F[:,0]
             fy = self.pm.F[:,1]
@@ -130,15 +161,9 @@ class PMPlots:
             self.ax.set_xlim(0, np.max(t)*self.SCALE_FACTOR)
             self.ax.set_ylim(min_force, max_force)
 
-            ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
-                                              fargs=(t,fy), interval=self.intervalTime, \
-                                              blit=True, repeat=False)
+            data = (t, fy)
 
         elif (self.plot_type == 'px_vs_t'):
-            self.ax.set_xlabel("Time (s)")
-            self.ax.set_ylabel("Horizontal momentum (kgm/s)")
-            self.ax.set_title("Horizontal Momentum vs. Time")
-
             t = self.pm.t
             px = self.pm.p[:,0]
             py = self.pm.p[:,1]
@@ -150,15 +175,9 @@ class PMPlots:
             self.ax.set_xlim(0, np.max(t)*self.SCALE_FACTOR)
             self.ax.set_ylim(min_momentum, max_momentum)
 
-            ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
-                                              fargs=(t,px), interval=self.intervalTime, \
-                                              blit=True, repeat=False)
+            data = (t, px)
 
         elif (self.plot_type == 'py_vs_t'):
-            self.ax.set_xlabel("Time (s)")
-            self.ax.set_ylabel("Vertical momentum (N)")
-            self.ax.set_title("Vertical Momentum vs. Time")
-
             t = self.pm.t
             px = self.pm.p[:,0]
             py = self.pm.p[:,1]
@@ -170,15 +189,9 @@ class PMPlots:
             self.ax.set_xlim(0, np.max(t)*self.SCALE_FACTOR)
             self.ax.set_ylim(min_momentum, max_momentum)
 
-            ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
-                                              fargs=(t,py), interval=self.intervalTime, \
-                                              blit=True, repeat=False)
+            data = (t, py)
 
         elif (self.plot_type == 'K_vs_t'):
-            self.ax.set_xlabel("Time (s)")
-            self.ax.set_ylabel("Kinetic energy (J)")
-            self.ax.set_title("Kinetic Energy vs. Time")
-
             t = self.pm.t
             K = self.pm.K
             U = self.pm.U
@@ -191,15 +204,9 @@ class PMPlots:
             self.ax.set_xlim(0, np.max(t)*self.SCALE_FACTOR)
             self.ax.set_ylim(min_energy, max_energy)
 
-            ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
-                                              fargs=(t,K), interval=self.intervalTime, \
-                                              blit=True, repeat=False)
+            data = (t, K)
 
         elif (self.plot_type == 'U_vs_t'):
-            self.ax.set_xlabel("Time (s)")
-            self.ax.set_ylabel("Potential energy (J)")
-            self.ax.set_title("Potential Energy vs. Time")
-
             t = self.pm.t
             K = self.pm.K
             U = self.pm.U
@@ -212,15 +219,9 @@ class PMPlots:
             self.ax.set_xlim(0, np.max(t)*self.SCALE_FACTOR)
             self.ax.set_ylim(min_energy, max_energy)
 
-            ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
-                                              fargs=(t,U), interval=self.intervalTime, \
-                                              blit=True, repeat=False)
+            data = (t, U)
 
         elif (self.plot_type == 'E_vs_t'):
-            self.ax.set_xlabel("Time (s)")
-            self.ax.set_ylabel("Total energy (J)")
-            self.ax.set_title("Total Energy vs. Time")
-
             t = self.pm.t
             K = self.pm.K
             U = self.pm.U
@@ -233,11 +234,82 @@ class PMPlots:
             self.ax.set_xlim(0, np.max(t)*self.SCALE_FACTOR)
             self.ax.set_ylim(min_energy, max_energy)
 
-            ani = animation.FuncAnimation(self.fig, self.set_data, frames=timeIdxs, \
-                                              fargs=(t,E), interval=self.intervalTime, \
-                                              blit=True, repeat=False)
+            data = (t, E)
+
+        return data
+
+
+    def selectData(self, data):
+        """(x, y) series of this plot type from a dict of t/pos/p/K/U/F arrays"""
+        t = data['t']
+        series = {'y_vs_x': lambda: (data['pos'][:,0], data['pos'][:,1]),
+                  'x_vs_t': lambda: (t, data['pos'][:,0]),
+                  'y_vs_t': lambda: (t, data['pos'][:,1]),
+                  'fx_vs_t': lambda: (t, data['F'][:,0]),
+                  'fy_vs_t': lambda: (t, data['F'][:,1]),
+                  'px_vs_t': lambda: (t, data['p'][:,0]),
+                  'py_vs_t': lambda: (t, data['p'][:,1]),
+                  'K_vs_t': lambda: (t, data['K']),
+                  'U_vs_t': lambda: (t, data['U']),
+                  'E_vs_t': lambda: (t, data['K'] + data['U'])}
+        return series[self.plot_type]()
+
+
+    def analyticLimits(self):
+        """cheap (xlim, ylim) guesses from the drag-free flight, which bounds
+        the flight time, range and height when drag is on"""
+        x0, v0x, y0, v0y = self.pm.state
+        g = self.pm.basicParams['g']
+        flightTime = float(PMAnalytic.flightTime(v0y, y0, g))
+        maxHeight = float(PMAnalytic.apex(v0y, y0, g)[1])
+        xRange = self.findMinMax(min(x0, x0 + v0x*flightTime), max(x0, x0 + v0x*flightTime))
+        yRange = self.findMinMax(min(0., y0), maxHeight)
+        tRange = (0, flightTime*self.SCALE_FACTOR)
 
-        return ani
+        if (self.plot_type == 'y_vs_x'):
+            return xRange, yRange
+        elif (self.plot_type == 'x_vs_t'):
+            return tRange, xRange
+        elif (self.plot_type == 'y_vs_t'):
+            return tRange, yRange
+        # the other quantities get their limits from the data
+        return tRange, None
+
+
+    def growLimits(self, x, y):
+        """widen the axes when new data falls outside them"""
+        grown = False
+        for getLim, setLim, vals in ((self.ax.get_xlim, self.ax.set_xlim, x), \
+                                     (self.ax.get_ylim, self.ax.set_ylim, y)):
+            lo, hi = getLim()
+            vmin, vmax = np.min(vals), np.max(vals)
+            if (vmin < lo or vmax > hi):
+                setLim(*self.findMinMax(min(lo, vmin), max(hi, vmax)))
+                grown = True
+        return grown
+
+
+    def prepareStream(self):
+        """Label the axes and take the limits from analytic bounds, for
+        data that will only arrive as a stream"""
+        self.setLabels()
+
+        xlim, ylim = self.analyticLimits()
+        self.ax.set_xlim(*xlim)
+        if (ylim is not None):
+            self.ax.set_ylim(*ylim)
+        self.limitsFromData = ylim is None
+
+
+    def addStreamChunk(self, chunk):
+        """(x, y) series of a new chunk, widening the axes for it;
+        also returns whether the limits changed"""
+        x, y = self.selectData(chunk)
+        if (self.limitsFromData):
+            # first chunk seeds the data-driven limits
+            self.ax.set_ylim(*self.findMinMax(np.min(y), np.max(y)))
+            self.limitsFromData = False
+        return x, y, self.growLimits(x, y)
 
 
     def findMinMax(self, minVal, maxVal):
@@ -253,5 +325,232 @@ class PMPlots:
             maxVal = maxVal*self.SCALE_FACTOR
 
         return minVal, maxVal
-            
-        
+
+
+class PMMultiPlots:
+    """Every selected plot type as a panel of one figure, advanced by a
+    single timer. Frames are decimated to a fixed rate whatever dt is, and
+    each frame only draws the samples that are new since the last one."""
+
+    FPS = 30
+
+    # simulated seconds per wall-clock second; PMPlots shows one
+    # sample of length dt every 3000*dt ms
+    PLAYBACK_RATE = 1.0 / 3.0
+
+    def __init__(self, pm, plot_types, fps=None):
+        self.pm = pm
+        self.fps = fps if fps is not None else self.FPS
+        self.frameTime = self.PLAYBACK_RATE / self.fps
+
+        n = len(plot_types)
+        cols = int(np.ceil(np.sqrt(n)))
+        rows = int(np.ceil(n / float(cols)))
+        self.fig, axes = plt.subplots(rows, cols, squeeze=False, figsize=(4.5*cols, 3.5*rows))
+        axes = axes.ravel()
+        for ax in axes[n:]:
+            ax.set_visible(False)
+
+        canvas = self.fig.canvas
+        self.canBlit = getattr(canvas, 'supports_blit', False) and hasattr(canvas, 'copy_from_bbox')
+
+        self.panels = [PMPlots(pm, plot_type, ax=ax) for plot_type, ax in zip(plot_types, axes)]
+        for panel in self.panels:
+            # when blitting, only the newest piece of each curve is drawn per frame
+            panel.segment, = panel.ax.plot([], [], 'k-', animated=self.canBlit)
+            panel.time_text.set_animated(self.canBlit)
+        self.backgrounds = None
+        self.timer = None
+        self.stream = None
+        self.t = np.zeros(0)
+        self.frame = 0
+        self.lastIdx = 0
+
+
+    def run(self):
+        """Animate the arrays of an already evolved ProjectileMotion"""
+        self.t = self.pm.t
+        stats = getattr(self.pm, 'stats', None)
+        for panel in self.panels:
+            panel.x, panel.y = PMStats.timed(stats, 'plot setup', panel.prepare)
+        return self.start()
+
+
+    def runStream(self, stream):
+        """Animate from an evolveStream generator as its chunks arrive"""
+        self.stream = iter(stream)
+        for panel in self.panels:
+            panel.prepareStream()
+            panel.x, panel.y = np.zeros(0), np.zeros(0)
+        self.pullChunk()
+        return self.start()
+
+
+    def start(self):
+        self.fig.tight_layout()
+        self.fig.canvas.mpl_connect('draw_event', self.onDraw)
+        self.timer = self.fig.canvas.new_timer(interval=1000.0 / self.fps)
+        self.timer.add_callback(self.step)
+        self.timer.start()
+        return self
+
+
+    def pullChunk(self):
+        """append the next streamed chunk; False once the stream is done or
+        when it yields None, meaning the next chunk is not ready yet"""
+        try:
+            chunk = next(self.stream)
+        except StopIteration:
+            self.stream = None
+            return False
+        if (chunk is None):
+            return False
+
+        grown = False
+        for panel in self.panels:
+            x, y, panelGrown = panel.addStreamChunk(chunk)
+            panel.x = np.concatenate([panel.x, x])
+            panel.y = np.concatenate([panel.y, y])
+            grown = grown or panelGrown
+        self.t = np.concatenate([self.t, chunk['t']])
+        if (grown):
+            # new limits need a full redraw, which refreshes the backgrounds
+            self.fig.canvas.draw_idle()
+            self.backgrounds = None
+        return True
+
+
+    def onDraw(self, event):
+        """a full redraw (first show, resize, new limits) shows the curves so
+        far, so save it as the background the next frames are blitted onto"""
+        stats = getattr(self.pm, 'stats', None)
+        if (stats is not None):
+            stats.count('full redraws')
+        if (self.canBlit):
+            # frames only blit their new segments, so bring each curve up
+            # to date (views, no copies) before saving the background
+            for panel in self.panels:
+                panel.line.set_data(panel.x[0:self.lastIdx+1], panel.y[0:self.lastIdx+1])
+                panel.ax.draw_artist(panel.line)
+            self.backgrounds = [self.fig.canvas.copy_from_bbox(panel.ax.bbox) for panel in self.panels]
+
+
+    def frameIndex(self, frame):
+        """last sample at or before this frame's time (works for any t grid)"""
+        return max(0, np.searchsorted(self.t, frame * self.frameTime, side='right') - 1)
+
+
+    def step(self):
+        """advance every panel by one frame"""
+        if (len(self.t) == 0 and (self.stream is None or not self.pullChunk())):
+            # the clock starts with the first chunk
+            if (self.stream is None and self.timer is not None):
+                self.timer.stop()
+            return self.stream is None
+        self.frame += 1
+        idx = self.frameIndex(self.frame)
+        while (self.stream is not None and idx >= len(self.t) - 1):
+            if not self.pullChunk():
+                break
+            idx = self.frameIndex(self.frame)
+
+        done = self.stream is None and idx >= len(self.t) - 1
+        idx = min(idx, len(self.t) - 1)
+        stats = getattr(self.pm, 'stats', None)
+        PMStats.timed(stats, 'render frame', self.drawFrame, idx, min(self.frame * self.frameTime, self.t[-1]))
+        if (stats is not None):
+            stats.count('frames')
+        if (done and self.timer is not None):
+            self.timer.stop()
+        return done
+
+
+    def drawFrame(self, idx, time=None):
+        if (time is None):
+            time = self.t[idx]
+        start = self.lastIdx
+        canvas = self.fig.canvas
+        blit = self.canBlit and self.backgrounds is not None
+        for k, panel in enumerate(self.panels):
+            panel.time_text.set_text('time = %.3f (s)' % time)
+            if (not blit):
+                # the persistent line only matters for full redraws (see onDraw)
+                panel.line.set_data(*PMPlots.curveUpTo(self.t, panel.x, panel.y, 0, idx, time))
+            else:
+                canvas.restore_region(self.backgrounds[k])
+                # the tip lies on the chord to the next sample, so it can join the background
+                panel.segment.set_data(*PMPlots.curveUpTo(self.t, panel.x, panel.y, start, idx, time))
+                panel.ax.draw_artist(panel.segment)
+                # keep the new piece in the background for the next frame
+                self.backgrounds[k] = canvas.copy_from_bbox(panel.ax.bbox)
+                panel.ax.draw_artist(panel.time_text)
+                canvas.blit(panel.ax.bbox)
+        if (not blit):
+            canvas.draw_idle()
+        self.lastIdx = idx
+
+
+class PMScenePlot:
+    """All particles of a PMParticles scene as a single artist, with the
+    landing spots as a second one. Both are blitted on fixed axes set from
+    the drag-free bounds, so a frame costs one pass over the live points."""
+
+    FPS = 30
+    SCALE_FACTOR = PMPlots.SCALE_FACTOR
+
+    def __init__(self, particles, usingDragForce=1, frameDt=None, ax=None):
+        self.particles = particles
+        self.usingDragForce = usingDragForce
+        # real-time playback unless told otherwise
+        self.frameDt = frameDt if frameDt is not None else 1. / self.FPS
+        if (ax is None):
+            self.fig, self.ax = plt.subplots()
+        else:
+            self.fig, self.ax = ax.figure, ax
+        self.ax.set_xlabel("Horizontal position (m)")
+        self.ax.set_ylabel("Vertical position (m)")
+        self.ax.set_title("%d Projectiles" % len(particles))
+        self.ax.grid(True)
+        # pixel markers are the cheapest to draw in bulk
+        self.dots, = self.ax.plot([], [], 'b,', animated=True)
+        self.spots, = self.ax.plot([], [], 'r|', markersize=4, animated=True)
+        self.time_text = self.ax.text(0.02, 0.95, '', transform=self.ax.transAxes, animated=True)
+        self.setLimits()
+
+
+    def setLimits(self):
+        """drag only shortens flights, so the drag-free ones bound the scene"""
+        state = self.particles.batch.state
+        if (len(state) == 0):
+            return
+        g = self.particles.batch.basicParams['g']
+        T = np.nan_to_num(PMAnalytic.flightTime(state[:,3], state[:,2], g))
+        x = np.concatenate([state[:,0], state[:,0] + state[:,1]*T])
+        apexTime, maxHeight = PMAnalytic.apex(state[:,3], state[:,2], g)
+        min_x, max_x = np.min(x), np.max(x)
+        pad = (self.SCALE_FACTOR - 1.) * max(max_x - min_x, 1e-3)
+        self.ax.set_xlim(min_x - pad, max_x + pad)
+        self.ax.set_ylim(min(0., np.min(state[:,2])), self.SCALE_FACTOR * max(np.max(maxHeight), 1e-3))
+
+
+    def set_data(self, frame):
+        return PMStats.timed(self.particles.stats, 'render frame', self.updateFrame, frame)
+
+
+    def updateFrame(self, frame):
+        t, x, y = frame
+        self.dots.set_data(x, y)
+        ranges = self.particles.maxRange
+        ranges = ranges[np.isfinite(ranges)]
+        self.spots.set_data(ranges, np.zeros(len(ranges)))
+        self.time_text.set_text('time = %.2f (s)  airborne %d  landed %d' % \
+                                (t, len(x), self.particles.landed))
+        return self.dots, self.spots, self.time_text
+
+
+    def run(self):
+        """animate the scene, stepping the engine as frames are drawn"""
+        frames = self.particles.frames(self.frameDt, self.usingDragForce)
+        self.ani = animation.FuncAnimation(self.fig, self.set_data, frames=frames, \
+                                           interval=1000. / self.FPS, blit=True, repeat=False)
+        return self.ani
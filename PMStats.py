@@ -0,0 +1,100 @@
+"""
+Optional instrumentation for simulation runs.
+
+A PMStats object collects per-phase wall times, solver counters (RHS and
+Jacobian evaluations, steps) and the sizes of the arrays a run produced.
+Instrumented code calls the module functions with stats=None when
+instrumentation is off, which costs a single test.
+"""
+
+import time
+from collections import OrderedDict
+
+
+class PMStats:
+    """Per-phase timings, counters and array sizes of one run"""
+
+    def __init__(self):
+        # phase name -> [seconds, calls]
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+        # array name -> (shape, bytes)
+        self.arrays = OrderedDict()
+
+
+    def add(self, name, seconds):
+        entry = self.phases.setdefault(name, [0., 0])
+        entry[0] += seconds
+        entry[1] += 1
+
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+
+    def recordArrays(self, obj, names):
+        """shape and size of the named array attributes of obj"""
+        for name in names:
+            value = getattr(obj, name, None)
+            if hasattr(value, 'nbytes'):
+                self.arrays[name] = (value.shape, value.nbytes)
+
+
+    def recordOdeint(self, info):
+        """counters from an odeint full_output dict"""
+        self.count('rhs evaluations', int(info['nfe'][-1]))
+        self.count('jacobian evaluations', int(info['nje'][-1]))
+        self.count('solver steps', int(info['nst'][-1]))
+
+
+    def totalTime(self):
+        return sum(seconds for seconds, calls in self.phases.values())
+
+
+    def totalBytes(self):
+        return sum(nbytes for shape, nbytes in self.arrays.values())
+
+
+    def asDict(self):
+        return {'phases': dict((k, {'seconds': v[0], 'calls': v[1]}) for k, v in self.phases.items()), \
+                'counters': dict(self.counters), \
+                'arrays': dict((k, {'shape': list(v[0]), 'bytes': v[1]}) for k, v in self.arrays.items())}
+
+
+    def summary(self):
+        """multi-line, human-readable report"""
+        lines = ["%-24s %10s %7s" % ('phase', 'time (ms)', 'calls')]
+        for name, (seconds, calls) in self.phases.items():
+            lines.append("%-24s %10.3f %7d" % (name, 1e3*seconds, calls))
+        lines.append("%-24s %10.3f" % ('total', 1e3*self.totalTime()))
+        if (len(self.counters) > 0):
+            lines.append("")
+            for name, value in self.counters.items():
+                lines.append("%-24s %10d" % (name, value))
+        if (len(self.arrays) > 0):
+            lines.append("")
+            for name, (shape, nbytes) in self.arrays.items():
+                lines.append("%-8s %-15s %10.1f kB" % (name, shape, nbytes / 1024.))
+            lines.append("%-24s %10.1f kB" % ('total', self.totalBytes() / 1024.))
+        return "\n".join(lines)
+
+
+class PMResults(tuple):
+    """(maxTime, maxRange, maxHeight) carrying the run's stats (None when
+    instrumentation is off), so existing unpacking keeps working"""
+
+    def __new__(cls, results, stats=None):
+        self = tuple.__new__(cls, results)
+        self.stats = stats
+        return self
+
+
+def timed(stats, name, func, *args, **kwargs):
+    """func(*args, **kwargs), adding its wall time to the named phase"""
+    if (stats is None):
+        return func(*args, **kwargs)
+    start = time.time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        stats.add(name, time.time() - start)
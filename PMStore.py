@@ -0,0 +1,209 @@
+"""
+Columnar on-disk store for trajectory datasets.
+
+A store is a directory holding one raw binary file per column (t, pos,
+v, p, K, U, F), every trajectory's samples concatenated in run order, a
+parameter table with one structured row per run, an index of (start,
+length) per run and a small JSON header. Runs are appended incrementally;
+the reader memory-maps every file, so one trajectory, or one column over
+millions of runs, is read without touching the rest.
+"""
+
+import os
+import json
+import numpy as np
+from collections import OrderedDict
+
+
+# column name -> values per sample
+COLUMNS = OrderedDict([('t', 1), ('pos', 2), ('v', 2), ('p', 2), ('K', 1), ('U', 1), ('F', 2)])
+
+# one row per run: the launch parameters and the summary results
+PARAMS_DTYPE = np.dtype([('mass', 'f8'), ('g', 'f8'), ('v0', 'f8'), ('theta', 'f8'), \
+                         ('x0', 'f8'), ('y0', 'f8'), ('dragCoefficient', 'f8'), ('diameter', 'f8'), \
+                         ('airDensity', 'f8'), ('usingDragForce', 'i1'), \
+                         ('maxTime', 'f8'), ('maxRange', 'f8'), ('maxHeight', 'f8')])
+
+INDEX_DTYPE = np.dtype([('start', '<i8'), ('length', '<i8')])
+
+HEADER = 'header.json'
+PARAMS = 'params.bin'
+INDEX = 'index.bin'
+VERSION = 1
+
+
+def columnPath(path, name):
+    return os.path.join(path, name + '.bin')
+
+
+def readHeader(path):
+    with open(os.path.join(path, HEADER)) as f:
+        header = json.load(f)
+    if (header['version'] != VERSION):
+        raise ValueError("Unsupported store version: %s" % header['version'])
+    return header
+
+
+def paramsRows(basicParams, dragParams, usingDragForce, maxTime, maxRange, maxHeight):
+    """PARAMS_DTYPE rows from (broadcastable) ProjectileMotion-style parameters"""
+    fields = [basicParams['mass'], basicParams['g'], basicParams['v0'], basicParams['theta'], \
+              basicParams['x0'], basicParams['y0'], dragParams['drag coefficient'], \
+              dragParams['diameter'], dragParams['air density'], usingDragForce, \
+              maxTime, maxRange, maxHeight]
+    fields = np.broadcast_arrays(*[np.atleast_1d(f) for f in fields])
+    rows = np.zeros(len(fields[0]), dtype=PARAMS_DTYPE)
+    for name, value in zip(PARAMS_DTYPE.names, fields):
+        rows[name] = value
+    return rows
+
+
+class PMStoreWriter:
+    """Appends runs to a new or existing store directory"""
+
+    def __init__(self, path, dtype=np.float64, paramsDtype=PARAMS_DTYPE):
+        self.path = path
+        if os.path.exists(os.path.join(path, HEADER)):
+            # keep appending with whatever the store was created with
+            header = readHeader(path)
+            self.dtype = np.dtype(str(header['dtype']))
+            self.paramsDtype = np.dtype([tuple(str(x) for x in field) for field in header['params']])
+        else:
+            if not os.path.isdir(path):
+                os.makedirs(path)
+            self.dtype = np.dtype(dtype).newbyteorder('<')
+            self.paramsDtype = np.dtype(paramsDtype).newbyteorder('<')
+            header = {'version': VERSION, 'dtype': self.dtype.str, 'columns': COLUMNS, \
+                      'params': self.paramsDtype.descr}
+            with open(os.path.join(path, HEADER), 'w') as f:
+                json.dump(header, f, indent=1)
+        self.samples = os.path.getsize(columnPath(path, 't')) // self.dtype.itemsize \
+            if os.path.exists(columnPath(path, 't')) else 0
+
+
+    def append(self, params, lengths, columns):
+        """Append len(params) runs. lengths gives each run's sample count
+        and columns maps every COLUMNS name to the runs' samples
+        concatenated, shaped (sum(lengths), width)."""
+        params = np.asarray(params, dtype=self.paramsDtype)
+        lengths = np.asarray(lengths, dtype=np.int64)
+        total = int(np.sum(lengths))
+        if (len(params) != len(lengths)):
+            raise ValueError("Need one parameter row per run")
+        for name, width in COLUMNS.items():
+            shape = np.shape(columns[name])
+            if (shape[0:1] != (total,) or int(np.prod(shape[1:])) != width):
+                raise ValueError("Column %s must hold %d samples of width %d" % (name, total, width))
+
+        # the index is written last, so readers never see a run before its data
+        for name in COLUMNS:
+            with open(columnPath(self.path, name), 'ab') as f:
+                np.ascontiguousarray(columns[name], dtype=self.dtype).tofile(f)
+        with open(os.path.join(self.path, PARAMS), 'ab') as f:
+            params.tofile(f)
+        index = np.zeros(len(lengths), dtype=INDEX_DTYPE)
+        index['start'] = self.samples + np.cumsum(lengths) - lengths
+        index['length'] = lengths
+        with open(os.path.join(self.path, INDEX), 'ab') as f:
+            index.tofile(f)
+        self.samples += total
+
+
+    def appendProjectile(self, pm, results, usingDragForce):
+        """append an evolved ProjectileMotion and what its evolve returned"""
+        maxTime, maxRange, maxHeight = results
+        params = paramsRows(pm.basicParams, pm.dragParams, usingDragForce, maxTime, maxRange, maxHeight)
+        columns = dict((name, getattr(pm, name)) for name in COLUMNS)
+        self.append(params, [len(pm.t)], columns)
+
+
+    def appendBatch(self, batch, result, usingDragForce):
+        """append every trajectory of an evolved PMBatch, deriving p, K,
+        U and F from the padded pos/v arrays"""
+        lengths = result.lengths
+        valid = np.arange(len(result.t))[None,:] < lengths[:,None]
+        run = np.nonzero(valid)[0]
+        pos = result.pos[valid]
+        v = result.v[valid]
+        mass = batch.basicParams['mass'][run]
+        g = batch.basicParams['g'][run]
+
+        states = np.column_stack([pos[:,0], v[:,0], pos[:,1], v[:,1]])
+        accel = batch.derivs(states, 0., g, batch.getDragCoeffs(usingDragForce)[run])
+        columns = {'t': np.broadcast_to(result.t, valid.shape)[valid], 'pos': pos, 'v': v, \
+                   'p': mass[:,None] * v, 'K': 0.5 * mass * np.sum(np.square(v), axis=1), \
+                   'U': mass * np.abs(g) * pos[:,1], 'F': mass[:,None] * accel[:,[1,3]]}
+        params = paramsRows(batch.basicParams, batch.dragParams, usingDragForce, \
+                            result.maxTime, result.maxRange, result.maxHeight)
+        self.append(params, lengths, columns)
+
+
+    def appendSweep(self, sweep, cells, usingDragForce):
+        """append the summary of every PMSweep cell as a run without samples"""
+        cells = cells.ravel()
+        dragParams = dict(sweep.dragParams)
+        dragParams['drag coefficient'] = cells['dragCoefficient']
+        dragParams['diameter'] = cells['diameter']
+        basicParams = dict(sweep.basicParams, v0=cells['v0'], theta=cells['theta'])
+        params = paramsRows(basicParams, dragParams, usingDragForce, \
+                            cells['maxTime'], cells['maxRange'], cells['maxHeight'])
+        columns = dict((name, np.zeros((0, width))) for name, width in COLUMNS.items())
+        self.append(params, np.zeros(len(cells), dtype=np.int64), columns)
+
+
+class PMStore:
+    """Memory-mapped reader of a store directory"""
+
+    def __init__(self, path):
+        self.path = path
+        header = readHeader(path)
+        self.dtype = np.dtype(str(header['dtype']))
+        self.paramsDtype = np.dtype([tuple(str(x) for x in field) for field in header['params']])
+        self.index = self.mapFile(os.path.join(path, INDEX), INDEX_DTYPE)
+        # a run only counts once its index entry is complete
+        self.params = self.mapFile(os.path.join(path, PARAMS), self.paramsDtype)[0:len(self.index)]
+        self.columns = {}
+
+
+    @staticmethod
+    def mapFile(path, dtype, width=1):
+        """read-only memmap of whole records in path (numpy cannot map an empty file)"""
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        count = size // (dtype.itemsize * width)
+        shape = (count,) if width == 1 else (count, width)
+        if (count == 0):
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+    def __len__(self):
+        return len(self.index)
+
+
+    def column(self, name):
+        """memmap of one column over every run, (samples,) or (samples, 2)"""
+        if name not in self.columns:
+            if name not in COLUMNS:
+                raise KeyError("Unknown column: %s" % name)
+            self.columns[name] = self.mapFile(columnPath(self.path, name), self.dtype, COLUMNS[name])
+        return self.columns[name]
+
+
+    def rows(self, idx):
+        start, length = self.index[idx]
+        return slice(int(start), int(start + length))
+
+
+    def trajectory(self, idx, names=None):
+        """dict of the requested columns (all by default) of run idx"""
+        rows = self.rows(idx)
+        return dict((name, self.column(name)[rows]) for name in (names or COLUMNS))
+
+
+    def lastSamples(self, name):
+        """one column's value at the final sample of every run (NaN for empty runs)"""
+        col = self.column(name)
+        last = self.index['start'] + self.index['length'] - 1
+        values = np.full((len(self),) + col.shape[1:], np.nan)
+        ok = self.index['length'] > 0
+        values[ok] = col[last[ok]]
+        return values
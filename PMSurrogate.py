@@ -0,0 +1,189 @@
+"""
+Precomputed lookup tables for instant range, height and flight time.
+
+A table is built once over a (v0, theta, drag coefficient, y0) grid from
+PMBatch solves and saved to disk. Queries interpolate multilinearly in
+the table and report an error estimate from the table's second
+differences (1/8 h^2 |f''| per axis, times SAFETY). It is not a bound:
+curvature between the nodes can exceed it. Queries outside the grid, or
+whose estimate is too loose, fall back to a real integration.
+"""
+
+import json
+import itertools
+import numpy as np
+from PMBatch import PMBatch
+
+
+class PMSurrogate:
+
+    AXES = ('v0', 'theta', 'drag coefficient', 'y0')
+    OUTPUTS = ('maxRange', 'maxHeight', 'maxTime')
+
+    # the second differences only sample f'' at the nodes, so the
+    # estimate is padded by this factor
+    SAFETY = 2.0
+
+    # cells solved per PMBatch call while building
+    BUILD_CHUNK = 20000
+
+    def __init__(self, axes, values, curvature, basicParams, dragParams, usingDragForce=1):
+        self.axes = [np.asarray(a, dtype=float) for a in axes]
+        # values is grid-shaped + (3,), curvature grid-shaped + (4 axes, 3)
+        self.values = values
+        self.curvature = curvature
+        self.basicParams = basicParams
+        self.dragParams = dragParams
+        self.usingDragForce = usingDragForce
+        self.lastFallbacks = 0
+
+        # flat-index offsets of the 2^4 corners of a grid cell
+        shape = self.values.shape[:-1]
+        self.strides = np.cumprod((1,) + shape[:0:-1])[::-1]
+        self.corners = np.array(list(itertools.product((0, 1), repeat=len(shape))))
+        self.cornerOffsets = np.dot(self.corners, self.strides)
+        self.flatValues = self.values.reshape(-1, self.values.shape[-1])
+        self.flatCurvature = self.curvature.reshape((-1,) + self.curvature.shape[-2:])
+
+
+    @classmethod
+    def build(cls, v0, theta, dragCoeff, y0, basicParams=None, dragParams=None, usingDragForce=1):
+        """solve every grid node and return the resulting table"""
+        axes = [np.sort(np.atleast_1d(np.asarray(a, dtype=float))) for a in (v0, theta, dragCoeff, y0)]
+        for name, axis in zip(cls.AXES, axes):
+            if (len(axis) < 2):
+                raise ValueError("Surrogate axis %s needs at least 2 points" % name)
+
+        batch = PMBatch()
+        # each chunk of grid nodes is solved once, so caching would only grow memory
+        batch.cache = None
+        fixedBasic = dict((k, float(v[0])) for k, v in batch.basicParams.items())
+        fixedDrag = dict((k, float(v[0])) for k, v in batch.dragParams.items())
+        fixedBasic.update(basicParams or {})
+        fixedDrag.update(dragParams or {})
+
+        grids = [g.ravel() for g in np.meshgrid(*axes, indexing='ij')]
+        values = np.empty((len(grids[0]), 3))
+        for start in range(0, len(grids[0]), cls.BUILD_CHUNK):
+            rows = slice(start, start + cls.BUILD_CHUNK)
+            basic = dict(fixedBasic, v0=grids[0][rows], theta=grids[1][rows], y0=grids[3][rows])
+            drag = dict(fixedDrag)
+            drag['drag coefficient'] = grids[2][rows]
+            batch.setValues(basic, drag)
+            res = batch.evolve(usingDragForce, trajectories=False)
+            values[rows,0] = res.maxRange
+            values[rows,1] = res.maxHeight
+            values[rows,2] = res.maxTime
+
+        values = values.reshape(tuple(len(a) for a in axes) + (3,))
+        curvature = cls.secondDifferences(axes, values)
+        return cls(axes, values, curvature, fixedBasic, fixedDrag, usingDragForce)
+
+
+    @staticmethod
+    def secondDifferences(axes, values):
+        """|f''| along each axis at every node, (grid..., 4, 3)"""
+        curvature = np.empty(values.shape[:-1] + (len(axes),) + values.shape[-1:])
+        for d, axis in enumerate(axes):
+            f = np.moveaxis(values, d, 0)
+            curv = np.moveaxis(curvature[...,d,:], d, 0)
+            if (len(axis) < 3):
+                # no way to estimate the curvature from two points
+                curv[...] = np.inf
+                continue
+            h = np.diff(axis).reshape((-1,) + (1,) * (f.ndim - 1))
+            slopes = np.diff(f, axis=0) / h
+            curv[1:-1] = np.abs(2.0 * np.diff(slopes, axis=0) / (h[1:] + h[:-1]))
+            curv[0] = curv[1]
+            curv[-1] = curv[-2]
+        return curvature
+
+
+    @staticmethod
+    def npzPath(path):
+        """np.savez appends .npz to a path without it, np.load does not"""
+        return path if path.endswith('.npz') else path + '.npz'
+
+
+    def save(self, path):
+        np.savez(self.npzPath(path), v0=self.axes[0], theta=self.axes[1], dragCoefficient=self.axes[2], \
+                 y0=self.axes[3], values=self.values, curvature=self.curvature, \
+                 params=json.dumps({'basicParams': self.basicParams, 'dragParams': self.dragParams, \
+                                    'usingDragForce': self.usingDragForce}))
+
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(cls.npzPath(path))
+        params = json.loads(str(data['params']))
+        axes = [data['v0'], data['theta'], data['dragCoefficient'], data['y0']]
+        return cls(axes, data['values'], data['curvature'], params['basicParams'], \
+                   params['dragParams'], params['usingDragForce'])
+
+
+    def interpolate(self, points):
+        """multilinear interpolation at (M,4) in-grid points, returning
+        the (M,3) values and their (M,3) error estimates"""
+        base = np.zeros(len(points), dtype=int)
+        weights = np.ones((len(points), len(self.corners)))
+        h = np.empty((len(points), len(self.axes)))
+        for d, axis in enumerate(self.axes):
+            i = np.clip(np.searchsorted(axis, points[:,d]) - 1, 0, len(axis) - 2)
+            h[:,d] = axis[i+1] - axis[i]
+            frac = ((points[:,d] - axis[i]) / h[:,d])[:,None]
+            weights *= np.where(self.corners[:,d], frac, 1.0 - frac)
+            base += i * self.strides[d]
+
+        # gather all 2^4 cell corners at once from the flattened tables
+        nodes = base[:,None] + self.cornerOffsets[None,:]
+        values = np.einsum('mc,mcq->mq', weights, self.flatValues[nodes])
+        curv = np.max(self.flatCurvature[nodes], axis=1)
+        errors = 0.125 * self.SAFETY * np.einsum('md,mdq->mq', h*h, curv)
+        return values, errors
+
+
+    def inGrid(self, points):
+        inside = np.ones(len(points), dtype=bool)
+        for d, axis in enumerate(self.axes):
+            inside &= (points[:,d] >= axis[0]) & (points[:,d] <= axis[-1])
+        return inside
+
+
+    def solveExactly(self, points):
+        """integrate the given (M,4) points with the table's fixed parameters"""
+        batch = PMBatch()
+        # fallback points are one-offs, so caching would only grow memory
+        batch.cache = None
+        basic = dict(self.basicParams, v0=points[:,0], theta=points[:,1], y0=points[:,3])
+        drag = dict(self.dragParams)
+        drag['drag coefficient'] = points[:,2]
+        batch.setValues(basic, drag)
+        res = batch.evolve(self.usingDragForce, trajectories=False)
+        return np.column_stack([res.maxRange, res.maxHeight, res.maxTime])
+
+
+    def query(self, v0, theta, dragCoeff, y0, relTol=1e-3):
+        """range, max height and flight time (plus absolute error estimates)
+        for scalars or arrays; relTol=None never falls back inside the grid"""
+        args = np.broadcast_arrays(*[np.asarray(a, dtype=float) for a in (v0, theta, dragCoeff, y0)])
+        shape = args[0].shape
+        points = np.column_stack([a.ravel() for a in args])
+
+        values = np.full((len(points), 3), np.nan)
+        errors = np.full((len(points), 3), np.inf)
+        inside = self.inGrid(points)
+        if np.any(inside):
+            values[inside], errors[inside] = self.interpolate(points[inside])
+
+        fallback = ~inside
+        if (relTol is not None):
+            with np.errstate(invalid='ignore'):
+                fallback |= np.any(~(errors <= relTol * np.abs(values)), axis=1)
+        if np.any(fallback):
+            values[fallback] = self.solveExactly(points[fallback])
+            errors[fallback] = 0.
+        self.lastFallbacks = int(np.sum(fallback))
+
+        values = values.reshape(shape + (3,))
+        errors = errors.reshape(shape + (3,))
+        return values[...,0], values[...,1], values[...,2], errors
@@ -0,0 +1,114 @@
+"""
+Parameter sweeps over v0 x theta x drag coefficient x diameter grids,
+spread over a pool of worker processes.
+"""
+
+import sys
+import time
+import multiprocessing
+import numpy as np
+from PMBatch import PMBatch
+
+
+SWEEP_DTYPE = np.dtype([('v0', 'f8'), ('theta', 'f8'), ('dragCoefficient', 'f8'), ('diameter', 'f8'), \
+                        ('maxRange', 'f8'), ('maxHeight', 'f8'), ('maxTime', 'f8')])
+
+
+def solveChunk(args):
+    """solve one chunk of grid cells (runs in a worker process)"""
+    start, cells, basicParams, dragParams, usingDragForce, dt = args
+    batch = PMBatch()
+    # every chunk is a distinct set of cells, so caching would only grow memory
+    batch.cache = None
+    batch.dt = dt
+    basicParams = dict(basicParams, v0=cells['v0'], theta=cells['theta'])
+    dragParams = dict(dragParams)
+    dragParams['drag coefficient'] = cells['dragCoefficient']
+    dragParams['diameter'] = cells['diameter']
+    batch.setValues(basicParams, dragParams)
+    res = batch.evolve(usingDragForce, trajectories=False)
+    return start, res.maxRange, res.maxHeight, res.maxTime
+
+
+def printProgress(done, total, elapsed):
+    """default progress report: cells done and throughput"""
+    rate = done / elapsed if elapsed > 0 else 0.
+    sys.stderr.write("\r%d/%d cells (%.1f%%), %.0f cells/s" % (done, total, 100.*done/total, rate))
+    if (done == total):
+        sys.stderr.write("\n")
+    sys.stderr.flush()
+
+
+class PMSweep:
+
+    # aim for this many chunks per worker so the pool stays balanced
+    CHUNKS_PER_PROCESS = 4
+
+    def __init__(self, processes=None, chunkSize=None, progress=printProgress):
+        self.processes = processes if processes is not None else multiprocessing.cpu_count()
+        self.chunkSize = chunkSize
+        self.progress = progress
+        # fixed ProjectileMotion parameters for every cell
+        batch = PMBatch()
+        self.basicParams = dict((k, float(v[0])) for k, v in batch.basicParams.items())
+        self.dragParams = dict((k, float(v[0])) for k, v in batch.dragParams.items())
+        self.dt = batch.dt
+        # throughput of the last run (cells/s)
+        self.throughput = 0.
+
+
+    def makeGrid(self, v0, theta, dragCoeff, diameter):
+        """structured array holding every cell of the 4-D grid"""
+        axes = [np.atleast_1d(np.asarray(a, dtype=float)) for a in (v0, theta, dragCoeff, diameter)]
+        grids = np.meshgrid(*axes, indexing='ij')
+        cells = np.zeros(grids[0].shape, dtype=SWEEP_DTYPE)
+        for name, grid in zip(SWEEP_DTYPE.names[0:4], grids):
+            cells[name] = grid
+        return cells
+
+
+    def getChunkSize(self, total):
+        if (self.chunkSize is not None):
+            return max(1, int(self.chunkSize))
+        return max(1, int(np.ceil(total / float(self.CHUNKS_PER_PROCESS * self.processes))))
+
+
+    def run(self, v0, theta, dragCoeff, diameter, usingDragForce=1):
+        """solve every grid cell, returning a structured array shaped
+        (len(v0), len(theta), len(dragCoeff), len(diameter))"""
+        cells = self.makeGrid(v0, theta, dragCoeff, diameter)
+        flat = cells.ravel()
+        total = len(flat)
+        chunkSize = self.getChunkSize(total)
+        tasks = [(start, flat[start:start+chunkSize], self.basicParams, self.dragParams, \
+                  usingDragForce, self.dt) for start in range(0, total, chunkSize)]
+
+        startTime = time.time()
+        done = 0
+        if (self.processes <= 1):
+            results = (solveChunk(task) for task in tasks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(self.processes)
+            results = pool.imap_unordered(solveChunk, tasks)
+
+        try:
+            for start, maxRange, maxHeight, maxTime in results:
+                stop = start + len(maxRange)
+                flat['maxRange'][start:stop] = maxRange
+                flat['maxHeight'][start:stop] = maxHeight
+                flat['maxTime'][start:stop] = maxTime
+                done += len(maxRange)
+                if (self.progress is not None):
+                    self.progress(done, total, time.time() - startTime)
+        except:
+            if (pool is not None):
+                pool.terminate()
+            raise
+        if (pool is not None):
+            pool.close()
+            pool.join()
+
+        elapsed = time.time() - startTime
+        self.throughput = total / elapsed if elapsed > 0 else 0.
+        return cells
@@ -0,0 +1,413 @@
+"""
+Targeting: the launch angle (or speed) that passes through a point.
+
+Trajectories are integrated with the horizontal position as the
+independent variable, from the launch point to the target's x, so every
+target in a batch ends at a fixed point and y there is read off directly.
+The variational (sensitivity) equations for d/dtheta and d/dv0 are
+integrated alongside, giving the exact derivative of the miss for Newton
+steps. Roots are bracketed first, on a grid of angles solved together,
+and Newton steps that leave the bracket fall back to bisection. Both
+the low and the high arc are returned when they exist, e.g.
+
+    python PMTarget.py --drag --v0 40 50,5 80,0
+"""
+
+import sys
+import argparse
+import numpy as np
+from collections import OrderedDict
+from PMBatch import PMBatch
+import PMForces
+import PMIntegrators
+
+
+class PMTargetResult:
+    """Launch parameters of the low and high arcs through every target
+    (NaN where an arc does not exist)"""
+
+    def __init__(self, x, y, v0, thetaLow, thetaHigh, timeLow, timeHigh, iterations):
+        self.x = x
+        self.y = y
+        self.v0 = v0
+        self.thetaLow = thetaLow
+        self.thetaHigh = thetaHigh
+        # flight time to the target along each arc
+        self.timeLow = timeLow
+        self.timeHigh = timeHigh
+        self.iterations = iterations
+
+
+    def __len__(self):
+        return len(self.x)
+
+
+class PMTarget:
+
+    # angles (deg) solved together to bracket the roots
+    ANGLES = 16
+    MAX_ANGLE = 89.5
+    # miss distance (m) counted as a hit
+    TOL = 1e-6
+    # angle (deg) to which the highest pass is located when no grid
+    # angle reaches the target
+    PEAK_TOL = 1e-4
+    # fastest launch (m/s) tried when solving for the speed
+    MAX_SPEED = 4096.
+    MAX_ITER = 50
+    # launches whose vx drops below twice this fraction of v0 before
+    # the target count as out of reach
+    VX_FLOOR = 0.01
+    # integration tolerances
+    RTOL = 1e-8
+    ATOL = 1e-8
+
+    def __init__(self):
+        batch = PMBatch()
+        self.basicParams = dict((k, float(v[0])) for k, v in batch.basicParams.items())
+        self.dragParams = dict((k, float(v[0])) for k, v in batch.dragParams.items())
+        self.dragModel = 'quadratic'
+        self.modelParams = OrderedDict(PMForces.MODEL_PARAMS)
+        # total integrations of the last solve (each over the whole batch)
+        self.evaluations = 0
+
+
+    def setValues(self, basicParams=None, dragParams=None):
+        """fixed launch parameters shared by every target"""
+        for params, values in ((self.basicParams, basicParams), (self.dragParams, dragParams)):
+            for field, value in (values or {}).items():
+                if field not in params:
+                    raise KeyError("Unknown parameter: %s" % field)
+                params[field] = float(value)
+        self.basicParams['g'] = -np.abs(self.basicParams['g'])
+
+
+    def getForceModel(self, usingDragForce=1):
+        """force model (see PMForces) built from the current parameters"""
+        return PMForces.makeForceModel(self.dragModel, self.basicParams, self.dragParams, \
+                                       self.modelParams, usingDragForce)
+
+
+    def derivs(self, z, S, length, floor, model):
+        """d/du of the states z = (t, vx, y, vy), shaped (n,4), and of their
+        sensitivities S, shaped (n,4,2), where x = x0 + u*length"""
+        vx = z[:,1]
+        vy = z[:,3]
+        # no force model depends on x, so t can stand in its column
+        ax, ay = model.acceleration(z)
+
+        # dx/dt, smoothly kept above the floor (exact above twice the
+        # floor, where launches count as out of reach) so that steps
+        # crossing into the stall stay finite
+        w = np.where(vx > 2*floor, vx, floor + np.square(np.maximum(vx, 0.)) / (4*floor))
+        dw = np.where(vx > 2*floor, 1., np.maximum(vx, 0.) / (2*floor))
+        scale = length / w
+
+        # time derivatives, converted to d/du by dt/du = length/w
+        F = np.column_stack([np.ones(len(z)), ax, vy, ay])
+        dz = scale[:,None] * F
+
+        # Jacobian of dz: that of F scaled, plus F times d(scale)/dvx
+        A = np.zeros((len(z), 4, 4))
+        A[:,[1,3],:] = model.accelerationJacobian(z)
+        A[:,2,3] = 1.
+        A *= scale[:,None,None]
+        A[:,:,1] -= (scale * dw / w)[:,None] * F
+        dS = np.einsum('nij,njk->nik', A, S)
+        return dz, dS
+
+
+    def shoot(self, x, v0, theta, usingDragForce=1, behind=False):
+        """Integrate launches at speeds v0 and angles theta (deg, below 90)
+        out to horizontal positions x beyond x0, mirrored where behind
+        (see mirror). Returns y, dy/dtheta (per deg), dy/dv0, the flight
+        time and vx, all at x; y is -inf and the rest NaN for launches
+        dropped as out of reach."""
+        x, v0, theta, behind = np.broadcast_arrays(x, v0, theta, behind)
+        x, v0, theta = [np.array(a, dtype=float).ravel() for a in (x, v0, theta)]
+        behind = np.array(behind, dtype=bool).ravel()
+        n = len(x)
+        model = self.getForceModel(usingDragForce)
+        windX = getattr(model, 'windX', 0.)
+        perRow = np.any(behind) and windX != 0.
+        if (perRow):
+            # a mirrored launch flies in the mirrored wind
+            model.windX = np.where(behind, -windX, windX)
+        length = x - self.basicParams['x0']
+        floor = self.VX_FLOOR * v0
+
+        rad = theta * np.pi / 180.
+        cos, sin = np.cos(rad), np.sin(rad)
+        z0 = np.column_stack([np.zeros(n), v0*cos, np.full(n, self.basicParams['y0']), v0*sin])
+        S0 = np.zeros((n, 4, 2))
+        S0[:,1,0] = -v0 * sin * np.pi/180.
+        S0[:,3,0] = v0 * cos * np.pi/180.
+        S0[:,1,1] = cos
+        S0[:,3,1] = sin
+
+        def rhs(u, y, rows):
+            rowModel = PMForces.selectRows(model, rows, n) if perRow else model
+            dz, dS = self.derivs(y[:,0:4], y[:,4:].reshape(-1, 4, 2), length[rows], floor[rows], rowModel)
+            return np.concatenate([dz, dS.reshape(-1, 8)], axis=1)
+
+        def outOfReach(u, y, rows):
+            return y[:,1] <= 2*floor[rows]
+
+        # every row takes its own steps, and launches out of reach stop
+        # where they stall, so they cannot slow the rest of the batch
+        states = np.column_stack([z0, S0.reshape(n, 8)])
+        end, u, steps = PMIntegrators.dormandPrince(rhs, states, 0., 1., self.RTOL, self.ATOL, stop=outOfReach)
+        self.evaluations += 1
+
+        hit = u >= 1. - 1e-12
+        y = np.where(hit, end[:,2], -np.inf)
+        dTheta = np.where(hit, end[:,8], np.nan)
+        dV0 = np.where(hit, end[:,9], np.nan)
+        t = np.where(hit, end[:,0], np.nan)
+        return y, dTheta, dV0, t, end[:,1]
+
+
+    def arrival(self, x, v0, theta, usingDragForce, behind):
+        """flight times to x of launches found to hit it; NaN for those
+        that only did so below the vx floor, i.e. out of reach"""
+        t = np.full(len(x), np.nan)
+        ok = np.isfinite(theta)
+        if np.any(ok):
+            h, dh, dv, time, vx = self.shoot(x[ok], v0[ok], theta[ok], usingDragForce, behind[ok])
+            t[ok] = np.where(vx > 2*self.VX_FLOOR*v0[ok], time, np.nan)
+        return t
+
+
+    def bracketRoot(self, func, lo, hi, flo, fhi):
+        """Newton iterations on func(x, idx) -> (f, df) for every bracket
+        [lo, hi] with a sign change, bisecting whenever a step leaves
+        the bracket. Returns the roots and the iterations taken."""
+        lo, hi, flo, fhi = [np.array(a, dtype=float) for a in (lo, hi, flo, fhi)]
+        n = len(lo)
+        # start from the secant through the bracket ends
+        with np.errstate(invalid='ignore'):
+            root = np.where(np.isinf(flo) | np.isinf(fhi), 0.5*(lo + hi), lo - flo*(hi - lo)/(fhi - flo))
+        iterations = np.zeros(n, dtype=int)
+        bracketed = np.isfinite(root) & (np.sign(flo) != np.sign(fhi))
+        root[~bracketed] = np.nan
+        active = np.nonzero(bracketed)[0]
+        for it in range(self.MAX_ITER):
+            if (len(active) == 0):
+                break
+            f, df = func(root[active], active)
+            iterations[active] += 1
+            width = hi[active] - lo[active]
+            # an infinite end means launches out of reach: a sign change
+            # right at their edge is no root
+            done = (np.abs(f) < self.TOL) | (width < 1e-12 * np.abs(hi[active])) | \
+                   ((width < 1e-6) & (np.isinf(flo[active]) | np.isinf(fhi[active])))
+            root[active[done & (np.abs(f) >= self.TOL)]] = np.nan
+
+            # keep the sign change inside [lo, hi]
+            left = np.sign(f) == np.sign(flo[active])
+            lo[active[left]], flo[active[left]] = root[active[left]], f[left]
+            right = ~left
+            hi[active[right]], fhi[active[right]] = root[active[right]], f[right]
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                step = root[active] - f / df
+                outside = ~((step > lo[active]) & (step < hi[active]))
+            step[outside] = 0.5 * (lo[active[outside]] + hi[active[outside]])
+            root[active[~done]] = step[~done]
+            active = active[~done]
+        # anything that did not converge is not an answer
+        root[active] = np.nan
+        return root, iterations
+
+
+    def mirror(self, x):
+        """horizontal distances of the targets and whether they lie behind
+        x0; those behind are solved as their mirror image, in the mirrored
+        wind"""
+        x = np.asarray(x, dtype=float)
+        x0 = self.basicParams['x0']
+        behind = x < x0
+        reach = np.where(behind, 2*x0 - x, x)
+        reach[x == x0] = np.nan
+        return reach, behind
+
+
+    def solveAngle(self, x, y, v0, usingDragForce=1):
+        """launch angles through the targets (x, y) at speed v0 (arrays
+        broadcast together); targets behind x0 get angles above 90"""
+        x, y, v0 = [np.array(a, dtype=float).ravel() for a in np.broadcast_arrays(x, y, v0)]
+        n = len(x)
+        self.evaluations = 0
+        reach, behind = self.mirror(x)
+
+        # every target at every grid angle in one integration
+        angles = np.linspace(0., self.MAX_ANGLE, self.ANGLES)
+        grid = np.repeat(reach, self.ANGLES)
+        ok = np.isfinite(grid)
+        miss = np.full(len(grid), np.nan)
+        heights = self.shoot(grid[ok], np.repeat(v0, self.ANGLES)[ok], np.tile(angles, n)[ok], usingDragForce, \
+                             np.repeat(behind, self.ANGLES)[ok])[0]
+        miss[ok] = heights - np.repeat(y, self.ANGLES)[ok]
+        miss = miss.reshape(n, self.ANGLES)
+
+        # the miss rises to a single maximum and falls again, so the low arc
+        # lies before the best grid angle and the high arc after it
+        best = np.argmax(np.where(np.isnan(miss), -np.inf, miss), axis=1)
+        peak, peakMiss = angles[best], miss[np.arange(n), best]
+        unsure = (peakMiss < 0.) & np.isfinite(peakMiss)
+        if np.any(unsure):
+            # the maximum may still reach the target between grid angles:
+            # locate it from the sign change of dmiss/dtheta
+            idx = np.nonzero(unsure)[0]
+            lo = angles[np.maximum(best[idx] - 1, 0)]
+            hi = angles[np.minimum(best[idx] + 1, self.ANGLES - 1)]
+            refined = self.findPeak(reach[idx], y[idx], v0[idx], lo, hi, usingDragForce, behind[idx])
+            peak[idx], peakMiss[idx] = refined
+
+        # brackets of the low arcs (rows 0..n-1) and high arcs (n..2n-1),
+        # between the peak and the nearest grid angle that passes below
+        lo = np.full(2*n, np.nan)
+        hi = np.full(2*n, np.nan)
+        flo = np.full(2*n, np.nan)
+        fhi = np.full(2*n, np.nan)
+        for i in np.nonzero(peakMiss >= 0.)[0]:
+            below = np.nonzero((miss[i] < 0.) & (angles < peak[i]))[0]
+            if (len(below) > 0):
+                j = below[-1]
+                lo[i], flo[i], hi[i], fhi[i] = angles[j], miss[i,j], peak[i], peakMiss[i]
+            below = np.nonzero((miss[i] < 0.) & (angles > peak[i]))[0]
+            if (len(below) > 0):
+                j = below[0]
+                lo[n+i], flo[n+i], hi[n+i], fhi[n+i] = peak[i], peakMiss[i], angles[j], miss[i,j]
+        # start from the grid angles next to each root
+        for i in np.nonzero(np.isfinite(lo))[0]:
+            for j in np.nonzero((angles > lo[i]) & (angles < hi[i]))[0]:
+                if (np.sign(miss[i % n,j]) == np.sign(flo[i])):
+                    lo[i], flo[i] = angles[j], miss[i % n,j]
+                else:
+                    hi[i], fhi[i] = angles[j], miss[i % n,j]
+                    break
+
+        def missAt(theta, idx):
+            idx = idx % n
+            h, dh, dv, t, vx = self.shoot(reach[idx], v0[idx], theta, usingDragForce, behind[idx])
+            return h - y[idx], dh
+
+        # both arcs of every target in the same batches
+        theta, iterations = self.bracketRoot(missAt, lo, hi, flo, fhi)
+        both = np.arange(2*n) % n
+        t = self.arrival(reach[both], v0[both], theta, usingDragForce, behind[both])
+        theta[np.isnan(t)] = np.nan
+        theta = np.where(behind[both], 180. - theta, theta)
+        return PMTargetResult(x, y, v0, theta[0:n], theta[n:], t[0:n], t[n:], \
+                              iterations[0:n] + iterations[n:])
+
+
+    def findPeak(self, reach, y, v0, lo, hi, usingDragForce, behind):
+        """angle of the highest pass over reach, between lo and hi, and the
+        miss there (false position on dmiss/dtheta). Stops as soon as some
+        angle reaches the target, which is all the arcs need."""
+        h, flo = self.shoot(reach, v0, lo, usingDragForce, behind)[0:2]
+        peak, peakMiss = lo.copy(), h - y
+        h, fhi = self.shoot(reach, v0, hi, usingDragForce, behind)[0:2]
+        higher = h - y > peakMiss
+        peak[higher], peakMiss[higher] = hi[higher], h[higher] - y[higher]
+        # launches out of reach lie past the peak
+        fhi[np.isnan(fhi)] = -np.inf
+        search = (flo > 0.) & (fhi < 0.) & (peakMiss < 0.)
+        for it in range(self.MAX_ITER):
+            if not np.any(search):
+                break
+            idx = np.nonzero(search)[0]
+            width = hi[idx] - lo[idx]
+            with np.errstate(invalid='ignore'):
+                mid = lo[idx] - flo[idx] * width / (fhi[idx] - flo[idx])
+            # keep the steps from stalling at one end
+            mid = np.where(np.isfinite(fhi[idx]), np.clip(mid, lo[idx] + 0.01*width, hi[idx] - 0.01*width), \
+                           lo[idx] + 0.5*width)
+            h, f = self.shoot(reach[idx], v0[idx], mid, usingDragForce, behind[idx])[0:2]
+            left = f > 0.
+            lo[idx[left]], flo[idx[left]] = mid[left], f[left]
+            hi[idx[~left]], fhi[idx[~left]] = mid[~left], np.nan_to_num(f[~left])
+            higher = h - y[idx] > peakMiss[idx]
+            peak[idx[higher]], peakMiss[idx[higher]] = mid[higher], h[higher] - y[idx[higher]]
+            search[idx] = (hi[idx] - lo[idx] > self.PEAK_TOL) & (peakMiss[idx] < 0.)
+        return peak, peakMiss
+
+
+    def solveSpeed(self, x, y, theta, usingDragForce=1):
+        """launch speeds through the targets (x, y) at angles theta (deg)"""
+        x, y, theta = [np.array(a, dtype=float).ravel() for a in np.broadcast_arrays(x, y, theta)]
+        n = len(x)
+        self.evaluations = 0
+        reach, behind = self.mirror(x)
+        # the mirrored launch must point forward
+        forward = np.where(behind, 180. - theta, theta)
+        valid = np.isfinite(reach) & (forward > 0.) & (forward < 90.)
+
+        def missAt(v0, idx):
+            h, dh, dv, t, vx = self.shoot(reach[idx], v0, forward[idx], usingDragForce, behind[idx])
+            return h - y[idx], dv
+
+        # double the speed until the shot reaches over the target
+        lo = np.full(n, np.nan)
+        hi = np.full(n, np.nan)
+        flo = np.full(n, np.nan)
+        fhi = np.full(n, np.nan)
+        idx = np.nonzero(valid)[0]
+        speed = np.full(len(idx), 1.)
+        lo[idx], flo[idx] = 0., -np.inf
+        while (len(idx) > 0 and speed[0] <= self.MAX_SPEED):
+            f = missAt(speed, idx)[0]
+            over = f >= 0.
+            hi[idx[over]], fhi[idx[over]] = speed[over], f[over]
+            lo[idx[~over]], flo[idx[~over]] = speed[~over], f[~over]
+            idx, speed = idx[~over], 2. * speed[~over]
+        lo[idx] = np.nan
+
+        v0, iterations = self.bracketRoot(missAt, lo, hi, flo, fhi)
+        t = self.arrival(reach, v0, forward, usingDragForce, behind)
+        v0[np.isnan(t)] = np.nan
+        return v0, t, iterations
+
+
+
+### MAIN EXECUTABLE ###
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Launch angles (or speeds) that hit the given targets")
+    parser.add_argument('targets', nargs='+', metavar='X,Y')
+    parser.add_argument('--v0', type=float, help="solve for the angle at this speed")
+    parser.add_argument('--theta', type=float, help="solve for the speed at this angle (deg)")
+    parser.add_argument('--drag', action='store_true', help="include air resistance")
+    parser.add_argument('--model', choices=list(PMForces.MODELS), default='quadratic', help="drag model")
+    parser.add_argument('--set', action='append', default=[], metavar='NAME=VALUE', \
+                        help="launch or drag model parameter, e.g. --set y0=2 --set 'wind x=3'")
+    args = parser.parse_args()
+    if ((args.v0 is None) == (args.theta is None)):
+        parser.error("give exactly one of --v0 and --theta")
+
+    target = PMTarget()
+    target.dragModel = args.model
+    for item in args.set:
+        name, value = item.split('=', 1)
+        if name in target.modelParams:
+            target.modelParams[name] = float(value)
+        elif name in target.basicParams:
+            target.setValues(basicParams={name: value})
+        else:
+            target.setValues(dragParams={name: value})
+    points = np.array([[float(v) for v in p.split(',')] for p in args.targets])
+    usingDragForce = int(args.drag)
+
+    if (args.v0 is not None):
+        res = target.solveAngle(points[:,0], points[:,1], args.v0, usingDragForce)
+        print("%10s %10s %12s %10s %12s %10s" % ('x', 'y', 'low (deg)', 'time', 'high (deg)', 'time'))
+        for i in range(len(res)):
+            print("%10.3f %10.3f %12.6f %10.4f %12.6f %10.4f" % (res.x[i], res.y[i], res.thetaLow[i], \
+                  res.timeLow[i], res.thetaHigh[i], res.timeHigh[i]))
+    else:
+        v0, t, iterations = target.solveSpeed(points[:,0], points[:,1], args.theta, usingDragForce)
+        print("%10s %10s %12s %10s" % ('x', 'y', 'v0 (m/s)', 'time'))
+        for i in range(len(points)):
+            print("%10.3f %10.3f %12.6f %10.4f" % (points[i,0], points[i,1], v0[i], t[i]))
+    sys.stderr.write("%d batch integrations\n" % target.evaluations)
@@ -5,61 +5,127 @@ email: bsmigs@gmail.com
 website: http://rfground.wordpress.com
 """
 
+import time
 import numpy as np
-import scipy.integrate as integrate
-from scipy import interpolate
 from collections import OrderedDict
+import PMAnalytic
+import PMForces
+import PMCache
+import PMDecimate
+import PMIntegrators
+import PMStats
 
 class ProjectileMotion:
+
+    # rk4, verlet and rk45 are the vectorized PMIntegrators on the dt grid
+    SOLVERS = ('odeint', 'events', 'analytic', 'rk4', 'verlet', 'rk45')
+    # 'jit' runs rk4/rk45 as PMJit kernels when Numba is installed
+    BACKENDS = ('numpy', 'jit')
+    # solvers that evolveStream can run chunk by chunk
+    STREAM_SOLVERS = ('odeint', 'analytic', 'rk4', 'verlet', 'rk45')
+
+    # odeint's default tolerances, reused for the event-driven solver and rk45
+    RTOL = 1.49012e-8
+    ATOL = 1.49012e-8
+
+    # event-driven runs stop at impact; this only bounds runaway integrations
+    MAX_TIME_FACTOR = 10.0
+
+    # samples per chunk yielded by evolveStream
+    STREAM_CHUNK = 50
+    STREAM_FIELDS = ('t', 'pos', 'v', 'p', 'K', 'U', 'F')
+
+    # computed from pos/v the first time they are accessed
+    DERIVED = ('p', 'K', 'U', 'F')
     
     def __init__(self):
-        self.basicParams = OrderedDict([('mass',1.0), ('g',9.81), ('v0',10), ('theta',45), ('x0',0), ('y0',0)])
+        self.basicParams = OrderedDict([('mass',1.0), ('g',-9.81), ('v0',10), ('theta',45), ('x0',0), ('y0',0)])
         self.basicParamsUnits = {'mass':'(kg)', 'g':'(m/s^2)', 'v0':'(m/s)', 'theta':'(deg)', 'x0':'(m)', 'y0':'(m)'}
         self.dragParams = {'drag coefficient':0.5, 'diameter':0.01, 'air density':1.225} 
         self.dragParamsUnits = {'drag coefficient':'(number)', 'diameter':'(m)', 'air density':'(kg/m^3)'}
+        self.dragModel = 'quadratic'
+        self.modelParams = OrderedDict(PMForces.MODEL_PARAMS)
+        self.modelParamsUnits = PMForces.MODEL_PARAMS_UNITS
         self.dt = 0.01
+        # dtype of the stored pos/v and derived arrays (np.float32 halves memory)
+        self.storageType = np.float64
+        # geometric tolerance (m) for thinning evolve's output; None keeps every dt sample
+        self.outputTolerance = None
+        # output samples on the dt grid per sample kept
+        self.compressionRatio = 1.0
+        self.forceModel = None
+        # collect a PMStats for each run (returned from evolve as .stats)
+        self.instrument = False
+        self.stats = None
+        # results memoized across instances (None disables caching)
+        self.cache = PMCache.defaultCache
         self.time_elapsed = 0
         self.state = []
 
 
     def setValues(self, entries, valueType):
-        for entry in entries:
-            field = entry[0]
-            value = entry[1].get()
-            try:
-                if (valueType == 'basic'):
-                    if (field == 'g'):
-                        # make sure "g" < 0
-                        self.basicParams[field] = -np.abs(float(value))
-                    elif (field == 'x0' or field == 'y0'):
-                        # Let "x0" or "y0" be whatever sign
-                        self.basicParams[field] = float(value)
-                    else:
-                        # Make sure other params are >= 0
-                        self.basicParams[field] = np.abs(float(value))
-                elif (valueType == 'drag'):
-                    # Make sure params are >= 0
-                    self.dragParams[field] = np.abs(float(value))
-            except ValueError:
-                print "Error: Must enter a number for field: ",field.upper()
-                abort()
-        
+        """Read (field, Tk entry) pairs from the GUI; see setParams"""
+        values = OrderedDict((entry[0], entry[1].get()) for entry in entries)
+        if (valueType == 'basic'):
+            self.setParams(basicParams=values)
+        elif (valueType == 'drag'):
+            self.setParams(dragParams=values)
+
+
+    def setParams(self, basicParams=None, dragParams=None):
+        """Set parameters from plain dicts of numbers (or numeric strings)
+        and define the initial state. Raises KeyError for unknown fields
+        and ValueError for bad values, leaving the object unchanged."""
+        basic = OrderedDict(self.basicParams)
+        drag = dict(self.dragParams)
+        for field, value in (basicParams or {}).items():
+            if field not in basic:
+                raise KeyError("Unknown basic parameter: %s" % field)
+            value = self.toNumber(field, value)
+            if (field == 'g' or field == 'x0' or field == 'y0'):
+                # "g" gets its sign below; let "x0" or "y0" be whatever sign
+                basic[field] = value
+            else:
+                # Make sure other params are >= 0
+                basic[field] = np.abs(value)
+        for field, value in (dragParams or {}).items():
+            if field not in drag:
+                raise KeyError("Unknown drag parameter: %s" % field)
+            # Make sure params are >= 0
+            drag[field] = np.abs(self.toNumber(field, value))
+
+        # make sure "g" < 0, whether or not it was passed
+        basic['g'] = -np.abs(basic['g'])
+
         # make sure theta between 0 and 180
-        if ((self.basicParams['theta'] < 0.) | (self.basicParams['theta'] > 180.)):
-            print('Theta must be between 0 and 180 deg')
-            abort()
-                
+        if ((basic['theta'] < 0.) | (basic['theta'] > 180.)):
+            raise ValueError('Theta must be between 0 and 180 deg')
+        self.basicParams = basic
+        self.dragParams = drag
+
         # define initial state
         vels = self.getInitialVelocities()
         #self.state = [self.origin[0], vels[0], self.origin[1], vels[1]]
         self.state = [self.basicParams['x0'], vels[0], self.basicParams['y0'], vels[1]]
 
         # set initial conditions
+        self.resetDerived()
         self.t = np.array([0])
         #self.pos = np.array([self.origin[0], self.origin[1]])
         self.pos = np.array([self.basicParams['x0'], self.basicParams['y0']])
         self.v = np.array([vels[0], vels[1]])
 
+
+    @staticmethod
+    def toNumber(field, value):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError("Must enter a number for field: %s" % field.upper())
+        if not np.isfinite(value):
+            raise ValueError("Must enter a finite number for field: %s" % field.upper())
+        return value
+
         
     def getInitialVelocities(self):
         """compute the current x,y velocities of the projectile"""
@@ -89,29 +155,330 @@ class ProjectileMotion:
         return np.array([dxdt, dvxdt, dydt, dvydt])
         
         
-    def computeDerivedQuantities(self):
-        # compute momentum
-        self.p = self.basicParams['mass'] * self.v
+    def getForceModel(self, usingDragForce=1):
+        """force model (see PMForces) built from the current parameters"""
+        return PMForces.makeForceModel(self.dragModel, self.basicParams, self.dragParams, \
+                                       self.modelParams, usingDragForce)
+
+
+    def __getattr__(self, name):
+        # only called for missing attributes: fill in a derived quantity
+        if name in ProjectileMotion.DERIVED:
+            value = PMStats.timed(self.stats, 'derived ' + name, self.computeDerived, name)
+            setattr(self, name, value)
+            if (self.stats is not None):
+                self.stats.recordArrays(self, (name,))
+            return value
+        raise AttributeError(name)
+
+
+    def computeDerived(self, name):
+        """one of p, K, U or F from the stored pos/v"""
+        mass = self.basicParams['mass']
+        if (name == 'p'):
+            value = mass * self.v
+        elif (name == 'K'):
+            value = 0.5 * mass * np.sum(np.square(self.v), axis=1)
+        elif (name == 'U'):
+            value = mass * np.abs(self.basicParams['g']) * self.pos[:,1]
+        else:
+            # the force law at each sample, rather than differenced momentum
+            if (self.forceModel is None):
+                self.forceModel = self.getForceModel()
+            states = np.column_stack([self.pos[:,0], self.v[:,0], self.pos[:,1], self.v[:,1]])
+            value = self.forceModel.force(states)
+        return value.astype(self.storageType, copy=False)
+
+
+    def resetDerived(self):
+        """forget derived quantities of a previous run"""
+        for name in self.DERIVED:
+            self.__dict__.pop(name, None)
 
-        # compute kinetic energy
-        self.K = 0.5 * self.basicParams['mass'] * np.sum(np.square(self.v), axis=1)
 
-        # compute potential energy
-        self.U = self.basicParams['mass'] * np.abs(self.basicParams['g']) * self.pos[:,1]
+    def computeDerivedQuantities(self):
+        """compute every derived quantity now rather than on first use"""
+        for name in self.DERIVED:
+            getattr(self, name)
+
+
+    def chooseSolver(self, usingDragForce, solver=None, backend=None):
+        """(solver, backend) for a run, filling in the defaults (the closed
+        form without drag and odeint with it, or rk45 with the jit backend)"""
+        if (backend is None):
+            backend = 'numpy'
+        if (backend not in self.BACKENDS):
+            raise ValueError("Unknown backend: %s" % backend)
+        if (solver is None):
+            solver = ('rk45' if backend == 'jit' else 'odeint') if usingDragForce else 'analytic'
+        if (solver not in self.SOLVERS):
+            raise ValueError("Unknown solver: %s" % solver)
+
+        if (usingDragForce == 0):
+            return solver, backend
+        if (solver == 'analytic'):
+            raise ValueError("The analytic solver has no air resistance")
+        if (solver == 'verlet'):
+            # symplectic only for velocity-independent forces
+            raise ValueError("The verlet solver is for drag-free runs only")
+        return solver, backend
+
+
+    def evolve(self, usingDragForce, solver=None, backend=None):
+        """Integrate until ground impact using the chosen solver mode
+        (see chooseSolver for the defaults)"""
+        solver, backend = self.chooseSolver(usingDragForce, solver, backend)
+        if (usingDragForce == 0):
+            self.dragParams['diameter'] = 0
+        self.forceModel = self.getForceModel(usingDragForce)
+        self.stats = stats = PMStats.PMStats() if self.instrument else None
+
+        key = None
+        if (self.cache is not None):
+            key = self.cacheKey(usingDragForce, solver, backend)
+            cached = PMStats.timed(stats, 'cache lookup', self.cache.get, key)
+            if (cached is not None):
+                results = self.restoreResults(cached)
+                if (stats is not None):
+                    stats.count('cache hits')
+                    stats.recordArrays(self, ('t', 'pos', 'v'))
+                return PMStats.PMResults(results, stats)
+
+        if (solver == 'analytic'):
+            results = PMStats.timed(stats, 'analytic', self.evolveAnalytic)
+        elif (solver == 'events'):
+            results = self.integrateToImpact()
+        else:
+            results = self.integrateOverWindow(solver, backend)
+
+        # derived quantities follow lazily from the new pos/v
+        self.resetDerived()
+        self.pos = self.pos.astype(self.storageType, copy=False)
+        self.v = self.v.astype(self.storageType, copy=False)
+        if (self.outputTolerance is not None):
+            PMStats.timed(stats, 'decimate', self.decimate, self.outputTolerance)
+        else:
+            self.compressionRatio = 1.0
+
+        if (key is not None):
+            PMStats.timed(stats, 'cache store', self.cache.put, key, self.saveResults(results))
+
+        if (stats is not None):
+            stats.recordArrays(self, ('t', 'pos', 'v'))
+        return PMStats.PMResults(results, stats)
+
+
+    def decimate(self, tol):
+        """keep only the samples needed to reproduce the trajectory within
+        tol (m), leaving t non-uniform"""
+        keep = PMDecimate.keepIndices(self.t, self.pos, tol)
+        self.compressionRatio = len(self.t) / float(len(keep))
+        self.resetDerived()
+        self.t = self.t[keep]
+        self.pos = self.pos[keep]
+        self.v = self.v[keep]
+        return self.compressionRatio
+
+
+    def evolveStream(self, usingDragForce, chunkSize=None, solver=None, backend=None):
+        """Generator yielding dicts of t, pos, v, p, K, U and F chunks while
+        the trajectory is being integrated by one of STREAM_SOLVERS. Once
+        exhausted, the object holds the full arrays as after evolve
+        (thinned to outputTolerance) and streamResults holds
+        (maxTime, maxRange, maxHeight)."""
+        if (chunkSize is None):
+            chunkSize = self.STREAM_CHUNK
+        solver, backend = self.chooseSolver(usingDragForce, solver, backend)
+        if (solver not in self.STREAM_SOLVERS):
+            raise ValueError("The %s solver cannot stream" % solver)
+        if (usingDragForce == 0):
+            self.dragParams['diameter'] = 0
+        self.forceModel = self.getForceModel(usingDragForce)
+        self.stats = PMStats.PMStats() if self.instrument else None
+        self.resetDerived()
+
+        key = None
+        if (self.cache is not None):
+            key = self.cacheKey(usingDragForce, ('stream', solver), backend)
+            cached = self.cache.get(key)
+            if (cached is not None):
+                # replay the cached full-rate run in chunks, then thin it as a live run would
+                self.streamResults = self.restoreResults(cached)
+                # on the live run's boundaries: the first chunk also carries t=0
+                for start in range(0, max(len(self.t) - 1, 1), chunkSize):
+                    rows = slice(start + (start > 0), start + chunkSize + 1)
+                    yield dict((name, getattr(self, name)[rows]) for name in self.STREAM_FIELDS)
+                if (self.outputTolerance is not None):
+                    PMStats.timed(self.stats, 'decimate', self.decimate, self.outputTolerance)
+                return
+
+        model = self.forceModel
+        state = np.array(self.state, dtype=float)
+        # launched level or downward means the apex is the launch point
+        maxHeight = state[2] if state[3] <= 0. else None
+        maxSteps = int(np.ceil(self.MAX_TIME_FACTOR * (np.nan_to_num(self.totalTime()) + 1.0) / self.dt))
+
+        chunks = []
+        k0 = 0
+        while True:
+            if (k0 >= maxSteps):
+                raise RuntimeError("Projectile did not reach the ground within %.1f (s)" % (k0*self.dt))
+            t = np.arange(k0, k0 + chunkSize + 1) * self.dt
+            if (solver == 'analytic'):
+                x0, v0x, y0, v0y = self.state
+                g = self.basicParams['g']
+                pos = PMAnalytic.positions(t, x0, y0, v0x, v0y, g)
+                v = PMAnalytic.velocities(t, v0x, v0y, g)
+                states = np.column_stack([pos[:,0], v[:,0], pos[:,1], v[:,1]])
+            elif (solver == 'odeint'):
+                states = self.odeint(state, t)
+            else:
+                states = self.integrateGrid(state, t, solver, backend)
+
+            # apex lies where vy first changes sign
+            falling = np.nonzero(states[1:,3] <= 0.)[0]
+            if (maxHeight is None and len(falling) > 0):
+                j = falling[0] + 1
+                frac = states[j-1,3] / (states[j-1,3] - states[j,3])
+                maxHeight = states[j-1,2] + frac*(states[j,2] - states[j-1,2])
+
+            # a projectile has landed once it is below ground on the way down
+            landed = np.nonzero((states[1:,2] < 0.) & (states[1:,3] < 0.))[0]
+            stop = len(t) if len(landed) == 0 else landed[0] + 1
+
+            # windows overlap by one sample, which the previous chunk emitted
+            first = 0 if k0 == 0 else 1
+            chunk = PMStats.timed(self.stats, 'derived', self.chunkQuantities, t[first:stop], states[first:stop])
+            chunks.append(chunk)
+            yield chunk
+
+            if (len(landed) > 0):
+                j = landed[0] + 1
+                frac = states[j-1,2] / (states[j-1,2] - states[j,2])
+                maxTime = t[j-1] + frac*self.dt
+                maxRange = states[j-1,0] + frac*(states[j,0] - states[j-1,0])
+                break
+            state = states[-1]
+            k0 += chunkSize
+
+        for name in self.STREAM_FIELDS:
+            setattr(self, name, np.concatenate([chunk[name] for chunk in chunks]))
+        if (self.stats is not None):
+            self.stats.recordArrays(self, self.STREAM_FIELDS)
+        self.streamResults = (maxTime, maxRange, maxHeight)
+        self.compressionRatio = 1.0
+        # cache the chunks at the full rate they went out, so a replay matches
+        if (key is not None):
+            self.cache.put(key, self.saveResults(self.streamResults))
+        # the stored arrays are thinned as in evolve
+        if (self.outputTolerance is not None):
+            PMStats.timed(self.stats, 'decimate', self.decimate, self.outputTolerance)
+
+
+    def chunkQuantities(self, t, states):
+        """t, pos, v and the derived quantities for a block of states"""
+        mass = self.basicParams['mass']
+        pos = states[:,[0,2]].astype(self.storageType)
+        v = states[:,[1,3]].astype(self.storageType)
+        chunk = {'t': t, 'pos': pos, 'v': v, 'p': mass * v, \
+                 'K': 0.5 * mass * np.sum(np.square(v), axis=1), \
+                 'U': mass * np.abs(self.basicParams['g']) * pos[:,1], \
+                 'F': self.forceModel.force(states)}
+        for name in self.DERIVED:
+            chunk[name] = chunk[name].astype(self.storageType, copy=False)
+        return chunk
+
+
+    def cacheKey(self, usingDragForce, solver, backend='numpy'):
+        return PMCache.makeKey('ProjectileMotion', self.basicParams, self.dragParams, self.dt, \
+                               usingDragForce, solver, backend, self.dragModel, self.modelParams, self.state, \
+                               np.dtype(self.storageType).str, self.outputTolerance)
+
+
+    def saveResults(self, results):
+        """the trajectory and whichever derived quantities exist, for the result cache"""
+        saved = {'results': results, 't': self.t, 'pos': self.pos, 'v': self.v, \
+                 'compressionRatio': self.compressionRatio}
+        for name in self.DERIVED:
+            if name in self.__dict__:
+                saved[name] = self.__dict__[name]
+        return saved
+
+
+    def restoreResults(self, saved):
+        """undo saveResults, returning what evolve returned"""
+        self.resetDerived()
+        for name in ('t', 'pos', 'v', 'compressionRatio') + self.DERIVED:
+            if name in saved:
+                setattr(self, name, saved[name])
+        return saved['results']
+
+
+    def evolveAnalytic(self):
+        """Drag-free motion straight from the closed-form solution"""
+        x0, v0x, y0, v0y = self.state
+        g = self.basicParams['g']
+        self.t, self.pos, self.v, maxTime, maxRange, maxHeight = \
+            PMAnalytic.evolve(x0, y0, v0x, v0y, g, self.dt)
+        if (np.isnan(maxTime)):
+            raise RuntimeError("Projectile never reaches the ground")
 
-        # compute force
-        self.F = np.diff(self.p, axis=0) / self.dt
-        self.F = np.insert(self.F, 0, self.F[0,:], axis=0)
+        return maxTime, maxRange, maxHeight
 
 
-    def evolve(self, usingDragForce):
+    def odeint(self, state, t):
+        """odeint driven by the force model, counting evaluations when instrumented"""
+        # scipy is imported on first use so that the GUI opens quickly
+        import scipy.integrate as integrate
+        model = self.forceModel
+        if (self.stats is None):
+            return integrate.odeint(model.derivs, state, t, Dfun=model.jacobian)
+        start = time.time()
+        states, info = integrate.odeint(model.derivs, state, t, Dfun=model.jacobian, full_output=True)
+        self.stats.add('integrate', time.time() - start)
+        self.stats.recordOdeint(info)
+        return states
+
+
+    def integrateGrid(self, state, t, solver, backend='numpy'):
+        """PMIntegrators' solver (or its PMJit kernel) over the grid t,
+        counting evaluations when instrumented"""
+        model = self.forceModel
+        options = {'rtol': self.RTOL, 'atol': self.ATOL} if solver == 'rk45' else {}
+        start = time.time()
+        compiled = None
+        if (backend == 'jit'):
+            # Numba (if any) is imported on first use so that the GUI opens quickly
+            import PMJit
+            compiled = PMJit.integrate(solver, model, state, t, self.RTOL, self.ATOL)
+        if (compiled is not None):
+            states, info = compiled
+        else:
+            # the NumPy path also serves as the jit fallback
+            func = lambda tt, states, rows: model.derivs(states, tt)
+            states, info = PMIntegrators.GRID_SOLVERS[solver](func, np.atleast_2d(state), t, \
+                                                              full_output=True, **options)
+            states = states[:,0,:]
+        if (self.stats is not None):
+            self.stats.add('integrate', time.time() - start)
+            self.stats.recordOdeint(info)
+            if (compiled is not None):
+                self.stats.count('jit kernels')
+            elif (backend == 'jit'):
+                self.stats.count('jit fallbacks')
+        return states
+
+
+    def integrateOverWindow(self, solver='odeint', backend='numpy'):
+        """Integrate over the drag-free time window, then interpolate
+        the impact and apex from the sampled trajectory"""
         t = self.getTimeVec()
 
-        if (usingDragForce == 0):
-            self.dragParams['diameter'] = 0
-
         # integrate to get solutions
-        states = integrate.odeint(self.derivs, self.state, t)
+        if (solver == 'odeint'):
+            states = self.odeint(self.state, t)
+        else:
+            states = self.integrateGrid(self.state, t, solver, backend)
         states = np.array(states)
             
         # break out positions/vels from the state vector
@@ -119,30 +486,69 @@ class ProjectileMotion:
         self.v = states[:,[1,3]]
         self.t = t
 
-        maxRange, maxTime = self.maxRange()
-
-        print maxRange,maxTime
-        
-        maxHeight = self.maxHeight()
-
-        print maxHeight
+        maxRange, maxTime = PMStats.timed(self.stats, 'maxRange', self.maxRange)
+        maxHeight = PMStats.timed(self.stats, 'maxHeight', self.maxHeight)
 
         self.t = np.arange(0,maxTime,self.dt)
         self.pos = self.pos[0:len(self.t),:]
         self.v = self.v[0:len(self.t),:]
 
-        # compute derived quantities
-        self.computeDerivedQuantities()
+        return maxTime, maxRange, maxHeight
+
+
+    def integrateToImpact(self):
+        """Integrate only until the ground-impact event, taking the
+        impact and apex from the solver's dense interpolant"""
+        import scipy.integrate as integrate
+
+        def hitGround(t, state):
+            return state[2]
+        hitGround.terminal = True
+        hitGround.direction = -1
+
+        def reachApex(t, state):
+            return state[3]
+        reachApex.direction = -1
+
+        # the run stops at impact, so a loose upper bound costs nothing
+        vacuumTime = np.nan_to_num(self.totalTime())
+        tMax = self.MAX_TIME_FACTOR * (vacuumTime + 1.0)
+        model = self.forceModel
+        sol = PMStats.timed(self.stats, 'integrate', integrate.solve_ivp, \
+                            lambda t, state: model.derivs(state, t), (0, tMax), self.state, \
+                            method='LSODA', events=(hitGround, reachApex), dense_output=True, \
+                            jac=lambda t, state: model.jacobian(state, t), \
+                            rtol=self.RTOL, atol=self.ATOL)
+        if (self.stats is not None):
+            self.stats.count('rhs evaluations', sol.nfev)
+            self.stats.count('jacobian evaluations', sol.njev)
+            self.stats.count('solver steps', len(sol.t) - 1)
+        if (sol.status != 1):
+            raise RuntimeError("Projectile did not reach the ground within %.1f (s)" % tMax)
+
+        maxTime = sol.t_events[0][0]
+        maxRange = sol.sol(maxTime)[0]
+        if (len(sol.t_events[1]) > 0):
+            maxHeight = sol.sol(sol.t_events[1][0])[2]
+        else:
+            # launched level or downward, so the apex is the launch point
+            maxHeight = self.state[2]
+
+        # sample the dense output on the usual uniform grid
+        self.t = np.arange(0,maxTime,self.dt)
+        states = PMStats.timed(self.stats, 'sample', sol.sol, self.t)
+        self.pos = states[[0,2],:].T
+        self.v = states[[1,3],:].T
 
         return maxTime, maxRange, maxHeight
 
-        
 
     def maxHeight(self):
         """Get max height of projectile"""
 
         """Want to ensure particle goes through its apex  
         before interpolating"""
+        from scipy import interpolate
         maxIdx = np.argmax(self.pos[:,1])
         if (maxIdx == 0):
             times = self.t[0:]
@@ -169,6 +575,7 @@ class ProjectileMotion:
 
         """Want to ensure particle goes through its apex  
         before interpolating"""
+        from scipy import interpolate
         maxIdx = np.argmax(self.pos[:,1])
         if (maxIdx == 0):
             times = self.t[0:]
@@ -206,15 +613,12 @@ class ProjectileMotion:
       
     
     def totalTime(self):
-	# compute the ideal case with no air resistance
-	# since this will serve as upper bound
+        # compute the ideal case with no air resistance
+        # since this will serve as upper bound
         vels = self.getInitialVelocities()
-	v0y = vels[1]
-	y0 = self.basicParams['y0']
-	g = np.abs(self.basicParams['g'])
-	totalTime = (v0y / g) * ( 1.0 + np.sqrt( 1.0 + y0*g / (v0y*v0y) ) )
-        return totalTime
+        return float(PMAnalytic.flightTime(vels[1], self.basicParams['y0'], self.basicParams['g']))
 
 
     def clear(self):
+        self.resetDerived()
         self.__init__()
@@ -1,10 +1,25 @@
 import Tkinter as tk
+import tkMessageBox
+import ttk
+import Queue
+import threading
 import ProjectileMotion as pm
-import matplotlib.pyplot as plt
-from PMPlots import *
+import PMStats
+
+
+def warmImports():
+    # scipy and matplotlib take a while to import; do it while the user types
+    import scipy.integrate
+    import scipy.interpolate
+    import matplotlib.pyplot
+    import PMPlots
+
 
 class ProjectileMotionGUI:
 
+    # how often (ms) the Tk loop checks the worker's result queue
+    POLL_INTERVAL = 50
+
     PLOT_TYPES = ['Y-position vs. X-position', 'X-Position vs. Time', \
                     'Y-Position vs. Time', 'X-Force vs. Time', 'Y-Force vs. Time', \
                     'X-Momentum vs. Time', 'Y-Momentum vs. Time', 'Kinetic Energy vs. Time', \
@@ -42,21 +57,59 @@ class ProjectileMotionGUI:
         # Populate drag/air-resistance fields with a "disabled" default
         self.dragParamEntries = self.loadFields(self.pm.dragParams, self.pm.dragParamsUnits, 'disabled')
 
+        label = tk.Label(text="Solver", fg="blue", width=15, anchor='w')
+        label.pack(side=tk.TOP)
+        label.config(font=("Arial", 18))
+
+        # 'default' leaves the choice to ProjectileMotion.chooseSolver
+        self.solverVar = self.loadChoice('solver', ['default'] + list(self.pm.STREAM_SOLVERS))
+        self.backendVar = self.loadChoice('backend', list(self.pm.BACKENDS))
+
+        # geometric tolerance for thinning the stored output; blank keeps every sample
+        self.toleranceEntry = self.loadFields({'output tol.': ''}, {'output tol.': '(m)'})[0][1]
+
         label = tk.Label(text="Generate Plots", fg="blue", width=15, anchor='w')
         label.pack(side=tk.TOP)
         label.config(font=("Arial", 18))
         
         # Add plot type check buttons
         self.plotChoices()
+
+        # optional timing/counter summary after each run
+        self.statsVar = tk.IntVar()
+        cb = tk.Checkbutton(text="Show run statistics", variable=self.statsVar, justify=tk.LEFT)
+        cb.pack(side=tk.TOP, anchor=tk.W)
         
+        # progress of the solve running on the worker thread
+        self.progress = ttk.Progressbar(master, mode='determinate', maximum=1.0)
+        self.progress.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
+        self.status = tk.Label(master, text="", anchor='w')
+        self.status.pack(side=tk.TOP, fill=tk.X, padx=5)
+
         # run simulation button (the command should load final choices and then run sim)
-        rb = tk.Button(master, text='Run Simulation', command=self.runSimulation)
-        rb.pack(side=tk.LEFT, padx=5, pady=5)
+        self.runButton = tk.Button(master, text='Run Simulation', command=self.runSimulation)
+        self.runButton.pack(side=tk.LEFT, padx=5, pady=5)
+
+        self.cancelButton = tk.Button(master, text='Cancel', command=self.cancelSimulation, state='disabled')
+        self.cancelButton.pack(side=tk.LEFT, padx=5, pady=5)
+
+        eb = tk.Button(master, text='Live Explorer', command=self.openExplorer)
+        eb.pack(side=tk.LEFT, padx=5, pady=5)
 
         # quit buttons
         qb = tk.Button(master, text='Quit Simulation', command=master.quit)
         qb.pack(side=tk.RIGHT, padx=5, pady=5)
 
+        self.queue = Queue.Queue()
+        self.cancel = threading.Event()
+        self.worker = None
+        # figure animating the current run, and the run's results once done
+        self.plots = None
+        self.results = None
+        warmer = threading.Thread(target=warmImports)
+        warmer.daemon = True
+        warmer.start()
+
 
     def loadFields(self, fields, unitFields, currState='normal'):
         #frame.bind()
@@ -87,6 +140,19 @@ class ProjectileMotionGUI:
         return entries
 
             
+    def loadChoice(self, name, choices):
+        frame = tk.Frame(self.master)
+        frame.pack(side=tk.TOP, fill=tk.X, padx=5, pady=5)
+        label = tk.Label(frame, width=15, text=name, anchor='w')
+        label.pack(side=tk.LEFT)
+
+        var = tk.StringVar()
+        var.set(choices[0])
+        menu = tk.OptionMenu(frame, var, *choices)
+        menu.pack(side=tk.LEFT, expand=tk.YES, fill=tk.X)
+        return var
+
+
     def revealOptions(self):
         for ent in self.dragParamEntries:
             if (self.var.get() == 0):
@@ -109,34 +175,181 @@ class ProjectileMotionGUI:
     def runSimulation(self):
         # This method will take last recorded values
         # and check box parameters and pass them
-        # to the projectile motion object in order
-        # for it to do computations. Then it will make plots.
-        # Essentially, it is the workhorse method
+        # to the projectile motion object. The integration
+        # runs on a worker thread; pollWorker picks up the
+        # results and makes the plots.
 
-        # append drag force fields to normal ones
-        #allEntries = self.basicParamEntries + self.dragParamEntries
+        if (self.worker is not None or self.plots is not None):
+            return
 
         # read in and set user values
-        self.pm.setValues(self.basicParamEntries, 'basic')
-        self.pm.setValues(self.dragParamEntries, 'drag')
+        try:
+            self.pm.setValues(self.basicParamEntries, 'basic')
+            self.pm.setValues(self.dragParamEntries, 'drag')
+            tolerance = self.toleranceEntry.get().strip()
+            self.pm.outputTolerance = float(tolerance) if tolerance else None
+            solver = self.solverVar.get()
+            solver = None if solver == 'default' else solver
+            backend = self.backendVar.get()
+            self.pm.chooseSolver(self.var.get(), solver, backend)
+        except ValueError as err:
+            tkMessageBox.showerror("Invalid parameter", str(err))
+            return
+
+        # read the check boxes now; Tk variables belong to the main thread
+        self.pm.instrument = self.statsVar.get() == 1
+        self.plot_types = [self.PLOT_NAME_SHORTCUTS[kk] for kk in range(len(self.checkVarList)) \
+                           if self.checkVarList[kk].get() == 1]
+
+        self.cancel.clear()
+        self.results = None
+        self.progress['value'] = 0.
+        self.status.config(text="Integrating...")
+        self.runButton.config(state='disabled')
+        self.cancelButton.config(state='normal')
+        # a fresh queue per run, so a closing animation never reads the next run's chunks
+        chunks = Queue.Queue()
+        self.worker = threading.Thread(target=self.solve, args=(self.var.get(), solver, backend, chunks))
+        self.worker.daemon = True
+        self.worker.start()
+        if (len(self.plot_types) > 0):
+            self.startPlots(chunks)
+        self.master.after(self.POLL_INTERVAL, self.pollWorker)
+
 
-        # ask if we are using drag force
-        maxTime, maxRange, maxHeight = self.pm.evolve(self.var.get())
+    def solve(self, usingDragForce, solver, backend, chunks):
+        # runs on the worker thread: never touch Tk here, only the queues
+        try:
+            # integrate chunk by chunk so that Cancel takes effect quickly and
+            # the plots can start with the first chunk; the stored output is
+            # thinned once the stream is exhausted
+            expected = self.pm.totalTime()
+            for chunk in self.pm.evolveStream(usingDragForce, solver=solver, backend=backend):
+                if (self.cancel.is_set()):
+                    self.queue.put(('cancelled', None))
+                    return
+                chunks.put(chunk)
+                self.queue.put(('progress', min(1., chunk['t'][-1] / expected)))
+            self.queue.put(('done', PMStats.PMResults(self.pm.streamResults, self.pm.stats)))
+        except Exception as err:
+            self.queue.put(('error', str(err)))
+        finally:
+            # end of the stream for the plots
+            chunks.put(None)
+
+
+    def streamChunks(self, chunks):
+        """the worker's chunks, for PMMultiPlots.runStream; None while the
+        next one is still being integrated"""
+        while True:
+            try:
+                chunk = chunks.get_nowait()
+            except Queue.Empty:
+                yield None
+                continue
+            if (chunk is None):
+                return
+            yield chunk
+
+
+    def startPlots(self, chunks):
+        # matplotlib was imported in the background (this waits if it is still loading)
+        import matplotlib.pyplot as plt
+        from PMPlots import PMMultiPlots
+
+        # one figure with a panel per plot type, driven by a single timer
+        # that animates the chunks as they arrive
+        self.plots = PMMultiPlots(self.pm, self.plot_types).runStream(self.streamChunks(chunks))
+        self.plots.fig.canvas.mpl_connect('close_event', self.plotsClosed)
+        # the Tk main loop already running drives the figure
+        plt.show(block=False)
+
+
+    def plotsClosed(self, event):
+        # None once closePlots has already dealt with the figure
+        if (self.plots is None):
+            return
+        self.plots = None
+        if (self.worker is None):
+            self.endRun()
+
+
+    def closePlots(self):
+        plots, self.plots = self.plots, None
+        if (plots is not None):
+            import matplotlib.pyplot as plt
+            plt.close(plots.fig)
+
+
+    def cancelSimulation(self):
+        self.cancel.set()
+        self.status.config(text="Cancelling...")
+
+
+    def pollWorker(self):
+        try:
+            while True:
+                kind, value = self.queue.get_nowait()
+                if (kind == 'progress'):
+                    self.progress['value'] = value
+                    continue
+                self.finishSimulation(kind, value)
+                return
+        except Queue.Empty:
+            self.master.after(self.POLL_INTERVAL, self.pollWorker)
+
+
+    def finishSimulation(self, kind, results):
+        self.worker = None
+        self.cancelButton.config(state='disabled')
+        if (kind == 'cancelled' or kind == 'error'):
+            self.status.config(text="Cancelled" if kind == 'cancelled' else "")
+            self.progress['value'] = 0.
+            if (kind == 'error'):
+                tkMessageBox.showerror("Simulation failed", results)
+            self.closePlots()
+            self.endRun()
+            return
+
+        self.progress['value'] = 1.
+        maxTime, maxRange, maxHeight = results
+        self.status.config(text="Time %.3f (s), range %.3f (m), height %.3f (m)" % (maxTime, maxRange, maxHeight))
         print("Maximum Time = %.3f (s)" % maxTime)
         print("Maximum Range = %.3f (m)" % maxRange)
         print("Maximum Height = %.3f (m)" % maxHeight)
+        if (self.pm.outputTolerance is not None):
+            print("Output Samples = %d (%.1fx compression)" % (len(self.pm.t), self.pm.compressionRatio))
 
-        ani_list = []
-        for kk in np.arange(0, len(self.checkVarList)):
-            if (self.checkVarList[kk].get() == 1):
-                my_plots = PMPlots(self.pm, self.PLOT_NAME_SHORTCUTS[kk])
-                ani_list.append(my_plots.runSimulation())
+        # the plots read the run's parameters until they are closed
+        self.results = results
+        if (self.plots is None):
+            self.endRun()
 
-        # show all relevant plots and then clear params when finished
-        plt.show()
+
+    def endRun(self):
+        self.runButton.config(state='normal')
+        if (self.results is not None and self.results.stats is not None):
+            self.showStats(self.results.stats)
+        self.results = None
         self.pm.clear()
 
 
+    def showStats(self, stats):
+        # rendering time is included, since the plots have closed by now
+        window = tk.Toplevel(self.master)
+        window.title("Run Statistics")
+        text = tk.Text(window, font=("Courier", 12), width=60, height=30)
+        text.insert(tk.END, stats.summary())
+        text.config(state='disabled')
+        text.pack(side=tk.TOP, fill=tk.BOTH, expand=True)
+
+
+    def openExplorer(self):
+        # imported on demand, like the plots, so startup stays fast
+        from PMExplorer import PMExplorer
+        PMExplorer(tk.Toplevel(self.master))
+
+
         
 ### MAIN EXECUTABLE ###
 if __name__ == "__main__":